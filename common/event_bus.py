@@ -18,29 +18,199 @@
 A simple internal pub/sub event bus with topics and filter-based registration.
 """
 import re
+from collections import deque
 
 import structlog
+from twisted.internet import reactor
 
 
 log = structlog.get_logger()
 
+# what to do with a message to deliver asynchronously when the queue of the
+# subscription is full
+DROP_OLDEST = 'drop-oldest'  # drop the oldest message queued
+DROP_NEWEST = 'drop-newest'  # drop the message
+BLOCK = 'block'  # the publisher delivers the oldest message queued itself
+
 
 class _Subscription(object):
 
-    __slots__ = ('bus', 'predicate', 'callback', 'topic')
-    def __init__(self, bus, predicate, callback, topic=None):
+    __slots__ = ('bus', 'predicate', 'callback', 'topic', 'seq', 'delivery')
+    def __init__(self, bus, predicate, callback, topic=None, seq=0):
         self.bus = bus
         self.predicate = predicate
         self.callback = callback
         self.topic = topic
+        self.seq = seq  # tells the order of subscriptions
+        self.delivery = None  # _QueuedDelivery, unless delivered at once
 
 
-class EventBus(object):
+def _deliver(subscription, topic, msg):
+    try:
+        subscription.callback(topic, msg)
+    except Exception, e:
+        log.warning('callback-failed', e=e, topic=topic)
+
+
+class _QueuedDelivery(object):
+    """
+    Asynchronous delivery of the messages of a subscription: they are
+    queued, up to queue_size of them, and delivered by the reactor,
+    batch_size of them at a time. When the queue is full, the policy
+    (DROP_OLDEST, DROP_NEWEST or BLOCK) tells what to do.
+    """
+
+    __slots__ = ('subscription', 'queue_size', 'policy', 'batch_size',
+                 'clock', 'queue', 'call', 'delivered', 'dropped', 'max_lag')
+
+    def __init__(self, subscription, queue_size, policy, batch_size, clock):
+        if policy not in (DROP_OLDEST, DROP_NEWEST, BLOCK):
+            raise ValueError('unknown queue policy: {}'.format(policy))
+        self.subscription = subscription
+        self.queue_size = queue_size
+        self.policy = policy
+        self.batch_size = batch_size
+        self.clock = clock
+        self.queue = deque()  # (topic, msg) tuples
+        self.call = None  # delayed call of drain()
+        self.delivered = 0
+        self.dropped = 0
+        self.max_lag = 0
+
+    def put(self, topic, msg):
+        queue = self.queue
+        if len(queue) >= self.queue_size:
+            if self.policy == DROP_NEWEST:
+                self.dropped += 1
+                return
+            elif self.policy == DROP_OLDEST:
+                queue.popleft()
+                self.dropped += 1
+            else:
+                self.delivered += 1
+                _deliver(self.subscription, *queue.popleft())
+        queue.append((topic, msg))
+        if len(queue) > self.max_lag:
+            self.max_lag = len(queue)
+        if self.call is None:
+            self.call = self.clock.callLater(0, self.drain)
+
+    def drain(self):
+        self.call = None
+        queue = self.queue
+        n = 0
+        # a callback unsubscribing empties the queue
+        while queue and n < self.batch_size:
+            n += 1
+            self.delivered += 1
+            _deliver(self.subscription, *queue.popleft())
+        if queue and self.call is None:
+            self.call = self.clock.callLater(0, self.drain)
+
+    def cancel(self):
+        if self.call is not None:
+            if self.call.active():
+                self.call.cancel()
+            self.call = None
+        self.queue.clear()
+
+    def metrics(self):
+        return dict(
+            lag=len(self.queue),
+            max_lag=self.max_lag,
+            delivered=self.delivered,
+            dropped=self.dropped,
+            policy=self.policy
+        )
+
+
+def _literal_prefix(regex):
+    """
+    Return the literal prefix every topic matched by regex (at its start)
+    begins with, possibly empty.
+    """
+    pattern = getattr(regex, 'pattern', None)
+    # with VERBOSE, white space and comments are not literal
+    if not isinstance(pattern, basestring) or \
+            getattr(regex, 'flags', 0) & (re.IGNORECASE | re.VERBOSE) or \
+            '|' in pattern:
+        return ''
+    prefix = []
+    for c in pattern:
+        if c in '*?{':
+            if prefix:
+                prefix.pop()  # the char before is optional
+            break
+        if c in '.^$+[]\\()':
+            break
+        prefix.append(c)
+    return ''.join(prefix)
+
+
+class _TopicTrie(object):
+    """
+    Regexp based topic subscriptions, by the literal prefix of their regexp.
+    A topic can only be matched by those whose prefix is one of the topic.
+    """
+
+    __slots__ = ('children', 'subscriptions')
 
     def __init__(self):
+        self.children = {}  # char -> _TopicTrie
+        self.subscriptions = []
+
+    def add(self, subscription):
+        node = self
+        for c in _literal_prefix(subscription.topic):
+            child = node.children.get(c)
+            if child is None:
+                child = node.children[c] = _TopicTrie()
+            node = child
+        node.subscriptions.append(subscription)
+
+    def remove(self, subscription):
+        prefix = _literal_prefix(subscription.topic)
+        path = [self]
+        for c in prefix:
+            path.append(path[-1].children[c])
+        path[-1].subscriptions.remove(subscription)
+        # prune the nodes left empty
+        for i in xrange(len(prefix), 0, -1):
+            node = path[i]
+            if node.subscriptions or node.children:
+                break
+            del path[i - 1].children[prefix[i - 1]]
+
+    def matching(self, topic):
+        """Return the subscriptions matching topic, in subscription order"""
+        candidates = list(self.subscriptions)
+        node = self
+        for c in topic:
+            node = node.children.get(c)
+            if node is None:
+                break
+            candidates.extend(node.subscriptions)
+        candidates.sort(key=lambda s: s.seq)
+        return [s for s in candidates if s.topic.match(topic)]
+
+
+class EventBus(object):
+    """
+    The subscribers of each topic published to are looked up once, then
+    cached until the subscriptions change.
+    """
+
+    # topics to cache the subscribers of, at most, before starting over
+    max_cached_topics = 100000
+
+    def __init__(self, clock=None):
+        self.clock = clock or reactor  # runs asynchronous deliveries
         self.subscriptions = {}  # topic -> list of _Subscription objects
                                  # topic None holds regexp based topic subs.
         self.subs_topic_map = {} # to aid fast lookup when unsubscribing
+        self.regexp_subscriptions = _TopicTrie()
+        self.dispatch_cache = {}  # topic -> tuple of _Subscription objects
+        self.next_seq = 0
 
     def list_subscribers(self, topic=None):
         if topic is None:
@@ -60,18 +230,33 @@ class EventBus(object):
         else:
             raise AttributeError('topic not a string nor a compiled regex')
 
-    def subscribe(self, topic, callback, predicate=None):
+    def subscribe(self, topic, callback, predicate=None, queue_size=None,
+                  policy=DROP_OLDEST, batch_size=100):
         """
         Subscribe to given topic with predicate and register the callback
         :param topic: String topic (explicit) or regexp based topic filter.
         :param callback: Callback method with signature def func(topic, msg)
         :param predicate: Optional method/function signature def predicate(msg)
+        :param queue_size: Optional bound of the queue of messages, to have
+        them delivered asynchronously, by the reactor. By default, messages
+        are delivered at once, by publish.
+        :param policy: What to do when the queue is full, one of DROP_OLDEST,
+        DROP_NEWEST and BLOCK (the publisher delivers the oldest message)
+        :param batch_size: Messages delivered at most per reactor iteration
         :return: Subscription object which can be used to unsubscribe
         """
-        subscription = _Subscription(self, predicate, callback, topic)
+        subscription = _Subscription(
+            self, predicate, callback, topic, self.next_seq)
+        if queue_size is not None:
+            subscription.delivery = _QueuedDelivery(
+                subscription, queue_size, policy, batch_size, self.clock)
+        self.next_seq += 1
         topic_key = self._get_topic_key(topic)
         self.subscriptions.setdefault(topic_key, []).append(subscription)
         self.subs_topic_map[subscription] = topic_key
+        if topic_key is None:
+            self.regexp_subscriptions.add(subscription)
+        self.dispatch_cache.clear()
         return subscription
 
     def unsubscribe(self, subscription):
@@ -80,8 +265,43 @@ class EventBus(object):
         :param subscription: subscription object as was returned by subscribe
         :return: None
         """
-        topic_key = self.subs_topic_map[subscription]
-        self.subscriptions[topic_key].remove(subscription)
+        topic_key = self.subs_topic_map.pop(subscription)
+        subscriptions = self.subscriptions[topic_key]
+        subscriptions.remove(subscription)
+        if not subscriptions:
+            del self.subscriptions[topic_key]
+        if topic_key is None:
+            self.regexp_subscriptions.remove(subscription)
+        if subscription.delivery is not None:
+            subscription.delivery.cancel()
+        self.dispatch_cache.clear()
+
+    @staticmethod
+    def delivery_metrics(subscription):
+        """
+        Return the number of messages queued (lag), the most ever queued,
+        and the number of messages delivered and dropped of a subscription
+        with asynchronous delivery, None for other subscriptions.
+        """
+        if subscription.delivery is None:
+            return None
+        return subscription.delivery.metrics()
+
+    def _get_subscribers(self, topic):
+        """
+        Return the subscriptions with the explicit topic, then the matching
+        regexp based topic ones
+        """
+        subscribers = self.dispatch_cache.get(topic)
+        if subscribers is None:
+            subscribers = tuple(self.subscriptions.get(topic, ()))
+            if None in self.subscriptions:
+                subscribers += tuple(
+                    self.regexp_subscriptions.matching(topic))
+            if len(self.dispatch_cache) >= self.max_cached_topics:
+                self.dispatch_cache.clear()
+            self.dispatch_cache[topic] = subscribers
+        return subscribers
 
     def publish(self, topic, msg):
         """
@@ -98,16 +318,12 @@ class EventBus(object):
             except Exception, e:
                 return False  # failed predicate function treated as no match
 
-        # lookup subscribers with explicit topic subscriptions
-        subscribers = self.subscriptions.get(topic, [])
-
-        # add matching regexp topic subscribers
-        subscribers.extend(s for s in self.subscriptions.get(None, [])
-                           if s.topic.match(topic))
-
-        for candidate in subscribers:
+        for candidate in self._get_subscribers(topic):
             predicate = candidate.predicate
             if predicate is None or passes(msg, predicate):
+                if candidate.delivery is not None:
+                    candidate.delivery.put(topic, msg)
+                    continue
                 try:
                     candidate.callback(topic, msg)
                 except Exception, e:
@@ -143,6 +359,12 @@ class EventBusClient(object):
     >>> events = EventBusClient()
     >>> events.subscribe('a.topic', lambda _, msg: queue.put(msg))
 
+    Have messages delivered asynchronously, by the reactor, keeping the
+    last 1000 of them at most when the subscriber falls behind:
+    >>> events = EventBusClient()
+    >>> events.subscribe('a.topic', got_event, queue_size=1000,
+    >>>                  policy=DROP_OLDEST)
+
     """
     def __init__(self, bus=None):
         """
@@ -162,16 +384,23 @@ class EventBusClient(object):
         """
         self.bus.publish(topic, msg)
 
-    def subscribe(self, topic, callback, predicate=None):
+    def subscribe(self, topic, callback, predicate=None, queue_size=None,
+                  policy=DROP_OLDEST, batch_size=100):
         """
         Subscribe to given topic with predicate and register the callback
         :param topic: String topic (explicit) or regexp based topic filter.
         :param callback: Callback method with signature def func(topic, msg)
         :param predicate: Optional method/function with signature
         def predicate(msg)
+        :param queue_size: Optional bound of the queue of messages, to have
+        them delivered asynchronously (see EventBus.subscribe)
+        :param policy: What to do when the queue is full, one of DROP_OLDEST,
+        DROP_NEWEST and BLOCK
+        :param batch_size: Messages delivered at most per reactor iteration
         :return: Subscription object which can be used to unsubscribe
         """
-        return self.bus.subscribe(topic, callback, predicate)
+        return self.bus.subscribe(topic, callback, predicate, queue_size,
+                                  policy, batch_size)
 
     def unsubscribe(self, subscription):
         """
@@ -189,3 +418,12 @@ class EventBusClient(object):
         :return: List of subscriptions
         """
         return self.bus.list_subscribers(topic)
+
+    def delivery_metrics(self, subscription):
+        """
+        Return the lag and drop counters of a subscription with asynchronous
+        delivery, None for other subscriptions.
+        :param subscription: subscription object as was returned by subscribe
+        :return: Dict of counters, or None
+        """
+        return self.bus.delivery_metrics(subscription)
@@ -20,15 +20,17 @@ and it can manage a set of vlan interfaces on top of existing
 interfaces. Due to reliance on raw sockets, this module requires
 root access. Also, raw sockets are hard to deal with in Twisted (not
 directly supported) we need to run the receiver select loop on a dedicated
-thread.
+thread. Frames to send are queued per interface and sent by the same thread.
 """
 
 import os
 import socket
 import struct
 import uuid
+from collections import deque
+from itertools import islice
 from pcapy import BPFProgram
-from threading import Thread, Condition
+from threading import Thread, Condition, Lock
 
 import fcntl
 
@@ -44,6 +46,7 @@ from voltha.registry import IComponent
 
 if sys.platform.startswith('linux'):
     from common.frameio.third_party.oftest import afpacket, netutils
+    from common.frameio import mmsg
 elif sys.platform == 'darwin':
     from scapy.arch import pcapdnet, BIOCIMMEDIATE, dnet
 
@@ -85,16 +88,33 @@ class BpfProgramFilter(object):
     Convenience packet filter based on the well-tried Berkeley Packet Filter,
     used by many well known open source tools such as pcap and tcpdump.
     """
-    def __init__(self, program_string):
+    def __init__(self, program_string, in_kernel=False):
         """
         Create a filter using the BPF command syntax. To learn more,
         consult 'man pcap-filter'.
         :param program_string: The textual definition of the filter. Examples:
         'vlan 1000'
         'vlan 1000 and ip src host 10.10.10.10'
+        :param in_kernel: If True, the filter may also be run by the kernel
+        (Linux), to drop the frames no user of the interface wants before
+        they are queued. The kernel runs it on frames without their VLAN tag,
+        so this must only be set for filters not matching on it.
         """
+        self.program_string = program_string
+        self.in_kernel = in_kernel
         self.bpf = BPFProgram(program_string)
 
+    def kernel_program(self):
+        """
+        Return the compiled program, as list of (code, jt, jf, k) tuples, if
+        the filter may be run by the kernel, None otherwise (or if pcapy
+        cannot tell it)
+        """
+        get_bpf = getattr(self.bpf, 'get_bpf', None)  # pcapy 0.11 and later
+        if not self.in_kernel or get_bpf is None:
+            return None
+        return get_bpf()
+
     def __call__(self, frame):
         """
         Return 1 if frame passes filter.
@@ -111,22 +131,40 @@ class FrameIOPort(object):
     """
 
     RCV_SIZE_DEFAULT = 4096
+    RCV_BATCH_SIZE = 64  # frames received at most per system call
+    TX_QUEUE_SIZE = 1000  # frames queued at most for sending
+    TX_BATCH_SIZE = 64  # frames sent at most per system call
     ETH_P_ALL = 0x03
     RCV_TIMEOUT = 10000
 
-    def __init__(self, iface_name):
+    def __init__(self, iface_name, tx_queue_size=TX_QUEUE_SIZE,
+                 tx_notify=None):
         self.iface_name = iface_name
         self.proxies = []
         self.socket = self.open_socket(self.iface_name)
         log.debug('socket-opened', fn=self.fileno(), iface=iface_name)
         self.received = 0
         self.discarded = 0
+        self.tx_queue = deque()  # frames to send, appended to by the reactor
+        self.tx_queue_size = tx_queue_size
+        self.tx_lock = Lock()
+        self.tx_notify = tx_notify  # called when the queue is no more empty
+        self.sent = 0
+        self.tx_dropped = 0
+        self.tx_errors = 0
 
     def add_proxy(self, proxy):
         self.proxies.append(proxy)
+        self.update_kernel_filter()
 
     def del_proxy(self, proxy):
         self.proxies = [p for p in self.proxies if p.name != proxy.name]
+        self.update_kernel_filter()
+
+    def update_kernel_filter(self):
+        """
+        Have the kernel drop the frames no proxy wants, if it can tell them
+        """
 
     def open_socket(self, iface_name):
         raise NotImplementedError('to be implemented by derived class')
@@ -134,6 +172,11 @@ class FrameIOPort(object):
     def rcv_frame(self):
         raise NotImplementedError('to be implemented by derived class')
 
+    def rcv_frames(self):
+        """Return the frames received at once, in order"""
+        frame = self.rcv_frame()
+        return [] if frame is None else [frame]
+
     def __del__(self):
         if self.socket:
             self.socket.close()
@@ -144,7 +187,7 @@ class FrameIOPort(object):
         return self.socket.fileno()
 
     def _dispatch(self, proxy, frame):
-        log.debug('calling-publisher', proxy=proxy.name, frame=hexify(frame))
+        log.debug('calling-publisher', proxy=proxy.name, len=len(frame))
         try:
             proxy.callback(proxy, frame)
         except Exception as e:
@@ -152,10 +195,17 @@ class FrameIOPort(object):
                           explanation='Callback failed while processing frame',
                           e=e)
 
+    def _dispatch_frames(self, dispatches):
+        for proxy, frame in dispatches:
+            self._dispatch(proxy, frame)
+
     def recv(self):
-        """Called on the select thread when a packet arrives"""
+        """
+        Called on the select thread when packets arrive. The frames received
+        at once are handed to the reactor in a single call.
+        """
         try:
-            frame = self.rcv_frame()
+            frames = self.rcv_frames()
         except RuntimeError as e:
             # we observed this happens sometimes right after the socket was
             # attached to a newly created veth interface. So we log it, but
@@ -163,27 +213,82 @@ class FrameIOPort(object):
             log.warn('afpacket-recv-error', code=-1)
             return
 
-        log.debug('frame-received', iface=self.iface_name, len=len(frame),
-                  hex=hexify(frame))
-        self.received +=1
-        dispatched = False
-        for proxy in self.proxies:
-            if proxy.filter is None or proxy.filter(frame):
-                log.debug('frame-dispatched')
-                dispatched = True
-                reactor.callFromThread(self._dispatch, proxy, frame)
-
-        if not dispatched:
-            self.discarded += 1
-            log.debug('frame-discarded')
+        log.debug('frames-received', iface=self.iface_name, count=len(frames))
+        self.received += len(frames)
+        dispatches = []  # (proxy, frame) tuples
+        proxies = self.proxies
+        for frame in frames:
+            dispatched = False
+            for proxy in proxies:
+                if proxy.filter is None or proxy.filter(frame):
+                    dispatched = True
+                    dispatches.append((proxy, frame))
+            if not dispatched:
+                self.discarded += 1
+
+        if dispatches:
+            reactor.callFromThread(self._dispatch_frames, dispatches)
 
     def send(self, frame):
+        """
+        Queue frame to be sent by the select thread. Return the number of
+        bytes queued, which is 0 if the frame was dropped as the queue is
+        full.
+        """
+        with self.tx_lock:
+            if len(self.tx_queue) >= self.tx_queue_size:
+                self.tx_dropped += 1
+                log.debug('send-queue-full', iface=self.iface_name,
+                          dropped=self.tx_dropped)
+                return 0
+            notify = not self.tx_queue
+            self.tx_queue.append(frame)
         log.debug('sending', len=len(frame), iface=self.iface_name)
-        sent_bytes = self.send_frame(frame)
-        if sent_bytes != len(frame):
-            log.error('send-error', iface=self.iface_name,
-                      wanted_to_send=len(frame), actually_sent=sent_bytes)
-        return sent_bytes
+        if notify and self.tx_notify is not None:
+            self.tx_notify()
+        return len(frame)
+
+    def xmit(self):
+        """
+        Called on the select thread when frames are queued and the socket
+        can take some. Sends them in batches, till none is left or the
+        socket is full.
+        """
+        while True:
+            with self.tx_lock:
+                frames = list(islice(self.tx_queue, self.TX_BATCH_SIZE))
+            if not frames:
+                return
+            try:
+                sent = self.send_frames(frames)
+            except (RuntimeError, EnvironmentError) as e:
+                with self.tx_lock:
+                    self.tx_queue.popleft()
+                self.tx_errors += 1
+                log.error('send-error', iface=self.iface_name,
+                          wanted_to_send=len(frames[0]), e=e)
+                continue
+
+            with self.tx_lock:
+                for _ in sent:
+                    self.tx_queue.popleft()
+            for frame, sent_bytes in zip(frames, sent):
+                if sent_bytes == len(frame):
+                    self.sent += 1
+                else:
+                    self.tx_errors += 1
+                    log.error('send-error', iface=self.iface_name,
+                              wanted_to_send=len(frame),
+                              actually_sent=sent_bytes)
+            if len(sent) < len(frames):
+                return  # the socket is full
+
+    def send_frames(self, frames):
+        """
+        Send frames, in order, as many as the socket takes at once. Return
+        the number of bytes sent of each frame sent.
+        """
+        return [self.send_frame(frames[0])]
 
     def send_frame(self, frame):
         return self.socket.send(frame)
@@ -203,11 +308,30 @@ class FrameIOPort(object):
         return self
 
     def statistics(self):
-        return self.received, self.discarded
+        """
+        Return the number of frames received, received but wanted by no
+        proxy (discarded), sent, not sent as the queue was full (tx_dropped)
+        and not sent because of an error (tx_errors)
+        """
+        return (self.received, self.discarded,
+                self.sent, self.tx_dropped, self.tx_errors)
 
 
 class LinuxFrameIOPort(FrameIOPort):
 
+    def __init__(self, iface_name, tx_queue_size=FrameIOPort.TX_QUEUE_SIZE,
+                 tx_notify=None):
+        super(LinuxFrameIOPort, self).__init__(
+            iface_name, tx_queue_size, tx_notify)
+        self.receiver = None
+        if mmsg.recvmmsg is not None:
+            self.receiver = mmsg.FrameReceiver(
+                self.RCV_SIZE_DEFAULT, self.RCV_BATCH_SIZE)
+        self.sender = None
+        if mmsg.sendmmsg is not None:
+            self.sender = mmsg.FrameSender(self.TX_BATCH_SIZE)
+        self.kernel_filter = None  # program attached to the socket
+
     def open_socket(self, iface_name):
         s = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
         afpacket.enable_auxdata(s)
@@ -219,6 +343,37 @@ class LinuxFrameIOPort(FrameIOPort):
     def rcv_frame(self):
         return afpacket.recv(self.socket, self.RCV_SIZE_DEFAULT)
 
+    def rcv_frames(self):
+        if self.receiver is None:
+            return super(LinuxFrameIOPort, self).rcv_frames()
+        return self.receiver.recv(self.socket)
+
+    def send_frames(self, frames):
+        if self.sender is None:
+            return super(LinuxFrameIOPort, self).send_frames(frames)
+        return self.sender.send(self.socket, frames)
+
+    def update_kernel_filter(self):
+        """
+        Attach the union of the filters of the proxies to the socket, if all
+        of them may be run by the kernel (see BpfProgramFilter)
+        """
+        program = None
+        programs = [p.filter.kernel_program()
+                    if isinstance(p.filter, BpfProgramFilter) else None
+                    for p in self.proxies]
+        if programs and None not in programs:
+            program = mmsg.union_of_programs(programs)
+        if program == self.kernel_filter:
+            return
+        if program is None:
+            mmsg.detach_filter(self.socket)
+        else:
+            mmsg.attach_filter(self.socket, program)
+        self.kernel_filter = program
+        log.debug('kernel-filter-updated', iface=self.iface_name,
+                  instructions=None if program is None else len(program))
+
 
 class DarwinFrameIOPort(FrameIOPort):
 
@@ -287,11 +442,13 @@ class FrameIOManager(Thread):
     Packet/Frame IO manager that can be used to send/receive raw frames
     on a set of network interfaces.
     """
-    def __init__(self):
+    def __init__(self, config=None):
         super(FrameIOManager, self).__init__()
 
+        config = config or {}
+        self.tx_queue_size = config.get('tx_queue_size',
+                                        FrameIOPort.TX_QUEUE_SIZE)
         self.ports = {}  # iface_name -> ActiveFrameReceiver
-        self.queue = {}  # iface_name -> TODO
 
         self.cvar = Condition()
         self.waker = _SelectWakerDescriptor()
@@ -344,7 +501,8 @@ class FrameIOManager(Thread):
 
         port = self.ports.get(iface_name)
         if port is None:
-            port = _FrameIOPort(iface_name)
+            port = _FrameIOPort(iface_name, self.tx_queue_size,
+                                self.waker.notify)
             self.ports[iface_name] = port
             self.ports_changed = True
             self.waker.notify()
@@ -375,10 +533,10 @@ class FrameIOManager(Thread):
 
     def send(self, iface_name, frame):
         """
-        Send frame on given interface
+        Queue frame to be sent on given interface
         :param iface_name: Name of previously registered interface
         :param frame: frame as string
-        :return: number of bytes sent
+        :return: number of bytes queued, 0 if the send queue was full
         """
         return self.ports[iface_name].send(frame)
 
@@ -386,7 +544,8 @@ class FrameIOManager(Thread):
 
     def run(self):
         """
-        Called on the alien thread, this is the core multi-port receive loop
+        Called on the alien thread, this is the core multi-port receive (and
+        send) loop
         """
 
         log.debug('select-loop-started')
@@ -399,8 +558,10 @@ class FrameIOManager(Thread):
             # inner select loop
 
             while not self.stopped:
+                senders = [port for port in sockets[1:] if port.tx_queue]
                 try:
-                    _in, _out, _err = select.select(sockets, empty, empty, 1)
+                    _in, _out, _err = select.select(
+                        sockets, senders, empty, 1)
                 except Exception as e:
                     log.exception('frame-io-select-error', e=e)
                     break
@@ -411,6 +572,8 @@ class FrameIOManager(Thread):
                             continue
                         else:
                             port.recv()
+                    for port in _out:
+                        port.xmit()
                     self.cvar.notify_all()
                 if self.ports_changed:
                     break  # break inner loop so we reconstruct sockets list
@@ -0,0 +1,226 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Batched receive and send on AF_PACKET sockets with recvmmsg(2) and
+sendmmsg(2), and in-kernel socket filters (SO_ATTACH_FILTER), for Linux.
+Python 2 has none of these, so ctypes is used, as in afpacket.
+"""
+import errno
+import socket
+import struct
+from ctypes import CDLL, POINTER, Structure, addressof, c_char_p, c_int, \
+    c_uint, c_uint8, c_uint16, c_uint32, c_void_p, cast, \
+    create_string_buffer, get_errno, pointer, sizeof, string_at
+
+from common.frameio.third_party.oftest.afpacket import ETH_P_8021Q, \
+    PACKET_AUXDATA, SOL_PACKET, TP_STATUS_VLAN_VALID, struct_cmsghdr, \
+    struct_iovec, struct_msghdr, struct_tpacket_auxdata
+
+SO_ATTACH_FILTER = 26
+SO_DETACH_FILTER = 27
+BPF_MAXINSNS = 4096
+MSG_DONTWAIT = 0x40
+
+# classic BPF opcodes needed to combine programs
+BPF_RET_K = 0x06  # BPF_RET | BPF_K
+BPF_RET_A = 0x16  # BPF_RET | BPF_A
+BPF_JA = 0x05  # BPF_JMP | BPF_JA
+
+libc = CDLL('libc.so.6', use_errno=True)
+recvmmsg = getattr(libc, 'recvmmsg', None)  # glibc 2.12 and later
+sendmmsg = getattr(libc, 'sendmmsg', None)  # glibc 2.14 and later
+
+
+class struct_mmsghdr(Structure):
+    _fields_ = [
+        ('msg_hdr', struct_msghdr),
+        ('msg_len', c_uint),
+    ]
+
+
+class struct_sock_filter(Structure):
+    _fields_ = [
+        ('code', c_uint16),
+        ('jt', c_uint8),
+        ('jf', c_uint8),
+        ('k', c_uint32),
+    ]
+
+
+class struct_sock_fprog(Structure):
+    _fields_ = [
+        ('len', c_uint16),
+        ('filter', POINTER(struct_sock_filter)),
+    ]
+
+
+if recvmmsg is not None:
+    recvmmsg.argtypes = [c_int, POINTER(struct_mmsghdr), c_uint, c_int,
+                         c_void_p]
+    recvmmsg.restype = c_int
+if sendmmsg is not None:
+    sendmmsg.argtypes = [c_int, POINTER(struct_mmsghdr), c_uint, c_int]
+    sendmmsg.restype = c_int
+
+_vlan_tag = struct.Struct('!HH').pack
+
+
+class FrameReceiver(object):
+    """
+    Receives up to max_frames frames from an AF_PACKET socket per call,
+    with a single recvmmsg system call, into buffers allocated once.
+    Like afpacket.recv, it puts back the VLAN tag the kernel took out of
+    a frame (the socket must have PACKET_AUXDATA enabled).
+    """
+
+    def __init__(self, bufsize, max_frames):
+        self.bufsize = bufsize
+        self.max_frames = max_frames
+        # room for the auxdata control message, aligned as the kernel does
+        self.auxdata_len = sizeof(struct_cmsghdr) + \
+            sizeof(struct_tpacket_auxdata)
+        self.ctrl_bufsize = (self.auxdata_len + 7) & ~7
+        self.bufs = create_string_buffer(bufsize * max_frames)
+        self.ctrl_bufs = create_string_buffer(self.ctrl_bufsize * max_frames)
+        self.iovs = (struct_iovec * max_frames)()
+        self.msgs = (struct_mmsghdr * max_frames)()
+        base = addressof(self.bufs)
+        ctrl_base = addressof(self.ctrl_bufs)
+        for i in xrange(max_frames):
+            self.iovs[i].iov_base = base + i * bufsize
+            self.iovs[i].iov_len = bufsize
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = pointer(self.iovs[i])
+            hdr.msg_iovlen = 1
+            hdr.msg_control = ctrl_base + i * self.ctrl_bufsize
+
+    def recv(self, sk):
+        """
+        Return the frames waiting on socket sk, at most max_frames of them,
+        without blocking. Raise RuntimeError if receiving failed.
+        """
+        msgs = self.msgs
+        for i in xrange(self.max_frames):
+            # the kernel sets these to what it filled in
+            msgs[i].msg_hdr.msg_controllen = self.ctrl_bufsize
+        n = recvmmsg(sk.fileno(), msgs, self.max_frames, MSG_DONTWAIT, None)
+        if n < 0:
+            if get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise RuntimeError('recvmmsg failed: errno={}'.format(
+                get_errno()))
+
+        base = addressof(self.bufs)
+        frames = []
+        for i in xrange(n):
+            msg = msgs[i]
+            address = base + i * self.bufsize
+            length = min(msg.msg_len, self.bufsize)
+            auxdata = None
+            if msg.msg_hdr.msg_controllen >= self.auxdata_len:
+                cmsg = struct_cmsghdr.from_buffer(
+                    self.ctrl_bufs, i * self.ctrl_bufsize)
+                if cmsg.cmsg_level == SOL_PACKET and \
+                        cmsg.cmsg_type == PACKET_AUXDATA:
+                    auxdata = struct_tpacket_auxdata.from_buffer(
+                        self.ctrl_bufs,
+                        i * self.ctrl_bufsize + sizeof(struct_cmsghdr))
+            if auxdata is not None and (auxdata.tp_vlan_tci != 0 or
+                    auxdata.tp_status & TP_STATUS_VLAN_VALID):
+                frames.append(
+                    string_at(address, 12) +
+                    _vlan_tag(ETH_P_8021Q, auxdata.tp_vlan_tci) +
+                    string_at(address + 12, length - 12))
+            else:
+                frames.append(string_at(address, length))
+        return frames
+
+
+class FrameSender(object):
+    """
+    Sends up to max_frames frames on an AF_PACKET socket per call, with a
+    single sendmmsg system call. The frames are not copied.
+    """
+
+    def __init__(self, max_frames):
+        self.max_frames = max_frames
+        self.iovs = (struct_iovec * max_frames)()
+        self.msgs = (struct_mmsghdr * max_frames)()
+        for i in xrange(max_frames):
+            hdr = self.msgs[i].msg_hdr
+            hdr.msg_iov = pointer(self.iovs[i])
+            hdr.msg_iovlen = 1
+
+    def send(self, sk, frames):
+        """
+        Send the given frames (str, at most max_frames of them), in order,
+        on socket sk without blocking. Return the number of bytes sent of
+        each frame sent, which is none of them if the socket cannot take
+        any now. Raise RuntimeError if the first frame could not be sent.
+        """
+        n_frames = len(frames)
+        buffers = [c_char_p(frame) for frame in frames]  # kept till sent
+        for i in xrange(n_frames):
+            self.iovs[i].iov_base = cast(buffers[i], c_void_p)
+            self.iovs[i].iov_len = len(frames[i])
+        n = sendmmsg(sk.fileno(), self.msgs, n_frames, MSG_DONTWAIT)
+        if n < 0:
+            if get_errno() in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise RuntimeError('sendmmsg failed: errno={}'.format(
+                get_errno()))
+        return [self.msgs[i].msg_len for i in xrange(n)]
+
+
+def union_of_programs(programs):
+    """
+    Return a classic BPF program accepting the frames any of the given
+    programs (lists of (code, jt, jf, k) tuples) accept, or None if they
+    cannot be combined: each program but the last jumps to the next one
+    instead of rejecting the frame. A program returning the accumulator
+    may reject frames that way, so such programs are not combined.
+    """
+    if len(programs) == 1:
+        return list(programs[0])
+    union = []
+    for i, program in enumerate(programs):
+        last = i == len(programs) - 1
+        for j, (code, jt, jf, k) in enumerate(program):
+            if code == BPF_RET_A:
+                return None
+            if code == BPF_RET_K and k == 0 and not last:
+                union.append((BPF_JA, 0, 0, len(program) - j - 1))
+            else:
+                union.append((code, jt, jf, k))
+    if len(union) > BPF_MAXINSNS:
+        return None
+    return union
+
+
+def attach_filter(sk, program):
+    """
+    Have the kernel drop the frames the classic BPF program (list of
+    (code, jt, jf, k) tuples) rejects before they are queued on socket sk
+    """
+    insns = (struct_sock_filter * len(program))(*program)
+    fprog = struct_sock_fprog(len(program), insns)
+    sk.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER,
+                  string_at(addressof(fprog), sizeof(fprog)))
+
+
+def detach_filter(sk):
+    sk.setsockopt(socket.SOL_SOCKET, SO_DETACH_FILTER, 0)
@@ -0,0 +1,83 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+from collections import OrderedDict
+
+
+class LRUCache(object):
+    """
+    Simple size bounded mapping that evicts the least recently used entry
+    when full. Keeps hit and miss counters for the get() method so users
+    can expose them as metrics.
+
+    Warning, this is not a complete mapping implementation, only what is
+    needed for now.
+    """
+
+    __slots__ = (
+        '_maxsize',
+        '_entries',
+        'hits',
+        'misses'
+    )
+
+    def __init__(self, maxsize):
+        assert maxsize > 0
+        self._maxsize = maxsize
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        return self._maxsize
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Return cached value (and mark it recently used) or default"""
+        try:
+            value = self._entries.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self._entries[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        entries = self._entries
+        if key in entries:
+            del entries[key]
+        elif len(entries) >= self._maxsize:
+            entries.popitem(last=False)
+        entries[key] = value
+
+    def __delitem__(self, key):
+        del self._entries[key]
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = self.misses = 0
+
+    def resize(self, maxsize):
+        assert maxsize > 0
+        self._maxsize = maxsize
+        while len(self._entries) > maxsize:
+            self._entries.popitem(last=False)
@@ -0,0 +1,74 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Batching of the flow-mods sent to voltha
+"""
+import structlog
+from twisted.internet import reactor
+from twisted.internet.defer import DeferredLock, inlineCallbacks
+
+log = structlog.get_logger()
+
+
+class FlowModBatcher(object):
+    """
+    Accumulates the flow-mods of a logical device to send them to voltha
+    in bulk, to be applied as a single change of its flow table: once
+    max_size of them are pending, window seconds after the first of them
+    came, or when flushed, e.g., on a barrier request. Batches are sent one
+    at a time, in order.
+    """
+
+    def __init__(self, device_id, rpc, window=0.01, max_size=1000,
+                 clock=reactor):
+        self.device_id = device_id
+        self.rpc = rpc
+        self.window = window
+        self.max_size = max_size
+        self.clock = clock
+        self.pending = []
+        self.timer = None
+        self.lock = DeferredLock()  # held while a batch is being sent
+
+    def add(self, flow_mod):
+        self.pending.append(flow_mod)
+        if len(self.pending) >= self.max_size:
+            self.flush()
+        elif self.timer is None:
+            self.timer = self.clock.callLater(self.window, self.flush)
+
+    def flush(self):
+        """
+        Send the pending flow-mods. Return a deferred firing once they and
+        all flow-mods sent before were applied (or failed to be).
+        """
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        flow_mods, self.pending = self.pending, []
+        return self.lock.run(self._send, flow_mods)
+
+    @inlineCallbacks
+    def _send(self, flow_mods):
+        if not flow_mods:
+            return
+        try:
+            yield self.rpc.update_flow_table_bulk(self.device_id, flow_mods)
+        except Exception, e:
+            log.exception('failed-to-update-flow-table', e=e,
+                          flow_mods=len(flow_mods))
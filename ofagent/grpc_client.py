@@ -28,7 +28,7 @@ from twisted.internet import threads
 from twisted.internet.defer import inlineCallbacks, returnValue, DeferredQueue
 
 from protos.voltha_pb2 import ID, VolthaLocalServiceStub, FlowTableUpdate, \
-    FlowGroupTableUpdate, PacketOut
+    FlowTableBulkUpdate, FlowGroupTableUpdate, PacketOut
 from google.protobuf import empty_pb2
 
 
@@ -171,6 +171,16 @@ class GrpcClient(object):
             self.local_stub.UpdateLogicalDeviceFlowTable, req)
         returnValue(res)
 
+    @inlineCallbacks
+    def update_flow_table_bulk(self, device_id, flow_mods):
+        req = FlowTableBulkUpdate(
+            id=device_id,
+            flow_mods=flow_mods
+        )
+        res = yield threads.deferToThread(
+            self.local_stub.UpdateLogicalDeviceFlowTableBulk, req)
+        returnValue(res)
+
     @inlineCallbacks
     def update_group_table(self, device_id, group_mod):
         req = FlowGroupTableUpdate(
@@ -18,6 +18,7 @@ from twisted.internet.defer import inlineCallbacks, returnValue
 
 import loxi.of13 as ofp
 from converter import to_loxi, pb2dict, to_grpc
+from flow_mod_batcher import FlowModBatcher
 
 log = structlog.get_logger()
 
@@ -42,6 +43,7 @@ class OpenFlowProtocolHandler(object):
         self.agent = agent
         self.cxn = cxn
         self.rpc = rpc
+        self.flow_mod_batcher = FlowModBatcher(device_id, rpc)
 
     @inlineCallbacks
     def start(self):
@@ -76,7 +78,7 @@ class OpenFlowProtocolHandler(object):
 
     def stop(self):
         log.debug('stopping')
-        pass  # nothing to do yet
+        self.flow_mod_batcher.flush()
         log.info('stopped')
 
     def handle_echo_request(self, req):
@@ -99,9 +101,11 @@ class OpenFlowProtocolHandler(object):
             raise OpenFlowProtocolError(
                 'Cannot handle stats request type "{}"'.format(req.stats_type))
 
+    @inlineCallbacks
     def handle_barrier_request(self, req):
-        # not really doing barrier yet, but we respond
+        # reply once the flow-mods received before are applied
         # see https://jira.opencord.org/browse/CORD-823
+        yield self.flow_mod_batcher.flush()
         self.cxn.send(ofp.message.barrier_reply(xid=req.xid))
 
     def handle_experimenter_request(self, req):
@@ -113,7 +117,8 @@ class OpenFlowProtocolHandler(object):
         except Exception, e:
             log.exception('failed-to-convert', e=e)
         else:
-            return self.rpc.update_flow_table(self.device_id, grpc_req)
+            # sent in bulk with those following it, see FlowModBatcher
+            self.flow_mod_batcher.add(grpc_req)
 
     def handle_get_async_request(self, req):
         raise NotImplementedError()
@@ -126,6 +131,8 @@ class OpenFlowProtocolHandler(object):
 
     @inlineCallbacks
     def handle_group_mod_request(self, req):
+        # flow-mods received before may refer to the group, or be affected
+        yield self.flow_mod_batcher.flush()
         yield self.rpc.update_group_table(self.device_id, to_grpc(req))
 
     def handle_meter_mod_request(self, req):
@@ -174,6 +181,7 @@ class OpenFlowProtocolHandler(object):
     @inlineCallbacks
     def handle_flow_stats_request(self, req):
         try:
+            yield self.flow_mod_batcher.flush()
             flow_stats = yield self.rpc.list_flows(self.device_id)
             self.cxn.send(ofp.message.flow_stats_reply(
                 xid=req.xid, entries=[to_loxi(f) for f in flow_stats]))
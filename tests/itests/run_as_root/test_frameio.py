@@ -33,7 +33,7 @@ from scapy.layers.l2 import Ether, Dot1Q
 from twisted.internet import reactor
 from twisted.internet.defer import Deferred, inlineCallbacks, DeferredQueue
 from twisted.internet.error import AlreadyCalled
-from twisted.trial.unittest import TestCase
+from twisted.trial.unittest import SkipTest, TestCase
 
 from common.frameio.frameio import FrameIOManager, BpfProgramFilter, \
     FrameIOPortProxy
@@ -198,6 +198,58 @@ class TestFrameIO(TestCase):
         # verify that both queue got all packets
         yield done
 
+    @inlineCallbacks
+    def test_burst_received_in_order(self):
+
+        done = Deferred()
+        received = []
+        n = 100
+
+        def append(_, frame):
+            if frame[6:12] == '\x00\x00\x00\x00\x00\x01':
+                received.append(frame)
+                if len(received) == n:
+                    done.callback(None)
+
+        p0 = self.mgr.open_port('veth0', none).up()
+        self.mgr.open_port('veth1', append).up()
+
+        # sent at once, received (and dispatched) in batches
+        frames = [str(Ether(src='00:00:00:00:00:01')/Dot1Q(vlan=100 + i % 2)/
+                      ('%04d' % i)) for i in xrange(n)]
+        for frame in frames:
+            p0.send(frame)
+
+        yield done
+        self.assertEqual(received, frames)
+
+    @inlineCallbacks
+    def test_kernel_filter(self):
+
+        filter = BpfProgramFilter('ether proto 0x88cc', in_kernel=True)
+        if filter.kernel_program() is None:
+            raise SkipTest('pcapy cannot tell the compiled program')
+
+        rcvd = DeferredWithTimeout()
+        p0 = self.mgr.open_port('veth0', none).up()
+        p1 = self.mgr.open_port('veth1', lambda p, f: rcvd.callback((p, f)),
+                                filter=filter).up()
+        port = self.mgr.ports['veth1']
+        self.assertIsNotNone(port.kernel_filter)
+
+        # not even received, let alone discarded
+        p0.send(str(Ether(type=0x0800)))
+        lldp_frame = str(Ether(type=0x88cc))
+        p0.send(lldp_frame)
+        _, frame = yield rcvd
+        self.assertEqual(frame, lldp_frame)
+        self.assertEqual(port.statistics(), (1, 0, 0, 0, 0))
+        self.assertEqual(self.mgr.ports['veth0'].statistics()[2:], (2, 0, 0))
+
+        # no longer attached once a proxy wants all frames
+        self.mgr.open_port('veth1', none)
+        self.assertIsNone(port.kernel_filter)
+
     @inlineCallbacks
     def test_shared_interface(self):
 
@@ -14,13 +14,18 @@
 # limitations under the License.
 #
 import re
+from random import Random
+from time import time
+from unittest import TestCase as PlainTestCase
 
 from mock import Mock
 from mock import call
 from twisted.internet.defer import DeferredQueue, inlineCallbacks
+from twisted.internet.task import Clock
 from twisted.trial.unittest import TestCase
 
-from common.event_bus import EventBusClient, EventBus
+from common.event_bus import EventBusClient, EventBus, _literal_prefix, \
+    DROP_OLDEST, DROP_NEWEST, BLOCK
 
 
 class TestEventBus(TestCase):
@@ -195,3 +200,206 @@ class TestEventBus(TestCase):
             msg = yield queue.get()
             self.assertEqual(msg, i)
         self.assertEqual(len(queue.pending), 0)
+
+    def test_wildcard_subscribers_called_once_per_publish(self):
+
+        ebc = EventBusClient(EventBus())
+
+        news_sub = Mock()
+        ebc.subscribe('news', news_sub)
+        wildcard_sub = Mock()
+        ebc.subscribe(re.compile(r'n.*'), wildcard_sub)
+
+        for i in xrange(3):
+            ebc.publish('news', i)
+
+        self.assertEqual(news_sub.call_count, 3)
+        self.assertEqual(wildcard_sub.call_count, 3)
+        self.assertEqual(len(ebc.list_subscribers('news')), 1)
+
+    def test_subscription_changes_seen_by_publish(self):
+
+        ebc = EventBusClient(EventBus())
+        calls = []
+
+        ebc.subscribe(re.compile(r'rx:.*'), lambda t, m: calls.append('rx*'))
+        ebc.publish('rx:1', 1)
+        sub = ebc.subscribe('rx:1', lambda t, m: calls.append('rx:1'))
+        ebc.subscribe(re.compile(r'.*'), lambda t, m: calls.append('*'))
+        ebc.publish('rx:1', 2)
+        self.assertEqual(calls, ['rx*', 'rx:1', 'rx*', '*'])
+
+        del calls[:]
+        ebc.unsubscribe(sub)
+        ebc.publish('rx:1', 3)
+        self.assertEqual(calls, ['rx*', '*'])
+
+    def test_literal_prefix(self):
+
+        for pattern, prefix in (
+                (r'rx:.*', 'rx:'),
+                (r'ham', 'ham'),
+                (r'hams?', 'ham'),
+                (r'hams*', 'ham'),
+                (r'hams+', 'hams'),
+                (r'ham{2}', 'ha'),
+                (r'ham\.burg', 'ham'),
+                (r'ham|burg', ''),
+                (r'[hH]am', ''),
+                (r'(?i)ham', ''),
+                (r'(?x)ham', '')):
+            self.assertEqual(_literal_prefix(re.compile(pattern)), prefix)
+        self.assertEqual(
+            _literal_prefix(re.compile(r'ham', re.IGNORECASE)), '')
+        self.assertEqual(
+            _literal_prefix(re.compile(r'h a m', re.VERBOSE)), '')
+
+    def test_verbose_wildcard_topics(self):
+
+        bus = EventBus()
+        sub = bus.subscribe(re.compile(r' rx : \d+  # any channel',
+                                       re.VERBOSE), None)
+        self.assertEqual(list(bus._get_subscribers('rx:3')), [sub])
+        bus.unsubscribe(sub)
+
+    def test_wildcard_topics_agree_with_scanning(self):
+
+        rand = Random(42)
+        bus = EventBus()
+        patterns = [r'rx:.*', r'rx:1.*', r'tx:', r'.*:2', r'(rx|tx):3',
+                    r'rx:1?2', r'rx:[0-4]', r'', r'tx:\d+$', r'RX', r'rx:12']
+        subs = []
+        for _ in xrange(300):
+            if subs and rand.random() < 0.3:
+                sub = subs.pop(rand.randrange(len(subs)))
+                bus.unsubscribe(sub)
+            else:
+                subs.append(bus.subscribe(
+                    re.compile(rand.choice(patterns),
+                               rand.choice((0, re.IGNORECASE))),
+                    None))
+            topic = rand.choice(('rx:', 'tx:')) + str(rand.randrange(30))
+            self.assertEqual(
+                list(bus._get_subscribers(topic)),
+                [s for s in subs if s.topic.match(topic)])
+        for sub in subs:
+            bus.unsubscribe(sub)
+        self.assertEqual(bus.regexp_subscriptions.children, {})
+
+
+class TestQueuedDelivery(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.ebc = EventBusClient(EventBus(clock=self.clock))
+        self.received = []
+
+    def subscribe(self, **kw):
+        return self.ebc.subscribe(
+            'news', lambda topic, msg: self.received.append(msg), **kw)
+
+    def test_delivered_by_reactor_in_batches(self):
+        sync_sub = Mock()
+        self.ebc.subscribe('news', sync_sub)
+        sub = self.subscribe(queue_size=10, batch_size=3)
+        for i in xrange(5):
+            self.ebc.publish('news', i)
+        self.assertEqual(sync_sub.call_count, 5)
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.ebc.delivery_metrics(sub)['lag'], 5)
+
+        # a batch per reactor iteration
+        call, = self.clock.getDelayedCalls()
+        call.func()
+        self.assertEqual(self.received, [0, 1, 2])
+        self.clock.advance(0)
+        self.assertEqual(self.received, [0, 1, 2, 3, 4])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+        self.assertEqual(self.ebc.delivery_metrics(sub), dict(
+            lag=0, max_lag=5, delivered=5, dropped=0, policy=DROP_OLDEST))
+        self.assertIsNone(self.ebc.delivery_metrics(
+            self.ebc.list_subscribers('news')[0]))
+
+    def test_queue_policies(self):
+        for policy, received, dropped in (
+                (DROP_OLDEST, [2, 3, 4], 2),
+                (DROP_NEWEST, [0, 1, 2], 2),
+                (BLOCK, [0, 1, 2, 3, 4], 0)):
+            self.received = []
+            sub = self.subscribe(queue_size=3, policy=policy)
+            for i in xrange(5):
+                self.ebc.publish('news', i)
+            if policy == BLOCK:
+                # the publisher delivered the messages there was no room for
+                self.assertEqual(self.received, [0, 1])
+            self.clock.advance(0)
+            self.assertEqual(self.received, received)
+            metrics = self.ebc.delivery_metrics(sub)
+            self.assertEqual(metrics['dropped'], dropped)
+            self.assertEqual(metrics['max_lag'], 3)
+            self.ebc.unsubscribe(sub)
+
+    def test_unsubscribe_drops_queued_messages(self):
+        sub = self.subscribe(queue_size=10)
+        self.ebc.publish('news', 1)
+        self.ebc.unsubscribe(sub)
+        self.clock.advance(0)
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_unsubscribe_from_queued_callback(self):
+        def callback(topic, msg):
+            self.received.append(msg)
+            self.ebc.unsubscribe(sub)
+        sub = self.ebc.subscribe('news', callback, queue_size=10)
+        for i in xrange(3):
+            self.ebc.publish('news', i)
+        self.clock.advance(0)
+        self.assertEqual(self.received, [0])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_unknown_policy(self):
+        self.assertRaises(ValueError, self.subscribe, queue_size=10,
+                          policy='drop-all')
+
+
+class TestEventBusPerformance(PlainTestCase):
+    """
+    Prints the publish rate to many topics, with an explicit subscriber per
+    topic, as with proxied messages, and a few regexp based subscribers:
+    matching each regexp on each publish vs looking up cached subscribers.
+    """
+
+    n_topics = 10000
+    n_publishes = 100000
+
+    def test_publish_rate(self):
+
+        bus = EventBus()
+        topics = ['rx:{"device_id": "%012x", "onu_id": %d}' % (i / 64, i)
+                  for i in xrange(self.n_topics)]
+        callback = lambda topic, msg: None
+        for topic in topics:
+            bus.subscribe(topic, callback)
+        for pattern in (r'kpis', r'packet-in:.*', r'packet-out:.*',
+                        r'tx:.*olt', r'.*alarm'):
+            bus.subscribe(re.compile(pattern), callback)
+        rand = Random(0)
+        published = [rand.choice(topics) for _ in xrange(self.n_publishes)]
+
+        def scan(topic):
+            subscribers = list(bus.subscriptions.get(topic, []))
+            subscribers.extend(s for s in bus.subscriptions.get(None, [])
+                               if s.topic.match(topic))
+            return subscribers
+
+        print
+        print '%10s %10s %14s' % ('dispatch', 'topics', 'publishes/s')
+        for name, get_subscribers in (('scan', scan),
+                                      ('cached', bus._get_subscribers)):
+            bus._get_subscribers = get_subscribers
+            t0 = time()
+            for topic in published:
+                bus.publish(topic, None)
+            rate = self.n_publishes / (time() - t0)
+            print '%10s %10d %14.0f' % (name, self.n_topics, rate)
@@ -0,0 +1,191 @@
+from unittest import TestCase, main
+
+from mock import Mock
+
+from common.frameio import frameio, mmsg
+from common.frameio.frameio import FrameIOPort, FrameIOPortProxy
+
+# classic BPF programs accepting frames of an ethertype
+LDH_ETHERTYPE = (0x28, 0, 0, 12)
+
+
+def accept_ethertype(ethertype):
+    return [LDH_ETHERTYPE, (0x15, 0, 1, ethertype), (0x06, 0, 0, 0xffff),
+            (0x06, 0, 0, 0)]
+
+
+def accept_ethertypes_above(ethertype):
+    return [LDH_ETHERTYPE, (0x25, 1, 0, ethertype), (0x06, 0, 0, 0),
+            (0x06, 0, 0, 0xffff)]
+
+
+def run_bpf(program, frame):
+    """Runs the few instructions the programs above use"""
+    pc = a = 0
+    while True:
+        code, jt, jf, k = program[pc]
+        pc += 1
+        if code == 0x28:  # ldh [k]
+            a = ord(frame[k]) << 8 | ord(frame[k + 1])
+        elif code == 0x15:  # jeq #k
+            pc += jt if a == k else jf
+        elif code == 0x25:  # jgt #k
+            pc += jt if a > k else jf
+        elif code == 0x05:  # ja k
+            pc += k
+        elif code == 0x06:  # ret #k
+            return k
+        else:
+            raise ValueError(code)
+
+
+def mk_frame(ethertype):
+    return '\x00' * 12 + chr(ethertype >> 8) + chr(ethertype & 0xff)
+
+
+class TestUnionOfPrograms(TestCase):
+
+    def test_union_accepts_what_any_program_accepts(self):
+        programs = [accept_ethertype(0x88cc), accept_ethertypes_above(0x9000),
+                    accept_ethertype(0x0806)]
+        union = mmsg.union_of_programs(programs)
+        for ethertype in (0x0800, 0x0806, 0x86dd, 0x88cc, 0x8100, 0x9000,
+                          0x9001, 0xa8c8):
+            frame = mk_frame(ethertype)
+            self.assertEqual(
+                bool(run_bpf(union, frame)),
+                any(run_bpf(p, frame) for p in programs))
+
+    def test_programs_returning_accumulator_are_not_combined(self):
+        program = [LDH_ETHERTYPE, (0x16, 0, 0, 0)]
+        self.assertEqual(mmsg.union_of_programs([program]), program)
+        self.assertIsNone(mmsg.union_of_programs(
+            [program, accept_ethertype(0x88cc)]))
+
+
+class ListFrameIOPort(FrameIOPort):
+    """Receives the frames of a list, as many at once as there are"""
+
+    def open_socket(self, iface_name):
+        self.frames = []
+        return Mock()
+
+    def rcv_frames(self):
+        frames, self.frames = self.frames, []
+        return frames
+
+
+class TestBatchedDispatch(TestCase):
+
+    def setUp(self):
+        self.reactor = frameio.reactor
+        frameio.reactor = Mock()
+        self.port = ListFrameIOPort('test')
+
+    def tearDown(self):
+        frameio.reactor = self.reactor
+
+    def add_proxy(self, filter=None):
+        received = []
+        self.port.add_proxy(FrameIOPortProxy(
+            self.port, lambda proxy, frame: received.append(frame), filter))
+        return received
+
+    def test_frames_received_at_once_are_dispatched_at_once(self):
+        all_frames = self.add_proxy()
+        lldp_frames = self.add_proxy(lambda frame: frame[12:] == '\x88\xcc')
+        frames = [mk_frame(0x88cc), mk_frame(0x0800), mk_frame(0x88cc)]
+        self.port.frames = list(frames)
+        self.port.recv()
+
+        self.assertEqual(frameio.reactor.callFromThread.call_count, 1)
+        args, _ = frameio.reactor.callFromThread.call_args
+        args[0](*args[1:])
+        self.assertEqual(all_frames, frames)
+        self.assertEqual(lldp_frames, [frames[0], frames[2]])
+        self.assertEqual(self.port.statistics(), (3, 0, 0, 0, 0))
+
+    def test_discarded_frames(self):
+        self.add_proxy(lambda frame: False)
+        self.port.frames = [mk_frame(0x0800)] * 2
+        self.port.recv()
+        self.assertFalse(frameio.reactor.callFromThread.called)
+        self.assertEqual(self.port.statistics(), (2, 2, 0, 0, 0))
+
+
+class BatchFrameIOPort(ListFrameIOPort):
+    """Sends up to room frames at once, a short write for the empty ones"""
+
+    def open_socket(self, iface_name):
+        self.batches = []
+        self.room = 1000
+        return super(BatchFrameIOPort, self).open_socket(iface_name)
+
+    def send_frames(self, frames):
+        frames = frames[:self.room]
+        self.room -= len(frames)
+        self.batches.append(frames)
+        return [len(frame) or -1 for frame in frames]
+
+
+class TestSendQueue(TestCase):
+
+    def setUp(self):
+        self.notify = Mock()
+        self.port = BatchFrameIOPort('test', tx_queue_size=100,
+                                     tx_notify=self.notify)
+
+    def test_queued_frames_are_sent_in_batches(self):
+        frames = [str(i) for i in xrange(100)]
+        for frame in frames:
+            self.assertEqual(self.port.send(frame), len(frame))
+        self.assertEqual(self.notify.call_count, 1)
+        self.port.xmit()
+        self.assertEqual(sum(self.port.batches, []), frames)
+        self.assertEqual([len(b) for b in self.port.batches],
+                         [FrameIOPort.TX_BATCH_SIZE,
+                          100 - FrameIOPort.TX_BATCH_SIZE])
+        self.assertEqual(len(self.port.tx_queue), 0)
+        self.assertEqual(self.port.statistics(), (0, 0, 100, 0, 0))
+
+        self.port.send('again')
+        self.assertEqual(self.notify.call_count, 2)
+
+    def test_frames_beyond_the_bound_are_dropped(self):
+        for i in xrange(102):
+            self.port.send(str(i))
+        self.assertEqual(self.port.send('dropped'), 0)
+        self.port.xmit()
+        self.assertEqual(sum(self.port.batches, []),
+                         [str(i) for i in xrange(100)])
+        self.assertEqual(self.port.statistics(), (0, 0, 100, 3, 0))
+
+    def test_sending_stops_when_the_socket_is_full(self):
+        self.port.room = 10
+        for i in xrange(20):
+            self.port.send(str(i))
+        self.port.xmit()
+        self.assertEqual(len(self.port.tx_queue), 10)
+        self.port.room = 10
+        self.port.xmit()
+        self.assertEqual(sum(self.port.batches, []),
+                         [str(i) for i in xrange(20)])
+
+    def test_send_errors(self):
+        self.port.send('first')
+        self.port.send('')
+        self.port.send('sent')
+        self.port.xmit()
+        self.assertEqual(self.port.statistics(), (0, 0, 2, 0, 1))
+
+        def fail(frames):
+            raise RuntimeError('sendmmsg failed')
+        self.port.send_frames = fail
+        self.port.send('failed')
+        self.port.xmit()
+        self.assertEqual(len(self.port.tx_queue), 0)
+        self.assertEqual(self.port.statistics(), (0, 0, 2, 0, 2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from unittest import TestCase, main
+
+from common.utils.lru_cache import LRUCache
+
+
+class TestLRUCache(TestCase):
+
+    def test_eviction_order(self):
+        cache = LRUCache(3)
+        for k in xrange(3):
+            cache[k] = str(k)
+        self.assertEqual(len(cache), 3)
+
+        # touching 0 makes 1 the least recently used entry
+        self.assertEqual(cache.get(0), '0')
+        cache[3] = '3'
+        self.assertEqual(len(cache), 3)
+        self.assertNotIn(1, cache)
+        self.assertIn(0, cache)
+
+        # overwriting does not evict
+        cache[2] = 'two'
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.get(2), 'two')
+
+    def test_counters(self):
+        cache = LRUCache(2)
+        cache['a'] = 1
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('b', 42), 42)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_resize(self):
+        cache = LRUCache(10)
+        for k in xrange(10):
+            cache[k] = k
+        cache.resize(4)
+        self.assertEqual(len(cache), 4)
+        self.assertNotIn(5, cache)
+        self.assertIn(9, cache)
+        del cache[9]
+        self.assertNotIn(9, cache)
+
+
+if __name__ == '__main__':
+    main()
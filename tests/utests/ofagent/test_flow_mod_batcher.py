@@ -0,0 +1,81 @@
+from unittest import TestCase, main
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from ofagent.flow_mod_batcher import FlowModBatcher
+
+
+class FakeRpc(object):
+
+    def __init__(self):
+        self.calls = []  # (device id, flow-mods, deferred)
+
+    def update_flow_table_bulk(self, device_id, flow_mods):
+        d = Deferred()
+        self.calls.append((device_id, list(flow_mods), d))
+        return d
+
+
+class TestFlowModBatcher(TestCase):
+
+    def setUp(self):
+        self.rpc = FakeRpc()
+        self.clock = Clock()
+        self.batcher = FlowModBatcher('ld', self.rpc, window=0.01,
+                                      max_size=5, clock=self.clock)
+
+    def sent(self):
+        return [flow_mods for _, flow_mods, _ in self.rpc.calls]
+
+    def test_sent_after_window(self):
+        for i in xrange(3):
+            self.batcher.add(i)
+        self.clock.advance(0.005)
+        self.assertEqual(self.sent(), [])
+        self.batcher.add(3)
+        self.clock.advance(0.005)
+        self.assertEqual(self.sent(), [[0, 1, 2, 3]])
+        self.assertEqual(self.rpc.calls[0][0], 'ld')
+
+    def test_sent_when_full(self):
+        for i in xrange(7):
+            self.batcher.add(i)
+        self.assertEqual(self.sent(), [[0, 1, 2, 3, 4]])
+        self.rpc.calls[0][2].callback(None)
+        self.clock.advance(0.01)
+        self.assertEqual(self.sent(), [[0, 1, 2, 3, 4], [5, 6]])
+
+    def test_flush_waits_for_batches_sent_before(self):
+        self.batcher.add(0)
+        self.clock.advance(0.01)
+        self.batcher.add(1)
+        done = []
+        self.batcher.flush().addCallback(done.append)
+
+        # one batch at a time, in order
+        self.assertEqual(self.sent(), [[0]])
+        self.rpc.calls[0][2].callback(None)
+        self.assertEqual(self.sent(), [[0], [1]])
+        self.assertEqual(done, [])
+        self.rpc.calls[1][2].callback(None)
+        self.assertEqual(done, [None])
+
+        # nothing pending: fires at once, and the timer was cancelled
+        self.batcher.flush().addCallback(done.append)
+        self.assertEqual(len(done), 2)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_failed_batch_does_not_block_later_ones(self):
+        self.batcher.add(0)
+        done = []
+        self.batcher.flush().addCallback(done.append)
+        self.rpc.calls[0][2].errback(RuntimeError('unavailable'))
+        self.assertEqual(done, [None])
+        self.batcher.add(1)
+        self.batcher.flush()
+        self.assertEqual(self.sent(), [[0], [1]])
+
+
+if __name__ == '__main__':
+    main()
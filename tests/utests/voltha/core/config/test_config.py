@@ -7,14 +7,15 @@ from unittest import main, TestCase
 
 import gc
 
-from mock import Mock
+from mock import Mock, patch
 
+from voltha.core.config.config_node import ConfigNode
 from voltha.core.config.config_proxy import CallbackType, OperationContext
 from voltha.core.config.config_rev import _rev_cache
 from voltha.core.config.config_root import ConfigRoot, MergeConflictException
 from voltha.core.config.config_txn import ClosedTransactionError
 from voltha.protos import third_party
-from voltha.protos.openflow_13_pb2 import ofp_port
+from voltha.protos.openflow_13_pb2 import ofp_port, Flows, ofp_flow_stats
 from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, HealthStatus, \
     AdapterConfig, LogicalDevice, LogicalPort
 
@@ -540,6 +541,81 @@ class TestNodeOwnershipAndHooks(DeepTestsBase):
         post_callback.assert_called_with(adapter)
 
 
+class TestReadOnlyGet(DeepTestsBase):
+
+    def test_same_content_as_regular_get(self):
+        for path, kw in (('/', {}),
+                         ('/', dict(deep=1)),
+                         ('/', dict(depth=1)),
+                         ('/health', {}),
+                         ('/adapters', {}),
+                         ('/adapters', dict(deep=1)),
+                         ('/adapters/3', dict(depth=2))):
+            self.assertEqual(self.node.get(path, readonly=True, **kw),
+                             self.node.get(path, **kw))
+
+    def test_repeated_reads_are_shared(self):
+        # shallow reads hand out the stored data as is
+        self.assertIs(self.node.get('/adapters/1', readonly=True),
+                      self.node.latest._children['adapters'][1].data)
+
+        # deep reads are assembled only once per revision
+        deep = self.node.get(deep=1, readonly=True)
+        self.assertIs(self.node.get(deep=1, readonly=True), deep)
+        self.assertIsNot(self.node.get(deep=1), deep)
+
+    def test_reads_follow_changes(self):
+        before = self.node.get(deep=1, readonly=True)
+        self.node.update('/adapters/3', Adapter(id='3', version='changed'))
+        after = self.node.get(deep=1, readonly=True)
+        self.assertEqual(after.adapters[3].version, 'changed')
+        self.assertEqual(before, self.base_deep)
+        self.assertEqual(self.node.get(hash=self.hash_orig, deep=1,
+                                       readonly=True), self.base_deep)
+
+    def test_get_hook_does_not_alter_shared_data(self):
+        proxy = self.node.get_proxy('/health')
+
+        def get_health_callback(msg):
+            msg.state = HealthStatus.OVERLOADED
+            return msg
+
+        proxy.register_callback(CallbackType.GET, get_health_callback)
+        self.assertEqual(proxy.get(readonly=True).state,
+                         HealthStatus.OVERLOADED)
+        self.assertEqual(self.node.latest._children['health'][0].data.state,
+                         HealthStatus.DYING)
+
+    def test_readonly_get_performance(self):
+        n_adapters = 1000
+        n_reads = 100
+        node = ConfigRoot(VolthaInstance(adapters=[
+            Adapter(id=str(i), vendor='cord', version='1.0',
+                    config=AdapterConfig(log_level=3))
+            for i in xrange(n_adapters)]))
+
+        def measure(readonly):
+            m0 = memusage()
+            t0 = time()
+            results = [node.get(deep=1, readonly=readonly)
+                       for _ in xrange(n_reads)]
+            dt = time() - t0
+            return 1000 * dt / n_reads, (memusage() - m0) / 1024., results
+
+        print
+        # read-only first, since memusage() only reports the peak
+        ro_ms, ro_mb, ro_results = measure(True)
+        rw_ms, rw_mb, rw_results = measure(False)
+        print '%12s %14s %22s' % ('', 'ms per get', 'MB to hold %d results'
+                                  % n_reads)
+        print '%12s %14.3f %22.2f' % ('regular', rw_ms, rw_mb)
+        print '%12s %14.3f %22.2f' % ('read-only', ro_ms, ro_mb)
+
+        self.assertEqual(ro_results[0], rw_results[0])
+        self.assertEqual(len(set(id(r) for r in ro_results)), 1)
+        self.assertLess(ro_ms, rw_ms)
+
+
 class TestTransactionalLogic(DeepTestsBase):
 
     def make_change(self, tx, path, attr_name, new_value):
@@ -1169,6 +1245,239 @@ class TestTransactionalLogic(DeepTestsBase):
         # ))
         post_remove.assert_called_once_with(ad)
 
+    def test_touched_keys_are_tracked(self):
+        txid = self.node.mk_txbranch()
+        self.node.update('/adapters/1', Adapter(id='1', version='x'),
+                         txid=txid)
+        self.node.remove('/adapters/3', txid=txid)
+        self.node.add('/adapters', Adapter(id='7'), txid=txid)
+        self.assertEqual(self.node._branches[txid]._touched,
+                         dict(adapters=OrderedDict.fromkeys(['1', '3', '7'])))
+        self.assertIsNone(self.node._branches[None]._touched)
+        self.node.fold_txbranch(txid)
+        self.assertEqual(self.log_levels().keys(), ['0', '1', '2', '4', '7'])
+
+    def test_dry_run_only_after_concurrent_commit(self):
+        proxy = self.node.get_proxy('/')
+
+        def dry_runs(merges):
+            return [args[1] for args, kw in merges.call_args_list
+                    if kw.get('dry_run') or args[2:] and args[2]]
+
+        merge = ConfigNode._merge_txbranch
+        with patch.object(ConfigNode, '_merge_txbranch', autospec=True,
+                          side_effect=merge) as merges:
+            tx = proxy.open_transaction()
+            self.make_change(tx, '/adapters/2', 'config.log_level', 0)
+            tx.commit()
+            # root and adapter, merged once each
+            self.assertEqual(merges.call_count, 2)
+            self.assertEqual(dry_runs(merges), [])
+
+            merges.reset_mock()
+            tx1 = proxy.open_transaction()
+            tx2 = proxy.open_transaction()
+            self.make_change(tx1, '/adapters/1', 'config.log_level', 0)
+            self.make_change(tx2, '/adapters/3', 'config.log_level', 0)
+            tx1.commit()
+            tx2.commit()
+            self.assertEqual(merges.call_count, 2 + 2 * 2)
+            self.assertEqual(len(dry_runs(merges)), 2)
+        self.assertEqual(self.log_levels().values(), [3, 0, 0, 0, 3])
+
+    def test_unchanged_children_leave_no_branches(self):
+        proxy = self.node.get_proxy('/')
+        tx = proxy.open_transaction()
+        # updated to the same content, hence not changed in its parent
+        tx.update('/adapters/2', tx.get('/adapters/2'))
+        self.make_change(tx, '/adapters/1', 'config.log_level', 0)
+        tx.commit()
+        self.assertEqual(self.node._dirty_nodes, {})
+        # see tearDown for the branches
+
+    def test_failed_merge_leaves_no_branches(self):
+        proxy = self.node.get_proxy('/')
+        tx = proxy.open_transaction()
+        self.make_change(tx, '/adapters/1', 'config.log_level', 0)
+        with patch.object(ConfigNode, '_merge_txbranch', autospec=True,
+                          side_effect=RuntimeError('merge failed')):
+            self.assertRaises(RuntimeError, tx.commit)
+        self.assertEqual(self.node._dirty_nodes, {})
+        # see tearDown for the branches
+
+
+class TestTransactionMergePerformance(TestCase):
+    """
+    Prints the time to commit a transaction changing the flow table of a
+    logical device, as the number of logical devices grows, with and
+    without concurrent commits since the transaction was opened. The cost
+    shall not depend on the number of logical devices when only the keys of
+    touched children are looked at.
+    """
+
+    sizes = (20, 100, 1000, 5000)
+    n_flows = 100
+    n_tx = 20
+
+    def mk_root(self, n_devices):
+        return ConfigRoot(VolthaInstance(logical_devices=[
+            LogicalDevice(id=str(i), flows=Flows(items=[
+                ofp_flow_stats(id=f, priority=f, cookie=i)
+                for f in xrange(self.n_flows)]))
+            for i in xrange(n_devices)]))
+
+    def commit(self, root, txids, all_keys):
+        t0 = time()
+        for txid in txids:
+            if all_keys:
+                # as before touched keys were tracked
+                for node in root._dirty_nodes[txid]:
+                    node._branches[txid]._touched = None
+            root.fold_txbranch(txid)
+        return 1000 * (time() - t0) / len(txids)
+
+    def open(self, root, n_devices, serial, n_tx):
+        txids = []
+        for i in xrange(n_tx):
+            txid = root.mk_txbranch()
+            path = '/logical_devices/%d/flows' % (i * n_devices / self.n_tx)
+            flows = root.get(path, txid=txid)
+            flows.items.add(id=self.n_flows + serial, priority=1)
+            root.update(path, flows, txid=txid)
+            txids.append(txid)
+        return txids
+
+    def test_merge_cost(self):
+        print
+        print '%8s %24s %24s' % ('', 'sequential [ms/commit]',
+                                 'concurrent [ms/commit]')
+        print '%8s %12s %11s %12s %11s' % (
+            'devices', 'touched', 'all', 'touched', 'all')
+        for n_devices in self.sizes:
+            root = self.mk_root(n_devices)
+            results = []
+            serial = 0
+            for all_keys in (False, True):
+                sequential = 0.
+                for _ in xrange(self.n_tx):
+                    serial += 1
+                    sequential += self.commit(
+                        root, self.open(root, n_devices, serial, 1),
+                        all_keys) / self.n_tx
+                serial += 1
+                concurrent = self.commit(
+                    root, self.open(root, n_devices, serial, self.n_tx),
+                    all_keys)
+                results.append((sequential, concurrent))
+            print '%8d %12.3f %11.3f %12.3f %11.3f' % (
+                n_devices, results[0][0], results[1][0],
+                results[0][1], results[1][1])
+            self.assertEqual(root._dirty_nodes, {})
+
+
+
+class TestBulk(DeepTestsBase):
+
+    def ids(self):
+        return [a.id for a in self.node.get('/adapters')]
+
+    def test_single_revision(self):
+        proxy = self.node.get_proxy('/')
+        n_revs = len(self.node.revisions)
+        proxy.bulk('/adapters', [
+            ('add', Adapter(id='5')),
+            ('add', Adapter(id='6')),
+            ('update', Adapter(id='1', version='x')),
+            ('remove', '3'),
+            ('update', Adapter(id='5', version='y')),
+        ])
+        self.assertEqual(len(self.node.revisions), n_revs + 1)
+        self.assertEqual(self.ids(), ['0', '1', '2', '4', '5', '6'])
+        self.assertEqual(self.node.get('/adapters/1').version, 'x')
+        self.assertEqual(self.node.get('/adapters/5').version, 'y')
+        self.assertEqual(self.node._dirty_nodes, {})
+
+    def test_nested_container(self):
+        from voltha.protos.device_pb2 import Device, Port
+        self.node.add('/devices', Device(id='d1'))
+        proxy = self.node.get_proxy('/devices/d1')
+        proxy.bulk('/ports', [('add', Port(port_no=p)) for p in xrange(3)])
+        proxy.bulk('/ports', [('remove', 1),
+                              ('update', Port(port_no=2, label='x'))])
+        self.assertEqual([(p.port_no, p.label)
+                          for p in self.node.get('/devices/d1/ports')],
+                         [(0, ''), (2, 'x')])
+
+    def test_all_or_nothing(self):
+        proxy = self.node.get_proxy('/')
+        hash_before = self.node.latest.hash
+        for ops in ([('add', Adapter(id='7')), ('remove', '42')],
+                    [('add', Adapter(id='7')), ('replace', Adapter(id='1'))],
+                    [('add', Adapter(id='7')), ('add', Adapter(id='7'))]):
+            self.assertRaises((KeyError, ValueError), proxy.bulk,
+                              '/adapters', ops)
+            self.assertEqual(self.node.latest.hash, hash_before)
+        self.assertEqual(self.node._dirty_nodes, {})
+        self.assertRaises(ValueError, proxy.bulk, '/',
+                          [('add', Adapter(id='7'))])
+
+    def test_callbacks_are_delivered_after_all_changes(self):
+        proxy = self.node.get_proxy('/')
+        pre_add = Mock()
+        seen = []
+
+        def post_add(data):
+            # all changes are visible to post callbacks
+            seen.append((data.id, self.ids()))
+
+        proxy.register_callback(CallbackType.PRE_ADD, pre_add)
+        proxy.register_callback(CallbackType.POST_ADD, post_add)
+        proxy.bulk('/adapters', [('add', Adapter(id=str(i)))
+                                 for i in xrange(5, 8)])
+        self.assertEqual(pre_add.call_count, 3)
+        final = ['0', '1', '2', '3', '4', '5', '6', '7']
+        self.assertEqual(seen, [('5', final), ('6', final), ('7', final)])
+
+
+class TestBulkPerformance(TestCase):
+    """
+    Prints the time to insert ONU devices into the config tree one by one,
+    and in a single bulk operation, with and without persistence.
+    """
+
+    n_devices = 1000
+
+    def test_bulk_insertion(self):
+        from voltha.protos.device_pb2 import Device
+
+        devices = [Device(id='%012x' % i, type='simulated_onu',
+                          parent_id='olt', serial_number='SIM%08d' % i)
+                   for i in xrange(self.n_devices)]
+
+        def one_by_one(root):
+            for device in devices:
+                root.add('/devices', device)
+
+        def in_bulk(root):
+            root.bulk('/devices', [('add', device) for device in devices])
+
+        print
+        print '%12s %16s %16s %12s' % (
+            'kv store', 'one by one [s]', 'bulk [s]', 'blobs')
+        for kv_store_cls in (None, dict):
+            results = []
+            for insert in (one_by_one, in_bulk):
+                kv_store = kv_store_cls and kv_store_cls()
+                root = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+                t0 = time()
+                insert(root)
+                results.append((time() - t0, kv_store and len(kv_store)))
+                self.assertEqual(len(root.get('/devices')), self.n_devices)
+            print '%12s %16.3f %16.3f %12s' % (
+                'none' if kv_store_cls is None else 'dict',
+                results[0][0], results[1][0],
+                '%s / %s' % (results[0][1], results[1][1]))
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,202 @@
+from random import randint, seed, shuffle
+from time import time
+from unittest import main, TestCase
+
+from voltha.core.config.config_children import KeyedChildren
+from voltha.core.config.config_root import ConfigRoot
+from voltha.protos import third_party
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter
+
+
+class MockRev(object):
+    """Just enough of a ConfigRevision for KeyedChildren"""
+
+    class _Config(object):
+        def __init__(self, data):
+            self._data = data
+
+    def __init__(self, id, version=''):
+        self._config = self._Config(Adapter(id=id, version=version))
+        self._hash = str('%s:%s' % (id, version))
+
+
+def ids(children):
+    return [rev._config._data.id for rev in children]
+
+
+class TestKeyedChildren(TestCase):
+
+    def setUp(self):
+        self.revs = [MockRev(str(i)) for i in xrange(10)]
+        self.children = KeyedChildren('id', self.revs)
+
+    def test_order_and_positional_access(self):
+        self.assertEqual(len(self.children), 10)
+        self.assertEqual(list(self.children), self.revs)
+        for i in xrange(10):
+            self.assertIs(self.children[i], self.revs[i])
+        self.assertIs(self.children[-1], self.revs[-1])
+        self.assertRaises(IndexError, self.children.__getitem__, 10)
+
+    def test_lookup_by_key(self):
+        for rev in self.revs:
+            self.assertIs(self.children.by_key(rev._config._data.id), rev)
+        self.assertRaises(KeyError, self.children.by_key, '42')
+
+    def test_reject_duplicate_keys(self):
+        self.assertRaises(ValueError, KeyedChildren, 'id',
+                          [MockRev('1'), MockRev('2'), MockRev('1')])
+        self.assertRaises(ValueError, self.children.append, MockRev('3'))
+
+    def test_modifiers_do_not_change_original(self):
+        new_rev = MockRev('3', 'changed')
+        replaced = self.children.replace(new_rev)
+        appended = self.children.append(MockRev('10'))
+        removed = self.children.remove('3')
+
+        self.assertEqual(list(self.children), self.revs)
+        self.assertIs(replaced.by_key('3'), new_rev)
+        self.assertEqual(ids(replaced), ids(self.children))
+        self.assertEqual(ids(appended)[-1], '10')
+        self.assertEqual(len(appended), 11)
+        self.assertEqual(ids(removed), [str(i) for i in xrange(10) if i != 3])
+        self.assertRaises(KeyError, removed.by_key, '3')
+        self.assertRaises(KeyError, self.children.replace, MockRev('42'))
+        self.assertRaises(KeyError, self.children.remove, '42')
+
+    def test_equality(self):
+        self.assertEqual(self.children, KeyedChildren('id', self.revs))
+        self.assertNotEqual(self.children, self.children.remove('1'))
+        self.assertNotEqual(
+            self.children, self.children.replace(MockRev('1', 'changed')))
+        self.assertEqual(
+            self.children, self.children.remove('9').append(MockRev('9')))
+
+    def test_merkle_digest(self):
+        digest = self.children.hash
+        self.assertEqual(KeyedChildren('id').hash, '')
+        self.assertEqual(KeyedChildren('id', self.revs).hash, digest)
+
+        # any change in content or order shall change the digest
+        changed = self.children.replace(MockRev('5', 'changed'))
+        self.assertNotEqual(changed.hash, digest)
+        self.assertNotEqual(
+            KeyedChildren('id', list(reversed(self.revs))).hash, digest)
+
+        # returning to the same content restores the digest
+        self.assertEqual(changed.replace(self.revs[5]).hash, digest)
+        self.assertEqual(
+            self.children.remove('0').remove('9').append(
+                self.revs[9]).hash,
+            KeyedChildren('id', self.revs[1:]).hash)
+
+    def test_changed_since(self):
+        known = []
+        self.assertEqual(
+            sorted(self.children.changed_since(set(), known)),
+            sorted(self.revs))
+        self.assertEqual(len(known), 10)
+
+        # only the replaced child (and its ancestors) are new
+        new_rev = MockRev('5', 'changed')
+        changed = self.children.replace(new_rev)
+        visited = []
+        revs = changed.changed_since(set(known), visited)
+        self.assertIn(new_rev, revs)
+        self.assertLess(len(revs), 10)
+        self.assertEqual(len(visited), len(revs))
+
+    def test_random_operations_against_list(self):
+        seed(0)
+        children = KeyedChildren('id')
+        reference = []
+        next_id = 0
+        for _ in xrange(2000):
+            op = randint(0, 2)
+            if op == 0 or not reference:
+                rev = MockRev(str(next_id))
+                next_id += 1
+                children = children.append(rev)
+                reference.append(rev)
+            elif op == 1:
+                idx = randint(0, len(reference) - 1)
+                rev = MockRev(reference[idx]._config._data.id, str(randint(0, 9)))
+                children = children.replace(rev)
+                reference[idx] = rev
+            else:
+                idx = randint(0, len(reference) - 1)
+                children = children.remove(reference[idx]._config._data.id)
+                del reference[idx]
+            self.assertEqual(len(children), len(reference))
+        self.assertEqual(list(children), reference)
+        self.assertEqual(children, KeyedChildren('id', reference))
+
+    def test_shape_is_history_independent(self):
+        revs = [MockRev(str(i)) for i in xrange(100)]
+        shuffled = list(revs)
+        shuffle(shuffled)
+        children = KeyedChildren('id', shuffled)
+        for rev in shuffled:
+            children = children.remove(rev._config._data.id)
+        for rev in revs:
+            children = children.append(rev)
+
+        def shape(node):
+            if node is None:
+                return None
+            return node.rev._hash, shape(node.left), shape(node.right)
+
+        self.assertEqual(shape(children._root),
+                         shape(KeyedChildren('id', revs)._root))
+
+
+class TestKeyedChildrenScaling(TestCase):
+    """
+    Prints the per-operation cost of keyed access to a container field as
+    the number of children grows. Cost should grow at most logarithmically.
+    """
+
+    sizes = (10, 100, 1000, 10000, 100000)
+    n_ops = 50
+
+    def measure(self, f, n):
+        t0 = time()
+        for i in xrange(n):
+            f(i)
+        return 1e6 * (time() - t0) / n
+
+    def test_keyed_access_scaling(self):
+        print
+        print '%8s %12s %12s %12s %12s' % (
+            'children', 'get [us]', 'update [us]', 'add [us]', 'remove [us]')
+        for size in self.sizes:
+            root = ConfigRoot(VolthaInstance(adapters=[
+                Adapter(id=str(i)) for i in xrange(size)]))
+            step = max(1, size / self.n_ops)
+
+            def get(i):
+                root.get('/adapters/%d' % (i * step % size))
+
+            def update(i):
+                key = str(i * step % size)
+                root.update('/adapters/' + key,
+                            Adapter(id=key, version=str(i)))
+
+            def add(i):
+                root.add('/adapters', Adapter(id='new%d' % i))
+
+            def remove(i):
+                root.remove('/adapters/new%d' % i)
+
+            print '%8d %12.2f %12.2f %12.2f %12.2f' % (
+                size,
+                self.measure(get, self.n_ops),
+                self.measure(update, self.n_ops),
+                self.measure(add, self.n_ops),
+                self.measure(remove, self.n_ops))
+
+            self.assertEqual(len(root.latest._children['adapters']), size)
+
+
+if __name__ == '__main__':
+    main()
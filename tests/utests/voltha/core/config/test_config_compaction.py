@@ -0,0 +1,113 @@
+from unittest import main, TestCase
+
+from twisted.internet.task import Clock
+
+from voltha.core.config.config_compaction import KVStoreCompactor
+from voltha.core.config.config_root import ConfigRoot
+from voltha.core.config.config_write_behind import Durability
+from voltha.protos import third_party
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig
+
+
+def mk_adapter(i, version='1'):
+    return Adapter(id=str(i), vendor='cord', version=version,
+                   config=AdapterConfig(log_level=0))
+
+
+class TestKVStoreCompactor(TestCase):
+
+    def mk_root(self, n_adapters=10, **kw):
+        self.kv_store = dict()
+        root = ConfigRoot(VolthaInstance(), kv_store=self.kv_store, **kw)
+        for i in xrange(n_adapters):
+            root.add('/adapters', mk_adapter(i))
+        return root
+
+    def assertLoadable(self, root):
+        loaded = ConfigRoot.load(VolthaInstance, dict(self.kv_store),
+                                 lazy=False)
+        self.assertEqual(loaded.get('/', deep=1), root.get('/', deep=1))
+
+    def test_reclaims_superseded_revisions(self):
+        root = self.mk_root()
+        for version in xrange(2, 10):
+            root.update('/adapters/3', mk_adapter(3, str(version)))
+        root.prune_untagged()
+        size = len(self.kv_store)
+
+        compactor = KVStoreCompactor(root, clock=Clock())
+        compactor.run()
+        metrics = compactor.metrics()
+        self.assertGreater(metrics['reclaimed_blobs'], 0)
+        self.assertGreater(metrics['reclaimed_bytes'], 0)
+        self.assertEqual(len(self.kv_store),
+                         size - metrics['reclaimed_blobs'])
+        self.assertLoadable(root)
+
+        # nothing left to reclaim
+        compactor.run()
+        self.assertEqual(compactor.metrics()['last_reclaimed_blobs'], 0)
+
+    def test_bounded_work_per_tick(self):
+        root = self.mk_root(n_adapters=100)
+        for i in xrange(0, 100, 2):
+            root.update('/adapters/%d' % i, mk_adapter(i, '2'))
+        root.prune_untagged()
+
+        clock = Clock()
+        compactor = KVStoreCompactor(root, interval=60, tick_interval=0.1,
+                                     work_per_tick=20, clock=clock).start()
+        clock.advance(60)
+        self.assertEqual(compactor.metrics()['phase'], 'mark')
+        while compactor.metrics()['cycles'] == 0:
+            # the tree may change between ticks
+            root.update('/adapters/1', mk_adapter(1, str(clock.seconds())))
+            clock.advance(0.1)
+        compactor.stop()
+        self.assertGreater(compactor.ticks, 10)
+        # superseded adapter revisions and configs, and root revisions
+        self.assertGreaterEqual(compactor.reclaimed_blobs, 50 * 2 + 149)
+        self.assertLoadable(root)
+
+    def test_open_transactions_are_kept(self):
+        root = self.mk_root()
+        txid = root.mk_txbranch()
+        root.update('/adapters/5', mk_adapter(5, 'tx'), txid=txid)
+        KVStoreCompactor(root, clock=Clock()).run()
+        root.fold_txbranch(txid)
+        self.assertLoadable(root)
+
+    def test_persisted_root_of_write_behind_is_kept(self):
+        clock = Clock()
+        root = self.mk_root(durability=Durability.PER_INTERVAL, clock=clock)
+        root.flush()
+        persisted = ConfigRoot.load(VolthaInstance, dict(self.kv_store))
+
+        # not flushed yet, the kv store must stay loadable nevertheless
+        root.update('/adapters/1', mk_adapter(1, '2'))
+        root.flush()
+        root.update('/adapters/1', mk_adapter(1, '3'))
+        root.prune_untagged()
+        KVStoreCompactor(root, clock=clock).run()
+        loaded = ConfigRoot.load(VolthaInstance, dict(self.kv_store))
+        self.assertEqual(loaded.get('/adapters/1').version, '2')
+        self.assertNotEqual(loaded.get('/', deep=1),
+                            persisted.get('/', deep=1))
+
+        # blobs deleted are written again when needed
+        root.update('/adapters/1', mk_adapter(1, '1'))
+        root.flush()
+        self.assertLoadable(root)
+
+    def test_unloaded_children_are_kept(self):
+        root = self.mk_root()
+        del root
+        root = ConfigRoot.load(VolthaInstance, self.kv_store)
+        KVStoreCompactor(root, clock=Clock()).run()
+        # the adapters were not loaded by compaction
+        self.assertIsNotNone(root.latest._children.pending('adapters'))
+        self.assertLoadable(root)
+
+
+if __name__ == '__main__':
+    main()
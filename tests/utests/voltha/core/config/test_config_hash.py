@@ -0,0 +1,152 @@
+from hashlib import md5
+from time import time
+from unittest import main, TestCase
+
+from voltha.core.config import config_hash, config_record
+from voltha.core.config.config_rev import ConfigDataRevision
+from voltha.core.config.config_root import ConfigRoot
+from voltha.core.flow_decomposer import mk_flow_stat, in_port, vlan_vid, \
+    eth_type, output, push_vlan, set_field
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device, Port
+from voltha.protos.openflow_13_pb2 import Flows, OFPVID_PRESENT
+from voltha.protos.voltha_pb2 import VolthaInstance
+
+
+def legacy_hash_data(data):
+    """The way config data used to be hashed, for comparison"""
+    return md5(':'.join((
+        data.__class__.__module__,
+        data.__class__.__name__,
+        data.SerializeToString()))).hexdigest()[:12]
+
+
+def mk_device(i):
+    return Device(
+        id='%012x' % i,
+        type='broadcom_onu',
+        root=False,
+        parent_id='olt',
+        parent_port_no=1,
+        vendor='Broadcom',
+        model='n/a',
+        hardware_version='to be filled',
+        firmware_version='to be filled',
+        software_version='1.0',
+        serial_number='BRCM%08d' % i,
+        adapter='broadcom_onu',
+        vlan=1000 + i,
+        admin_state=3,
+        oper_status=4,
+        connect_status=2,
+        proxy_address=Device.ProxyAddress(
+            device_id='olt', channel_id=i)
+    )
+
+
+def mk_port(i):
+    return Port(
+        port_no=i,
+        label='uni-%d' % i,
+        type=Port.ETHERNET_UNI,
+        admin_state=3,
+        oper_status=4,
+        device_id='onu%d' % i,
+        peers=[Port.PeerPort(device_id='olt', port_no=1)]
+    )
+
+
+def mk_flows(n):
+    return Flows(items=[
+        mk_flow_stat(
+            priority=1000,
+            match_fields=[in_port(i), vlan_vid(OFPVID_PRESENT | i),
+                          eth_type(0x800)],
+            actions=[push_vlan(0x8100),
+                     set_field(vlan_vid(OFPVID_PRESENT | 4000)),
+                     output(0)]
+        ) for i in xrange(n)])
+
+
+class TestConfigHash(TestCase):
+
+    def tearDown(self):
+        config_hash.hash_blobs = self.saved_hash_function
+
+    def setUp(self):
+        self.saved_hash_function = config_hash.hash_blobs
+
+    def test_set_hash_function(self):
+        config_hash.set_hash_function('md5')
+        self.assertEqual(config_hash.get_hash_function_name(), 'md5')
+        self.assertRaises(ValueError, config_hash.set_hash_function, 'crc8')
+
+    def test_md5_compatible_with_legacy_hashes(self):
+        config_hash.set_hash_function('md5')
+        for data in (mk_device(1), mk_port(2), mk_flows(3)):
+            self.assertEqual(ConfigDataRevision(data).hash,
+                             legacy_hash_data(data))
+
+    def test_hash_depends_on_type(self):
+        # both are empty messages, hence serialize the same
+        for name in config_hash.hash_functions:
+            config_hash.set_hash_function(name)
+            self.assertNotEqual(ConfigDataRevision(Device()).hash,
+                                ConfigDataRevision(Port()).hash)
+
+    def test_serialized_data_is_reused_for_persistence(self):
+        kv_store = dict()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        device = mk_device(1)
+        root.add('/devices', device)
+        rev = root.latest._children['devices'][0]
+        self.assertEqual(
+            config_record.decode_config(kv_store[rev._config.hash]),
+            device.SerializeToString())
+        # the serialized form is not held once persisted
+        self.assertIsNone(rev._config._serialized)
+
+    def test_hashing_performance(self):
+        samples = (
+            ('Device', [mk_device(i) for i in xrange(100)]),
+            ('Port', [mk_port(i) for i in xrange(100)]),
+            ('Flows[100]', [mk_flows(100) for _ in xrange(10)]),
+        )
+        n = 20
+
+        def measure(f, msgs):
+            t0 = time()
+            for _ in xrange(n):
+                for msg in msgs:
+                    f(msg)
+            return 1e6 * (time() - t0) / n / len(msgs)
+
+        def persisted_legacy(msg):
+            # hashing and storing used to serialize twice
+            legacy_hash_data(msg)
+            msg.SerializeToString()
+
+        def persisted(msg):
+            # now the serialization done for hashing is stored
+            ConfigDataRevision._hash_data(msg)
+
+        names = sorted(config_hash.hash_functions)
+        print
+        print '%12s %12s' % ('us per msg', 'legacy') + ''.join(
+            '%12s' % name for name in names) + \
+            '%18s %18s' % ('legacy+store', 'current+store')
+        for label, msgs in samples:
+            timings = [measure(legacy_hash_data, msgs)]
+            for name in names:
+                config_hash.set_hash_function(name)
+                timings.append(measure(ConfigDataRevision._hash_data, msgs))
+            config_hash.hash_blobs = self.saved_hash_function
+            timings.append(measure(persisted_legacy, msgs))
+            timings.append(measure(persisted, msgs))
+            print '%12s' % label + ''.join(
+                '%12.2f' % t for t in timings[:-2]) + \
+                '%18.2f %18.2f' % tuple(timings[-2:])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+from bz2 import compress
+from time import time
+from unittest import main, skipIf, TestCase
+
+from simplejson import dumps, loads
+
+from voltha.core.config import config_record
+from voltha.core.config.config_compaction import KVStoreCompactor
+from voltha.core.config.config_rev import children_fields, lookup_type
+from voltha.core.config.config_root import ConfigRoot
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device, Port
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig
+
+from twisted.internet.task import Clock
+
+
+def mk_devices(n, n_ports=2):
+    return [Device(
+        id='%012x' % i,
+        type='simulated_onu',
+        root=False,
+        parent_id='olt',
+        serial_number='SIM%08d' % i,
+        vlan=1000 + i % 3000,
+        ports=[Port(port_no=p, label='uni-%d' % p, type=Port.ETHERNET_UNI)
+               for p in xrange(n_ports)]
+    ) for i in xrange(n)]
+
+
+def mk_root(kv_store, n_devices=100):
+    root = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+    for i in xrange(10):
+        root.add('/adapters', Adapter(
+            id=str(i), vendor='cord', config=AdapterConfig(log_level=0)))
+    for device in mk_devices(n_devices):
+        root.add('/devices', device)
+    return root
+
+
+def walk(kv_store, root_msg_cls):
+    """Yield hash and record of each revision persisted in kv_store"""
+    stack = [(loads(kv_store['root'])['latest'], root_msg_cls)]
+    visited = set()
+    while stack:
+        hash, msg_cls = stack.pop()
+        if hash in visited:
+            continue
+        visited.add(hash)
+        record = config_record.decode_record(kv_store[hash], msg_cls)
+        yield hash, record
+        for field_name, meta in children_fields(msg_cls).iteritems():
+            child_msg_cls = lookup_type(meta.module, meta.type)
+            stack.extend((child_hash, child_msg_cls)
+                         for child_hash in record['children'][field_name])
+
+
+def to_legacy(kv_store, root_msg_cls, bz2=False):
+    """Rewrite a kv store as written before the binary record format"""
+    configs = set()
+    for hash, record in list(walk(kv_store, root_msg_cls)):
+        blob = dumps(dict(config=record['config'],
+                          children=record['children'],
+                          digests=record['digests']))
+        kv_store[hash] = compress(blob) if bz2 else blob
+        if record['config'] not in configs:
+            configs.add(record['config'])
+            config_blob = config_record.decode_config(
+                kv_store[record['config']])
+            kv_store[record['config']] = \
+                compress(config_blob) if bz2 else config_blob
+
+
+def forget_dictionaries():
+    """As in a process that did not train or load any dictionary"""
+    config_record._dictionaries.clear()
+    config_record._dictionary_data.clear()
+    config_record._decompressors.clear()
+
+
+class TestConfigRecord(TestCase):
+
+    def tearDown(self):
+        config_record.set_codec('none')
+        forget_dictionaries()
+
+    def assertLoadable(self, root, kv_store):
+        for lazy in (False, True):
+            loaded = ConfigRoot.load(VolthaInstance, kv_store, lazy=lazy)
+            self.assertEqual(loaded.get('/', deep=1), root.get('/', deep=1))
+
+    def test_record_round_trip(self):
+        h = lambda i: '%032x' % i
+        children = dict(devices=[h(1), h(2), h(3)], adapters=[],
+                        device_types=[h(4)])
+        digests = dict(devices=h(5), adapters='')
+        blob = config_record.encode_record(
+            VolthaInstance, h(0), children, digests)
+        self.assertEqual(len(blob), 3 + 1 + 16 + 1 + 3 * 3 + 4 * 16 + 16)
+
+        record = config_record.decode_record(blob, VolthaInstance)
+        self.assertEqual(record, dict(config=h(0), children=children,
+                                      digests=digests))
+        self.assertNotIn('legacy', record)
+
+        # fields are told by number without message class
+        numbers = dict((f.name, f.number) for f in
+                       VolthaInstance.DESCRIPTOR.fields)
+        record = config_record.decode_record(blob)
+        self.assertEqual(record['children'][numbers['devices']],
+                         children['devices'])
+
+    def test_config_round_trip(self):
+        serialized = mk_devices(1)[0].SerializeToString()
+        for codec in config_record.codecs:
+            config_record.set_codec(codec)
+            blob = config_record.encode_config(serialized)
+            self.assertTrue(blob.startswith('\x00'))
+            self.assertEqual(config_record.decode_config(blob), serialized)
+        self.assertRaises(ValueError, config_record.set_codec, 'lzma')
+
+    def test_load_from_legacy_store(self):
+        for bz2 in (False, True):
+            kv_store = dict()
+            root = mk_root(kv_store)
+            to_legacy(kv_store, VolthaInstance, bz2)
+            self.assertTrue(kv_store[root.latest.hash].startswith(
+                'BZh' if bz2 else '{'))
+            self.assertLoadable(root, kv_store)
+
+    def test_online_migration(self):
+        kv_store = dict()
+        root = mk_root(kv_store)
+        to_legacy(kv_store, VolthaInstance, bz2=True)
+        loaded = ConfigRoot.load(VolthaInstance, kv_store)
+
+        migration = config_record.migrate(kv_store, VolthaInstance,
+                                          batch_size=10)
+        migration.next()
+        # the tree can be changed (and written) while migrating
+        loaded.update('/adapters/3', Adapter(id='3', vendor='changed'))
+        root.update('/adapters/3', Adapter(id='3', vendor='changed'))
+        rewritten = list(migration)[-1]
+        # record and config of root, adapters, devices and (old) adapter 3
+        self.assertGreaterEqual(rewritten, 2 * (1 + 10 + 100))
+
+        self.assertTrue(all(blob.startswith('\x00')
+                            for key, blob in kv_store.iteritems()
+                            if key != 'root'))
+        self.assertLoadable(root, kv_store)
+        self.assertEqual(list(config_record.migrate(
+            kv_store, VolthaInstance))[-1], 0)
+
+    @skipIf('zstd' not in config_record.codecs, 'zstd not available')
+    def test_zstd_dictionary_is_persisted(self):
+        dictionary = config_record.train_dictionary(
+            [d.SerializeToString() for d in mk_devices(1000)], 4096)
+        config_record.set_codec('zstd', dictionary=dictionary)
+        kv_store = dict()
+        root = mk_root(kv_store)
+        dict_id = loads(kv_store['root'])['dictionaries'][0]
+        self.assertEqual(kv_store[config_record.dictionary_key(dict_id)],
+                         dictionary)
+
+        # dictionaries are not swept by compaction
+        KVStoreCompactor(root, clock=Clock()).run()
+        self.assertIn(config_record.dictionary_key(dict_id), kv_store)
+
+        forget_dictionaries()
+        config_record.set_codec('none')
+        self.assertLoadable(root, kv_store)
+
+
+class TestConfigRecordPerformance(TestCase):
+    """
+    Prints the size of a persisted tree of devices, and the time to load
+    it, in the former (JSON) format and in the binary format per codec.
+    """
+
+    n_devices = 300  # kept small to keep the unit suite fast
+
+    def tearDown(self):
+        config_record.set_codec('none')
+        forget_dictionaries()
+
+    def measure(self, name, kv_store):
+        records = 0
+        config_hashes = set()
+        for hash, record in walk(kv_store, VolthaInstance):
+            records += len(kv_store[hash])
+            config_hashes.add(record['config'])
+        configs = sum(len(kv_store[hash]) for hash in config_hashes)
+        t0 = time()
+        root = ConfigRoot.load(VolthaInstance, kv_store, lazy=False)
+        load_time = time() - t0
+        self.assertEqual(len(root.get('/devices')), self.n_devices)
+        print '%-12s %12d %12d %12.3f' % (name, records, configs, load_time)
+
+    def test_size_and_load_time(self):
+        devices = mk_devices(self.n_devices)
+        samples = [d.SerializeToString() for d in devices]
+
+        def populate():
+            kv_store = dict()
+            root = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+            for device in devices:
+                root.add('/devices', device)
+            return kv_store
+
+        print
+        print '%-12s %12s %12s %12s' % (
+            'format', 'records [B]', 'configs [B]', 'load [s]')
+        kv_store = populate()
+        to_legacy(kv_store, VolthaInstance)
+        self.measure('json', kv_store)
+
+        codecs = [('none', None), ('zlib', None)]
+        if 'zstd' in config_record.codecs:
+            codecs.extend([
+                ('zstd', None),
+                ('zstd+dict', config_record.train_dictionary(samples))])
+        for name, dictionary in codecs:
+            config_record.set_codec(name.split('+')[0], dictionary=dictionary)
+            self.measure(name, populate())
+
+
+if __name__ == '__main__':
+    main()
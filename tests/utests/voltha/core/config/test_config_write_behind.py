@@ -0,0 +1,179 @@
+from time import time
+from unittest import main, TestCase
+
+from twisted.internet.task import Clock
+
+from voltha.core.config.config_root import ConfigRoot
+from voltha.core.config.config_write_behind import Durability
+from voltha.protos import third_party
+from voltha.protos.voltha_pb2 import VolthaInstance, Adapter, AdapterConfig, \
+    HealthStatus
+
+
+class CountingStore(dict):
+    """In-memory kv store that counts writes and batches"""
+
+    def __init__(self):
+        super(CountingStore, self).__init__()
+        self.puts = 0
+        self.batches = 0
+
+    def __setitem__(self, key, value):
+        self.puts += 1
+        super(CountingStore, self).__setitem__(key, value)
+
+    def update(self, items):
+        self.batches += 1
+        for key, value in items.iteritems():
+            self[key] = value
+
+
+class UnbatchedStore(object):
+    """Minimal kv store without batch support"""
+
+    def __init__(self):
+        self.data = {}
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+
+
+def mk_adapter(i, version='1'):
+    return Adapter(id=str(i), vendor='cord', version=version,
+                   config=AdapterConfig(log_level=0))
+
+
+class TestWriteBehind(TestCase):
+
+    def test_per_commit_writes_one_batch_per_change(self):
+        kv_store = CountingStore()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                          durability=Durability.PER_COMMIT)
+        batches, puts = kv_store.batches, kv_store.puts
+        root.add('/adapters', mk_adapter(1))
+        self.assertEqual(kv_store.batches, batches + 1)
+        # root rev, adapter rev and adapter config, plus 'root'
+        self.assertEqual(kv_store.puts, puts + 4)
+        self.assertEqual(root.persistence_metrics()['lag'], 0)
+
+    def test_transaction_intermediates_are_not_written(self):
+        kv_store = CountingStore()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                          durability=Durability.PER_COMMIT)
+        root.add('/adapters', mk_adapter(1))
+        puts = kv_store.puts
+
+        txid = root.mk_txbranch()
+        for version in ('2', '3', '4', '5'):
+            root.update('/adapters/1', mk_adapter(1, version), txid=txid)
+        self.assertEqual(kv_store.puts, puts)
+        root.fold_txbranch(txid)
+
+        # new root rev, adapter rev and adapter config, plus 'root'
+        self.assertEqual(kv_store.puts, puts + 4)
+
+        loaded = ConfigRoot.load(VolthaInstance, dict(kv_store))
+        self.assertEqual(loaded.get('/adapters/1').version, '5')
+
+    def test_per_interval_coalesces_commits(self):
+        kv_store = CountingStore()
+        clock = Clock()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                          durability=Durability.PER_INTERVAL,
+                          flush_interval=0.5, clock=clock)
+        clock.advance(0.5)
+        self.assertEqual(kv_store.batches, 1)
+        blobs = root.persistence_metrics()['blobs_written']
+
+        for i in xrange(10):
+            root.add('/adapters', mk_adapter(i))
+            root.update('/adapters/%d' % i, mk_adapter(i, '2'))
+        clock.advance(0.2)
+        metrics = root.persistence_metrics()
+        self.assertEqual(kv_store.batches, 1)
+        self.assertEqual(metrics['pending_commits'], 20)
+        self.assertAlmostEqual(metrics['lag'], 0.2)
+
+        clock.advance(0.3)
+        self.assertEqual(kv_store.batches, 2)
+        self.assertEqual(root.persistence_metrics()['pending_commits'], 0)
+        self.assertAlmostEqual(root.persistence_metrics()['max_lag'], 0.5)
+
+        # only the latest revisions were written: 1 root rev, 10 adapter
+        # revs and 10 adapter configs, plus 'root'
+        self.assertEqual(root.persistence_metrics()['blobs_written'],
+                         blobs + 22)
+
+        loaded = ConfigRoot.load(VolthaInstance, dict(kv_store))
+        self.assertEqual(loaded.get('/', deep=1), root.get('/', deep=1))
+
+    def test_explicit_flush(self):
+        kv_store = CountingStore()
+        clock = Clock()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                          durability=Durability.PER_INTERVAL, clock=clock)
+        root.update('/health', HealthStatus(state=HealthStatus.OVERLOADED))
+        root.flush()
+        self.assertEqual(clock.getDelayedCalls(), [])
+        loaded = ConfigRoot.load(VolthaInstance, dict(kv_store))
+        self.assertEqual(loaded.get('/health').state, HealthStatus.OVERLOADED)
+
+        # nothing pending, nothing to write
+        batches = kv_store.batches
+        root.flush()
+        self.assertEqual(kv_store.batches, batches)
+
+    def test_store_without_batch_support(self):
+        kv_store = UnbatchedStore()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                          durability=Durability.PER_COMMIT)
+        root.add('/adapters', mk_adapter(1))
+        loaded = ConfigRoot.load(VolthaInstance, dict(kv_store.data))
+        self.assertEqual(loaded.get('/adapters/1'), mk_adapter(1))
+
+    def test_load_with_write_behind(self):
+        kv_store = CountingStore()
+        root = ConfigRoot(VolthaInstance(), kv_store=kv_store)
+        root.add('/adapters', mk_adapter(1))
+
+        loaded = ConfigRoot.load(VolthaInstance, kv_store,
+                                 durability=Durability.PER_COMMIT)
+        self.assertEqual(loaded.persistence_metrics()['commits'], 0)
+        loaded.add('/adapters', mk_adapter(2))
+        # flushing did not need to load untouched parts of the tree
+        self.assertIsNotNone(loaded.latest._children.pending('devices'))
+        self.assertEqual(loaded.persistence_metrics()['blobs_written'], 4)
+        reloaded = ConfigRoot.load(VolthaInstance, dict(kv_store))
+        self.assertEqual(len(reloaded.get('/adapters')), 2)
+
+    def test_durability_performance(self):
+        n_adapters = 500
+        n_updates = 4
+
+        print
+        print '%14s %10s %10s %10s' % ('durability', 'ms', 'puts', 'batches')
+        for durability in Durability:
+            kv_store = CountingStore()
+            clock = Clock()
+            root = ConfigRoot(VolthaInstance(), kv_store=kv_store,
+                              durability=durability, clock=clock)
+            t0 = time()
+            for i in xrange(n_adapters):
+                root.add('/adapters', mk_adapter(i))
+                for j in xrange(n_updates):
+                    root.update('/adapters/%d' % i, mk_adapter(i, str(j)))
+                clock.advance(0.01)
+            root.flush()
+            dt = 1000 * (time() - t0)
+            print '%14s %10.1f %10d %10d' % (
+                durability.name, dt, kv_store.puts, kv_store.batches)
+
+
+if __name__ == '__main__':
+    main()
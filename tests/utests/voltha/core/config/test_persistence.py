@@ -1,9 +1,16 @@
+import gc
 from copy import copy
 from random import randint, seed
 from time import time
 from unittest import main, TestCase
 
+from twisted.internet.task import Clock
+
+from voltha.core.config import config_hash
+from voltha.core.config.config_children import LazyChildren
+from voltha.core.config.config_compaction import KVStoreCompactor
 from voltha.core.config.config_root import ConfigRoot
+from voltha.protos.device_pb2 import Device, Port
 from voltha.protos.openflow_13_pb2 import ofp_desc
 from voltha.protos.voltha_pb2 import VolthaInstance, HealthStatus, Adapter, \
     AdapterConfig, LogicalDevice
@@ -62,12 +69,16 @@ class TestPersistence(TestCase):
         size1 = len(kv_store)
         self.assertEqual(size1, 14 + 3 * (n_adapters + n_logical_nodes))
 
-        # this should actually drop if we pune
+        # this should actually drop if we pune and compact
         node.prune_untagged()
         pt('prunning')
+        KVStoreCompactor(node, clock=Clock()).run()
+        pt('compaction')
 
+        # only what is reachable is left (revision finalizers used to
+        # leave two unreachable blobs of empty config data behind)
         size2 = len(kv_store)
-        self.assertEqual(size2, 7 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
+        self.assertEqual(size2, 5 + 2 * (1 + 1 + n_adapters + n_logical_nodes))
         all_latest_data = node.get('/', deep=1)
         pt('deep get')
 
@@ -85,5 +96,120 @@ class TestPersistence(TestCase):
         pt('deep get')
 
 
+class CountingStore(dict):
+    """In-memory kv store counting read requests, optionally bulk capable"""
+
+    def __init__(self, other=(), bulk=False):
+        super(CountingStore, self).__init__(other)
+        self.reads = 0
+        if bulk:
+            self.get_many = self._get_many
+
+    def __getitem__(self, key):
+        self.reads += 1
+        return super(CountingStore, self).__getitem__(key)
+
+    def _get_many(self, keys):
+        self.reads += 1
+        return [dict.__getitem__(self, key) for key in keys]
+
+
+def mk_devices(n, n_ports=2):
+    return [Device(
+        id='%012x' % i,
+        type='simulated_onu',
+        root=False,
+        parent_id='olt',
+        serial_number='SIM%08d' % i,
+        vlan=1000 + i % 3000,
+        ports=[Port(port_no=p, label='uni-%d' % p, type=Port.ETHERNET_UNI)
+               for p in xrange(n_ports)]
+    ) for i in xrange(n)]
+
+
+class TestLazyLoad(TestCase):
+
+    def setUp(self):
+        self.kv_store = dict()
+        self.node = ConfigRoot(VolthaInstance(), kv_store=self.kv_store)
+        TestPersistence.pump_some_data.im_func(self, self.node)
+
+    def tearDown(self):
+        # revisions alive in memory are never compacted away, so do not
+        # keep ours around for other tests
+        del self.node
+        del self.kv_store
+        gc.collect()
+
+    def test_children_are_loaded_on_access(self):
+        kv_store = CountingStore(self.kv_store)
+        root = ConfigRoot.load(VolthaInstance, kv_store)
+        # root record, root rev and root config
+        self.assertEqual(kv_store.reads, 3)
+        self.assertEqual(root.latest.hash, self.node.latest.hash)
+
+        # only the accessed field is loaded, in full
+        self.assertEqual(root.get('/adapters/42'),
+                         self.node.get('/adapters/42'))
+        self.assertEqual(kv_store.reads, 3 + 2 * n_adapters)
+        self.assertEqual(root.get('/', deep=1), self.node.get('/', deep=1))
+
+    def test_bulk_prefetch(self):
+        kv_store = CountingStore(self.kv_store, bulk=True)
+        root = ConfigRoot.load(VolthaInstance, kv_store)
+        reads = kv_store.reads
+        self.assertEqual(len(root.get('/logical_devices')), n_logical_nodes)
+        # one request for revision records, one for config data
+        self.assertEqual(kv_store.reads, reads + 2)
+
+    def test_changes_after_lazy_load(self):
+        root = ConfigRoot.load(VolthaInstance, self.kv_store)
+        root.update('/health', HealthStatus(state=HealthStatus.HEALTHY))
+        root.add('/adapters', Adapter(id='new'))
+        reloaded = ConfigRoot.load(VolthaInstance, self.kv_store)
+        self.assertEqual(reloaded.get('/health').state, HealthStatus.HEALTHY)
+        self.assertEqual(len(reloaded.get('/adapters')), n_adapters + 1)
+        self.assertEqual(reloaded.get('/', deep=1), root.get('/', deep=1))
+
+    def test_eager_load_if_hash_function_differs(self):
+        saved_hash_function = config_hash.hash_blobs
+        try:
+            for name in config_hash.hash_functions:
+                if config_hash.hash_functions[name] is not saved_hash_function:
+                    config_hash.set_hash_function(name)
+                    break
+            root = ConfigRoot.load(VolthaInstance, self.kv_store)
+            self.assertNotIsInstance(root.latest._children, LazyChildren)
+            self.assertEqual(root.get('/', deep=1),
+                             self.node.get('/', deep=1))
+        finally:
+            config_hash.hash_blobs = saved_hash_function
+
+    def test_startup_time(self):
+        n_devices = 10000
+        kv_store = dict()
+        node = ConfigRoot(VolthaInstance(devices=mk_devices(n_devices)),
+                          kv_store=kv_store)
+        device_id = '%012x' % (n_devices / 2)
+        expected = node.get('/devices/' + device_id, deep=1)
+        del node
+
+        print
+        print '%20s %12s %16s %12s' % (
+            '10k devices', 'load [ms]', 'first get [ms]', 'requests')
+        for label, lazy, bulk in (('eager', False, False),
+                                  ('lazy', True, False),
+                                  ('lazy + bulk fetch', True, True)):
+            store = CountingStore(kv_store, bulk=bulk)
+            t0 = time()
+            root = ConfigRoot.load(VolthaInstance, store, lazy=lazy)
+            t1 = time()
+            self.assertEqual(root.get('/devices/' + device_id, deep=1),
+                             expected)
+            t2 = time()
+            print '%20s %12.1f %16.1f %12d' % (
+                label, 1000 * (t1 - t0), 1000 * (t2 - t1), store.reads)
+
+
 if __name__ == '__main__':
     main()
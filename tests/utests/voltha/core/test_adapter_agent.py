@@ -0,0 +1,108 @@
+from time import time
+from unittest import main, TestCase
+
+from google.protobuf.json_format import MessageToJson
+from mock import Mock
+
+from common.event_bus import EventBus, EventBusClient
+from voltha.core import adapter_agent
+from voltha.core.adapter_agent import AdapterAgent, ProxyAddressTopics
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device
+
+
+class EchoingAdapter(object):
+    """Parent and child adapter at once: the parent echoes each message"""
+
+    def __init__(self, agent):
+        self.agent = agent
+        self.received = []
+
+    def send_proxied_message(self, proxy_address, msg):
+        self.agent.receive_proxied_message(proxy_address, msg)
+
+    def receive_proxied_message(self, proxy_address, msg):
+        self.received.append((proxy_address, msg))
+
+
+def mk_proxy_addresses(n):
+    return [Device.ProxyAddress(device_id='%012x' % (i / 64), channel_id=i)
+            for i in xrange(n)]
+
+
+class AgentWithEchoingAdapter(object):
+
+    def setUp(self):
+        adapter_agent.registry = Mock()
+        self.agent = AdapterAgent('echo', None)
+        self.agent.event_bus = EventBusClient(EventBus())
+        self.agent.adapter = EchoingAdapter(self.agent)
+
+    def add_onu(self, proxy_address):
+        self.agent.child_device_detected(
+            parent_device_id=proxy_address.device_id, parent_port_no=1,
+            child_device_type='onu', proxy_address=proxy_address)
+        self.agent.register_for_proxied_messages(proxy_address)
+
+
+class TestProxiedMessages(AgentWithEchoingAdapter, TestCase):
+
+    def test_topics(self):
+        topics = ProxyAddressTopics()
+        address = Device.ProxyAddress(device_id=u'olt1', channel_id=7)
+        rx, tx = topics.get(address)
+        self.assertEqual((rx, tx), ('rx:olt1:7', 'tx:olt1:7'))
+        self.assertIsInstance(rx, str)
+        # made once per address
+        self.assertIs(topics.get(Device.ProxyAddress(
+            device_id='olt1', channel_id=7))[0], rx)
+        self.assertNotEqual(topics.get(Device.ProxyAddress(
+            device_id='olt1', channel_id=8))[0], rx)
+        self.assertEqual(len(topics), 2)
+
+    def test_round_trip(self):
+        addresses = mk_proxy_addresses(3)
+        for address in addresses:
+            self.add_onu(address)
+        for i, address in enumerate(addresses):
+            self.agent.send_proxied_message(address, i)
+        self.assertEqual(self.agent.adapter.received,
+                         [(address, i) for i, address in enumerate(addresses)])
+
+
+class TestProxiedMessagePerformance(AgentWithEchoingAdapter, TestCase):
+    """
+    Prints the rate of proxied (OMCI) message round trips to 1k ONUs, with
+    topics made of the JSON encoded proxy address vs the interned ones.
+    """
+
+    n_onus = 1000
+    n_round_trips = 20000
+
+    def test_round_trip_rate(self):
+        addresses = mk_proxy_addresses(self.n_onus)
+        sent = [addresses[i % self.n_onus]
+                for i in xrange(self.n_round_trips)]
+
+        print
+        print '%8s %8s %16s' % ('topics', 'onus', 'round trips/s')
+        for name in ('json', 'interned'):
+            self.setUp()
+            if name == 'json':
+                self.agent._gen_rx_proxy_address_topic = \
+                    lambda a: 'rx:' + MessageToJson(a)
+                self.agent._gen_tx_proxy_address_topic = \
+                    lambda a: 'tx:' + MessageToJson(a)
+            for address in addresses:
+                self.add_onu(address)
+            t0 = time()
+            for address in sent:
+                self.agent.send_proxied_message(address, None)
+            rate = self.n_round_trips / (time() - t0)
+            self.assertEqual(len(self.agent.adapter.received),
+                             self.n_round_trips)
+            print '%8s %8d %16.0f' % (name, self.n_onus, rate)
+
+
+if __name__ == '__main__':
+    main()
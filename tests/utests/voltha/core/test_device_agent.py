@@ -0,0 +1,170 @@
+from unittest import main, TestCase
+
+from mock import Mock
+from twisted.internet.defer import fail, succeed
+from twisted.internet.task import Clock
+
+from voltha.core.device_agent import DeviceAgent
+from voltha.core.flow_decomposer import *
+from voltha.protos import third_party
+from voltha.protos.device_pb2 import Device, DeviceType
+from voltha.protos.openflow_13_pb2 import Flows, FlowGroups
+
+
+class TestDeviceAgentFlowUpdates(TestCase):
+
+    def mk_agent(self, **capabilities):
+        self.flows = Flows(items=[
+            mk_flow_stat(match_fields=[in_port(1)], actions=[output(2)]),
+            mk_flow_stat(match_fields=[in_port(2)], actions=[output(1)])
+        ])
+        self.groups = FlowGroups()
+        self.device_type = DeviceType(id='olt', **capabilities)
+
+        def get_proxy(path):
+            proxy = Mock()
+            proxy.get = lambda _='/': (
+                self.flows if path.endswith('/flows') else
+                self.groups if path.endswith('/flow_groups') else
+                self.device_type)
+            return proxy
+
+        core = Mock()
+        core.get_proxy = get_proxy
+        agent = DeviceAgent(core, Device(id='olt1', type='olt'))
+        self.clock = agent._flow_push.clock = Clock()
+        agent.last_data = Device(id='olt1', type='olt')
+        agent.adapter_agent = Mock()
+        agent.adapter_agent.update_flows_bulk.return_value = succeed(None)
+        agent.adapter_agent.update_flows_incrementally.return_value = \
+            succeed(None)
+        # pass on the tables already in the model
+        agent._flow_table_updated(self.flows)
+        self.wait()
+        agent.adapter_agent.reset_mock()
+        return agent
+
+    def wait(self):
+        self.clock.advance(DeviceAgent.flow_push_window)
+
+    def change_flows(self):
+        return Flows(items=[
+            mk_flow_stat(match_fields=[in_port(1)], actions=[output(3)]),
+            mk_flow_stat(match_fields=[in_port(3)], actions=[output(1)])
+        ])
+
+    def test_incremental_updates(self):
+        agent = self.mk_agent(accepts_bulk_flow_update=True,
+                              accepts_add_remove_flow_updates=True)
+        flows = self.change_flows()
+        agent._flow_table_updated(flows)
+        self.wait()
+
+        adapter_agent = agent.adapter_agent
+        self.assertFalse(adapter_agent.update_flows_bulk.called)
+        _, kw = adapter_agent.update_flows_incrementally.call_args
+        flow_changes = kw['flow_changes']
+        self.assertEqual(list(flow_changes.to_add.items), [flows.items[1]])
+        self.assertEqual(list(flow_changes.to_modify.items),
+                         [flows.items[0]])
+        self.assertEqual(list(flow_changes.to_remove.items),
+                         [self.flows.items[1]])
+        self.assertEqual(len(kw['group_changes'].to_add.items), 0)
+
+        # the next changes are relative to the ones passed on
+        self.flows = flows
+        group = mk_group_stat(group_id=1, buckets=[])
+        agent._group_table_updated(FlowGroups(items=[group]))
+        self.wait()
+        _, kw = adapter_agent.update_flows_incrementally.call_args
+        self.assertEqual(len(kw['flow_changes'].to_add.items), 0)
+        self.assertEqual(list(kw['group_changes'].to_add.items), [group])
+
+    def test_tables_in_the_model_are_passed_on_first(self):
+        agent = self.mk_agent(accepts_add_remove_flow_updates=True)
+        self.assertEqual(agent._flows, self.flows)
+        agent = DeviceAgent(agent.core, Device(id='olt1', type='olt'))
+        agent._flow_push.clock = self.clock
+        agent.last_data = Device(id='olt1', type='olt')
+        agent.adapter_agent = Mock()
+        agent._group_table_updated(self.groups)
+        self.wait()
+        _, kw = agent.adapter_agent.update_flows_incrementally.call_args
+        self.assertEqual(list(kw['flow_changes'].to_add.items),
+                         list(self.flows.items))
+
+    def test_failed_changes_are_passed_on_again(self):
+        agent = self.mk_agent(accepts_add_remove_flow_updates=True)
+        adapter_agent = agent.adapter_agent
+        adapter_agent.update_flows_incrementally.return_value = \
+            fail(IOError())
+        flows = self.change_flows()
+        agent._flow_table_updated(flows)
+        self.wait()
+        self.assertEqual(agent.flow_push_metrics()['failures'], 1)
+        self.assertEqual(agent._flows, self.flows)
+
+        adapter_agent.update_flows_incrementally.return_value = succeed(None)
+        self.flows = flows
+        agent._group_table_updated(self.groups)
+        self.wait()
+        _, kw = adapter_agent.update_flows_incrementally.call_args
+        self.assertEqual(list(kw['flow_changes'].to_add.items),
+                         [flows.items[1]])
+        self.assertEqual(agent._flows, flows)
+
+    def test_nothing_passed_on_without_changes(self):
+        agent = self.mk_agent(accepts_bulk_flow_update=True)
+        agent._flow_table_updated(Flows(items=list(self.flows.items)))
+        self.wait()
+        agent._group_table_updated(FlowGroups())
+        self.wait()
+        self.assertFalse(agent.adapter_agent.update_flows_bulk.called)
+
+    def test_bulk_updates(self):
+        agent = self.mk_agent(accepts_bulk_flow_update=True)
+        flows = self.change_flows()
+        agent._flow_table_updated(flows)
+        self.wait()
+        agent.adapter_agent.update_flows_bulk.assert_called_once_with(
+            device=agent.last_data, flows=flows, groups=self.groups)
+        self.assertFalse(
+            agent.adapter_agent.update_flows_incrementally.called)
+
+    def test_fallback_to_bulk(self):
+        agent = self.mk_agent(accepts_bulk_flow_update=True,
+                              accepts_add_remove_flow_updates=True)
+        agent.adapter_agent.update_flows_incrementally.return_value = \
+            fail(NotImplementedError())
+        flows = self.change_flows()
+        agent._flow_table_updated(flows)
+        self.wait()
+        agent.adapter_agent.update_flows_bulk.assert_called_once_with(
+            device=agent.last_data, flows=flows, groups=self.groups)
+
+    def test_incremental_only(self):
+        agent = self.mk_agent(accepts_add_remove_flow_updates=True)
+        agent.adapter_agent.update_flows_incrementally.return_value = \
+            fail(NotImplementedError())
+        agent._flow_table_updated(self.change_flows())
+        self.wait()
+        self.assertEqual(agent.flow_push_metrics()['failures'], 1)
+
+    def test_bursts_are_coalesced(self):
+        agent = self.mk_agent(accepts_bulk_flow_update=True)
+        for i in xrange(100):
+            agent._flow_table_updated(Flows(items=[mk_flow_stat(
+                match_fields=[in_port(1)], actions=[output(i)])]))
+        self.assertEqual(agent.flow_push_metrics()['queue_depth'], 100)
+        self.assertFalse(agent.adapter_agent.update_flows_bulk.called)
+        self.wait()
+        _, kw = agent.adapter_agent.update_flows_bulk.call_args
+        self.assertEqual(kw['flows'].items[0].instructions[0].actions.actions[
+            0].output.port, 99)
+        metrics = agent.flow_push_metrics()
+        # one more push than the one of the tables in the model
+        self.assertEqual(metrics['pushes'], 2)
+        self.assertEqual(metrics['coalesce_ratio'], (1 + 100) / 2.0)
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,4 @@
+from hashlib import md5
 from unittest import main
 
 from tests.utests.voltha.core.flow_helpers import FlowHelpers
@@ -286,6 +287,28 @@ class TestFlowDecomposer(FlowHelpers, FlowDecomposer):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~ ACTUAL TEST CASES ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+    def test_flow_ids_are_stable(self):
+        # flow ids are persisted, and must hash as they always did
+        def reference_hash(flow):
+            hex = md5('{},{},{},{},{}'.format(
+                flow.table_id, flow.priority, flow.flags, flow.cookie,
+                flow.match.SerializeToString())).hexdigest()
+            return int(hex[:16], 16)
+
+        for kw in (
+                dict(match_fields=[], actions=[]),
+                dict(table_id=3, priority=65535, cookie=0xffffffffffffffff,
+                     flags=ofp.OFPFF_SEND_FLOW_REM,
+                     match_fields=[in_port(1), vlan_vid(4096 + 4000),
+                                   eth_type(0x800), ipv4_dst(0xe0000001)],
+                     actions=[output(2)]),
+                dict(match_fields=[ofb_field(
+                    type=ofp.OFPXMT_OFB_ETH_DST, eth_dst='\x01\x00\x5e\0\0\0',
+                    has_mask=True, eth_dst_mask='\xff\xff\xff\x80\0\0')],
+                     actions=[])):
+            flow = mk_flow_stat(**kw)
+            self.assertEqual(flow.id, reference_hash(flow))
+
     def test_eapol_reroute_rule_decomposition(self):
         flow = mk_flow_stat(
             match_fields=[
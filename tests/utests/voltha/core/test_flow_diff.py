@@ -0,0 +1,58 @@
+from unittest import main, TestCase
+
+from voltha.core.flow_decomposer import *
+from voltha.core.flow_diff import diff_flows, diff_groups, has_changes
+from voltha.protos import third_party
+
+
+def mk_flow(port, out_port, **kw):
+    return mk_flow_stat(match_fields=[in_port(port)],
+                        actions=[output(out_port)], **kw)
+
+
+def mk_group(group_id, ports):
+    return mk_group_stat(group_id=group_id,
+                         buckets=[ofp.ofp_bucket(actions=[output(port)])
+                                  for port in ports])
+
+
+class TestFlowDiff(TestCase):
+
+    def test_diff_flows(self):
+        old = [mk_flow(1, 2), mk_flow(2, 1), mk_flow(3, 1)]
+        new = [mk_flow(3, 1), mk_flow(2, 5), mk_flow(4, 1)]
+        changes = diff_flows(old, new)
+        self.assertEqual(list(changes.to_add.items), [new[2]])
+        self.assertEqual(list(changes.to_remove.items), [old[0]])
+        self.assertEqual(list(changes.to_modify.items), [new[1]])
+        self.assertTrue(has_changes(changes))
+
+    def test_counters_and_order_do_not_count(self):
+        old = [mk_flow(1, 2), mk_flow(2, 1)]
+        new = [mk_flow(2, 1), mk_flow(1, 2)]
+        new[0].packet_count = 42
+        self.assertFalse(has_changes(diff_flows(old, new)))
+        # other timeouts do
+        changes = diff_flows(old, [mk_flow(1, 2, hard_timeout=10)])
+        self.assertEqual(len(changes.to_modify.items), 1)
+        self.assertEqual(list(changes.to_remove.items), [old[1]])
+
+    def test_flows_without_id(self):
+        flow = mk_flow(1, 2)
+        no_id = ofp.ofp_flow_stats()
+        no_id.CopyFrom(flow)
+        no_id.id = 0
+        self.assertFalse(has_changes(diff_flows([flow], [no_id])))
+
+    def test_diff_groups(self):
+        old = [mk_group(1, [1, 2]), mk_group(2, [1])]
+        new = [mk_group(2, [1, 3]), mk_group(3, [1])]
+        changes = diff_groups(old, new)
+        self.assertEqual(list(changes.to_add.items), [new[1]])
+        self.assertEqual(list(changes.to_remove.items), [old[0]])
+        self.assertEqual(list(changes.to_modify.items), [new[0]])
+        self.assertFalse(has_changes(diff_groups(old, old)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+from unittest import main, TestCase
+
+from twisted.internet.defer import Deferred
+from twisted.internet.task import Clock
+
+from voltha.core.flow_push_scheduler import FlowPushScheduler
+
+
+class TestFlowPushScheduler(TestCase):
+
+    def setUp(self):
+        self.pushes = []  # (flows, groups, deferred)
+        self.clock = Clock()
+        self.scheduler = FlowPushScheduler(self.push, window=0.01,
+                                           clock=self.clock)
+
+    def push(self, flows, groups):
+        d = Deferred()
+        self.pushes.append((flows, groups, d))
+        return d
+
+    def pushed(self):
+        return [(flows, groups) for flows, groups, _ in self.pushes]
+
+    def test_updates_within_window_are_coalesced(self):
+        self.scheduler.schedule('f1', 'g1')
+        self.clock.advance(0.005)
+        self.scheduler.schedule('f2', 'g1')
+        self.scheduler.schedule('f2', 'g2')
+        self.assertEqual(self.scheduler.metrics()['queue_depth'], 3)
+        self.clock.advance(0.005)
+        self.assertEqual(self.pushed(), [('f2', 'g2')])
+        self.assertEqual(self.scheduler.metrics()['queue_depth'], 0)
+
+        self.clock.advance(0.02)
+        self.pushes[0][2].callback(None)
+        metrics = self.scheduler.metrics()
+        self.assertEqual(metrics['pushes'], 1)
+        self.assertEqual(metrics['coalesce_ratio'], 3.0)
+        self.assertAlmostEqual(metrics['last_latency'], 0.03)
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+    def test_one_push_in_flight(self):
+        self.scheduler.schedule('f1', 'g')
+        self.clock.advance(0.01)
+        self.scheduler.schedule('f2', 'g')
+        self.scheduler.schedule('f3', 'g')
+        self.clock.advance(0.1)
+        self.assertEqual(self.pushed(), [('f1', 'g')])
+        self.assertTrue(self.scheduler.metrics()['in_flight'])
+
+        # the latest tables are pushed once the push in flight completed
+        self.pushes[0][2].callback(None)
+        self.clock.advance(0.01)
+        self.assertEqual(self.pushed(), [('f1', 'g'), ('f3', 'g')])
+        self.pushes[1][2].callback(None)
+        self.assertEqual(self.scheduler.metrics()['coalesce_ratio'], 1.5)
+
+    def test_failed_push_does_not_block_later_ones(self):
+        self.scheduler.schedule('f1', 'g')
+        self.clock.advance(0.01)
+        self.scheduler.schedule('f2', 'g')
+        self.pushes[0][2].errback(RuntimeError('unreachable'))
+        self.clock.advance(0.01)
+        self.assertEqual(self.pushed(), [('f1', 'g'), ('f2', 'g')])
+        self.assertEqual(self.scheduler.metrics()['failures'], 1)
+
+    def test_no_window(self):
+        scheduler = FlowPushScheduler(self.push, window=0, clock=self.clock)
+        scheduler.schedule('f1', 'g')
+        scheduler.schedule('f2', 'g')
+        scheduler.schedule('f3', 'g')
+        self.assertEqual(self.pushed(), [('f1', 'g')])
+        self.pushes[0][2].callback(None)
+        self.assertEqual(self.pushed(), [('f1', 'g'), ('f3', 'g')])
+
+    def test_stop_drops_pending_update(self):
+        self.scheduler.schedule('f1', 'g')
+        self.scheduler.stop()
+        self.clock.advance(0.01)
+        self.assertEqual(self.pushed(), [])
+        self.assertEqual(self.clock.getDelayedCalls(), [])
+
+
+if __name__ == '__main__':
+    main()
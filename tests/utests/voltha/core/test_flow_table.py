@@ -0,0 +1,326 @@
+from random import Random
+from time import time
+from unittest import main, TestCase
+
+from voltha.core.flow_decomposer import *
+from voltha.core.flow_table import FlowTable, fields_overlap, match_fields
+from voltha.protos import third_party
+
+
+def mk_flows(n, n_ports=64):
+    return [mk_flow_stat(
+        table_id=i % 2,
+        priority=1000,
+        cookie=i % 100,
+        match_fields=[in_port(i % n_ports), vlan_vid(4096 + i)],
+        actions=[output(i % n_ports + 1)] if i % 10 else [group(i % 7)]
+    ) for i in xrange(n)]
+
+
+def outputs(flow):
+    actions = get_actions(flow)
+    return (set(a.output.port for a in actions if a.type == OUTPUT),
+            set(a.group.group_id for a in actions if a.type == GROUP))
+
+
+def covered(flow, mod):
+    """What the fields the table indexes tell on flow being covered by mod"""
+    if (flow.cookie & mod.cookie_mask) != (mod.cookie & mod.cookie_mask):
+        return False
+    if mod.table_id != ofp.OFPTT_ALL and flow.table_id != mod.table_id:
+        return False
+    out_ports, out_groups = outputs(flow)
+    if (mod.out_port & 0x7fffffff) != ofp.OFPP_ANY and \
+            mod.out_port not in out_ports:
+        return False
+    if (mod.out_group & 0x7fffffff) != ofp.OFPG_ANY and \
+            mod.out_group not in out_groups:
+        return False
+    return True
+
+
+def mk_delete(**kw):
+    kw.setdefault('table_id', ofp.OFPTT_ALL)
+    kw.setdefault('out_port', ofp.OFPP_ANY)
+    kw.setdefault('out_group', ofp.OFPG_ANY)
+    return mk_simple_flow_mod(command=ofp.OFPFC_DELETE, match_fields=[],
+                              actions=[], **kw)
+
+
+class TestFlowTable(TestCase):
+
+    def setUp(self):
+        self.flows = mk_flows(200)
+        self.table = FlowTable(self.flows)
+
+    def test_strict_find_add_remove(self):
+        flow = self.flows[17]
+        self.assertIs(self.table.find(flow), flow)
+
+        # same identifying fields, other actions: replaced in place
+        changed = mk_flow_stat(
+            table_id=flow.table_id, priority=1000, cookie=flow.cookie,
+            match_fields=get_ofb_fields(flow), actions=[output(99)])
+        self.assertEqual(changed.id, flow.id)
+        self.table.add(changed)
+        self.assertEqual(len(self.table), 200)
+        self.assertEqual(list(self.table)[17], changed)
+        self.assertEqual(self.table.candidates(mk_delete(out_port=99)),
+                         [changed])
+        # no longer indexed by its former output port
+        self.assertEqual(outputs(flow)[0], {18})
+        self.assertEqual(self.table.candidates(mk_delete(out_port=18)),
+                         [f for f in self.flows[18:] if 18 in outputs(f)[0]])
+
+        self.assertIs(self.table.remove(changed), changed)
+        self.assertIsNone(self.table.find(flow))
+        self.assertIsNone(self.table.remove(flow))
+        self.assertEqual(len(self.table), 199)
+        self.assertEqual(self.table.to_message().items[17], self.flows[18])
+
+    def test_flows_without_id(self):
+        flows = mk_flows(3)
+        for flow in flows:
+            flow.id = 0
+        table = FlowTable(flows)
+        self.assertEqual(list(table), flows)
+        self.assertIs(table.find(flows[1]), flows[1])
+        # strictly matching the flow with the id it would have
+        self.assertIs(table.find(mk_flows(3)[1]), flows[1])
+        self.assertEqual(table.overlapping(flows[2]), [flows[2]])
+        self.assertIs(table.remove(flows[1]), flows[1])
+        self.assertEqual(list(table), [flows[0], flows[2]])
+
+    def test_candidates_cover_all_matching_flows(self):
+        rand = Random(42)
+        for _ in xrange(200):
+            kw = {}
+            if rand.random() < 0.5:
+                kw['cookie'] = rand.randrange(110)
+                kw['cookie_mask'] = rand.choice(
+                    [0xffffffffffffffff, 0xf, 0x3])
+            if rand.random() < 0.5:
+                kw['table_id'] = rand.randrange(3)
+            if rand.random() < 0.5:
+                kw['out_port'] = rand.randrange(70)
+            if rand.random() < 0.3:
+                kw['out_group'] = rand.randrange(9)
+            mod = mk_delete(**kw)
+            candidates = self.table.candidates(mod)
+            expected = [f for f in self.flows if covered(f, mod)]
+            # in table order, and narrowed down
+            self.assertEqual([f for f in candidates if covered(f, mod)],
+                             expected)
+            if kw.get('out_port') is not None or \
+                    kw.get('cookie_mask') == 0xffffffffffffffff:
+                self.assertLess(len(candidates), len(self.flows) / 2)
+
+    def test_with_out_group(self):
+        expected = [f for f in self.flows if 3 in outputs(f)[1]]
+        self.assertEqual(self.table.with_out_group(3), expected)
+        for flow in expected:
+            self.table.remove(flow)
+        self.assertEqual(self.table.with_out_group(3), [])
+
+
+def mk_match_flow(priority, fields):
+    return mk_flow_stat(priority=priority, match_fields=fields,
+                        actions=[output(1)])
+
+
+def masked_vlan_vid(vid, mask):
+    return ofb_field(type=VLAN_VID, vlan_vid=vid, has_mask=True,
+                     vlan_vid_mask=mask)
+
+
+def masked_eth_dst(mac, mask):
+    return ofb_field(type=ofp.OFPXMT_OFB_ETH_DST, eth_dst=mac, has_mask=True,
+                     eth_dst_mask=mask)
+
+
+def may_match_both(flow1, flow2):
+    """
+    Overlap check by brute force: values being kept below 16, try all
+    values of each field the two flows have in common
+    """
+    if (flow1.table_id, flow1.priority) != (flow2.table_id, flow2.priority):
+        return False
+    fields1 = match_fields(flow1.match)
+    fields2 = match_fields(flow2.match)
+    for field_type in set(fields1) & set(fields2):
+        value1, mask1 = fields1[field_type]
+        value2, mask2 = fields2[field_type]
+        mask1 = 0xf if mask1 is None else mask1
+        mask2 = 0xf if mask2 is None else mask2
+        if not any((x & mask1) == (value1 & mask1) and
+                   (x & mask2) == (value2 & mask2) for x in xrange(16)):
+            return False
+    return True
+
+
+def mk_random_match_flow(rand):
+    fields = []
+    if rand.random() < 0.7:
+        fields.append(in_port(rand.randrange(4)))
+    if rand.random() < 0.7:
+        if rand.random() < 0.5:
+            fields.append(vlan_vid(rand.randrange(16)))
+        else:
+            fields.append(masked_vlan_vid(rand.randrange(16),
+                                          rand.randrange(16)))
+    if rand.random() < 0.5:
+        mac = '\x00' * 5 + chr(rand.randrange(16))
+        if rand.random() < 0.5:
+            fields.append(ofb_field(type=ofp.OFPXMT_OFB_ETH_DST, eth_dst=mac))
+        else:
+            fields.append(masked_eth_dst(
+                mac, '\x00' * 5 + chr(rand.randrange(16))))
+    if rand.random() < 0.3:
+        fields.append(eth_type(rand.choice((0x800, 0x806))))
+    return mk_match_flow(rand.choice((100, 200)), fields)
+
+
+class TestOverlap(TestCase):
+
+    def test_masked_and_missing_fields(self):
+        table = FlowTable([
+            mk_match_flow(100, [in_port(1), vlan_vid(4096 + 10)]),
+            mk_match_flow(100, [in_port(2)]),
+            mk_match_flow(100, [masked_vlan_vid(4096 + 16, 0x1ff0)]),
+            mk_match_flow(200, [in_port(1)]),
+        ])
+        flows = list(table)
+
+        def overlapping(priority, fields):
+            return table.overlapping(mk_match_flow(priority, fields))
+
+        self.assertEqual(overlapping(100, [in_port(1)]),
+                         [flows[0], flows[2]])
+        self.assertEqual(overlapping(100, [vlan_vid(4096 + 17)]),
+                         flows[1:3])
+        self.assertEqual(overlapping(100, [masked_vlan_vid(4096, 0x1fe0)]),
+                         flows[:3])  # vlans 0 - 31 match all of them
+        self.assertEqual(overlapping(100, []), flows[:3])
+        self.assertEqual(overlapping(300, []), [])
+        self.assertEqual(len(table.overlapping(
+            mk_match_flow(100, []), return_on_first=True)), 1)
+
+        # the index follows changes of the table
+        table.remove(flows[2])
+        self.assertEqual(overlapping(100, [vlan_vid(4096 + 17)]),
+                         flows[1:2])
+        table.add(flows[2])
+        self.assertEqual(overlapping(100, [vlan_vid(4096 + 17)]),
+                         [flows[1], flows[2]])
+
+    def test_overlapping_agrees_with_brute_force(self):
+        rand = Random(7)
+        flows = []
+        table = FlowTable()
+        for i in xrange(400):
+            flow = mk_random_match_flow(rand)
+            if flow.id not in table:
+                flows.append(flow)
+                table.add(flow)
+            if i == 100:
+                table.overlapping(flow)  # index from here on
+            if i % 5 == 0:
+                flow = rand.choice(flows)
+                flows.remove(flow)
+                table.remove(flow)
+        for _ in xrange(400):
+            flow = mk_random_match_flow(rand)
+            self.assertEqual(
+                table.overlapping(flow),
+                [f for f in flows if may_match_both(f, flow)])
+
+
+class TestFlowTablePerformance(TestCase):
+    """
+    Prints the time per lookup done for strict and non-strict flow-mods,
+    scanning the flow list vs using the indexed flow table.
+    """
+
+    sizes = (1000, 10000)
+    n_lookups = 100
+
+    def test_lookups(self):
+        print
+        print '%8s %14s %14s %14s %14s' % (
+            'flows', 'strict scan', 'strict index', 'delete scan',
+            'delete index')
+        print '%8s %14s %14s %14s %14s' % ('', '[ms]', '[ms]', '[ms]', '[ms]')
+        for n in self.sizes:
+            flows = mk_flows(n)
+            table = FlowTable(flows)
+            rand = Random(n)
+            lookups = [rand.choice(flows) for _ in xrange(self.n_lookups)]
+            deletes = [mk_delete(out_port=rand.randrange(1, 65))
+                       for _ in xrange(self.n_lookups)]
+
+            results = []
+            t0 = time()
+            for flow in lookups:
+                # as LogicalDeviceAgent.flow_match() compares flows
+                for f in flows:
+                    if all(getattr(f, key) == getattr(flow, key) for key in (
+                            'table_id', 'priority', 'flags', 'cookie',
+                            'match')):
+                        break
+            results.append(time() - t0)
+            t0 = time()
+            for flow in lookups:
+                table.find(flow)
+            results.append(time() - t0)
+            t0 = time()
+            for mod in deletes:
+                [f for f in flows if covered(f, mod)]
+            results.append(time() - t0)
+            t0 = time()
+            for mod in deletes:
+                [f for f in table.candidates(mod) if covered(f, mod)]
+            results.append(time() - t0)
+
+            print '%8d %14.3f %14.3f %14.3f %14.3f' % ((n,) + tuple(
+                1000 * r / self.n_lookups for r in results))
+
+    def test_overlap_checks(self):
+        """
+        Prints the time per overlap check, comparing the match of each flow
+        of the same table and priority vs using the overlap index
+        """
+        print
+        print '%8s %14s %14s %14s' % (
+            'flows', 'index build', 'check scan', 'check index')
+        print '%8s %14s %14s %14s' % ('', '[ms]', '[ms]', '[ms]')
+        for n in (1000, 5000):
+            flows = mk_flows(n, n_ports=256)
+            table = FlowTable(flows)
+            rand = Random(n)
+            checks = [mk_match_flow(1000, [
+                in_port(rand.randrange(256)),
+                vlan_vid(4096 + rand.randrange(n))
+            ]) for _ in xrange(self.n_lookups)]
+
+            t0 = time()
+            table.overlapping(checks[0])
+            t_build = time() - t0
+            t0 = time()
+            for flow in checks:
+                fields = match_fields(flow.match)
+                [f for f in flows if f.table_id == flow.table_id and
+                 f.priority == flow.priority and
+                 fields_overlap(fields, match_fields(f.match))]
+            t_scan = time() - t0
+            t0 = time()
+            for flow in checks:
+                table.overlapping(flow)
+            t_index = time() - t0
+
+            print '%8d %14.1f %14.3f %14.3f' % (
+                n, 1000 * t_build, 1000 * t_scan / self.n_lookups,
+                1000 * t_index / self.n_lookups)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,10 @@
 
-from unittest import main
+from hashlib import md5
+from itertools import izip
+from time import time
+from unittest import main, TestCase
 
+import networkx as nx
 from mock import Mock
 
 from tests.utests.voltha.core.flow_helpers import FlowHelpers
@@ -13,6 +17,24 @@ from voltha.protos.logical_device_pb2 import LogicalDevice, LogicalPort
 from voltha.protos.openflow_13_pb2 import Flows, FlowGroups
 
 
+def all_pairs_routes(graph, boundary_ports):
+    """Routes as found by shortest paths between all boundary ports"""
+    routes = {}
+    for source, source_port_no in boundary_ports.iteritems():
+        for target, target_port_no in boundary_ports.iteritems():
+            if source == target:
+                continue
+            path = nx.shortest_path(graph, source, target)
+            if len(path) != 6:
+                continue
+            hops = [RouteHop(device=graph.node[path[i + 1]]['device'],
+                             ingress_port=graph.node[path[i]]['port'],
+                             egress_port=graph.node[path[i + 2]]['port'])
+                    for i in (0, 3)]
+            routes[(source_port_no, target_port_no)] = hops
+    return routes
+
+
 class test_logical_device_agent(FlowHelpers):
 
     def setup_mock_registry(self):
@@ -426,6 +448,104 @@ class test_logical_device_agent(FlowHelpers):
         self.assertEqual(route[1].ingress_port, self.ports['olt'][1])
         self.assertEqual(route[1].egress_port, self.ports['olt'][0])
 
+    def assertRoutesOfAllPairs(self):
+        graph = self.lda._graph
+        boundary_ports = dict(
+            ((lp.device_id, lp.device_port_no), lp.ofp_port.port_no)
+            for lp in self.ld_ports)
+        self.assertEqual(self.lda._routes,
+                         all_pairs_routes(graph, boundary_ports))
+
+    def test_routes_patched_on_port_changes(self):
+        self.lda.get_all_default_rules()
+        self.assertRoutesOfAllPairs()
+        graph = self.lda._graph
+
+        # a new onu
+        self.devices['onu3'] = Device(
+            id='onu3', parent_id='olt', parent_port_no=1, vlan=103)
+        self.ports['onu3'] = [
+            Port(port_no=0, type=Port.ETHERNET_UNI, device_id='onu3'),
+            Port(port_no=1, type=Port.PON_ONU, device_id='onu3',
+                 peers=[Port.PeerPort(device_id='olt', port_no=1)])]
+        self.ports['olt'][1].peers.add(device_id='onu3', port_no=1)
+        port = LogicalPort(id='3', device_id='onu3', device_port_no=0,
+                           ofp_port=ofp.ofp_port(port_no=3))
+        self.ld_ports.append(port)
+        self.lda._port_added(port)
+        self.assertIs(self.lda._graph, graph)
+        self.assertEqual(len(self.lda._routes), 6)
+        self.assertRoutesOfAllPairs()
+        self.assertEqual(len(self.lda.get_all_default_rules()['onu3'][0]), 3)
+
+        # flows are decomposed with the patched routes
+        self.device_flows['onu3'] = Flows()
+        self.device_groups['onu3'] = FlowGroups()
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[in_port(3), eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.assertDecomposedAsWhole()
+
+        self.ld_ports.remove(port)
+        self.lda._port_removed(port)
+        self.assertIs(self.lda._graph, graph)
+        self.assertRoutesOfAllPairs()
+        self.assertRaises(Exception, self.lda.get_route, 3, None)
+
+    def test_routes_rebuilt_on_ports_added_to_devices_in_graph(self):
+        self.lda.get_all_default_rules()
+        graph = self.lda._graph
+
+        # a new port of an onu in the graph
+        self.ports['onu1'].append(
+            Port(port_no=2, type=Port.UNKNOWN, device_id='onu1'))
+        port = LogicalPort(id='3', device_id='onu1', device_port_no=2,
+                           ofp_port=ofp.ofp_port(port_no=3))
+        self.ld_ports.append(port)
+        self.lda._port_added(port)
+        self.lda.get_all_default_rules()
+        self.assertIsNot(self.lda._graph, graph)
+        self.assertRoutesOfAllPairs()
+        self.assertEqual(self.lda.get_route(3, 0)[0].ingress_port,
+                         self.ports['onu1'][2])
+
+        # a new onu, on a new port of the olt in the graph
+        graph = self.lda._graph
+        self.ports['olt'].append(
+            Port(port_no=2, type=Port.UNKNOWN, device_id='olt',
+                 peers=[Port.PeerPort(device_id='onu3', port_no=1)]))
+        self.devices['onu3'] = Device(
+            id='onu3', parent_id='olt', parent_port_no=2, vlan=103)
+        self.ports['onu3'] = [
+            Port(port_no=0, type=Port.ETHERNET_UNI, device_id='onu3'),
+            Port(port_no=1, type=Port.PON_ONU, device_id='onu3',
+                 peers=[Port.PeerPort(device_id='olt', port_no=2)])]
+        self.device_flows['onu3'] = Flows()
+        self.device_groups['onu3'] = FlowGroups()
+        port = LogicalPort(id='4', device_id='onu3', device_port_no=0,
+                           ofp_port=ofp.ofp_port(port_no=4))
+        self.ld_ports.append(port)
+        self.lda._port_added(port)
+        self.lda.get_all_default_rules()
+        self.assertIsNot(self.lda._graph, graph)
+        self.assertRoutesOfAllPairs()
+        self.assertEqual(self.lda.get_route(4, 0)[1].ingress_port,
+                         self.ports['olt'][2])
+
+    def test_half_routes(self):
+        self.lda.get_all_default_rules()
+        routes = self.lda._routes
+        self.assertEqual(self.lda.get_route(None, 0),
+                         [None, routes[(1, 0)][1]])
+        self.assertEqual(self.lda.get_route(None, ofp.OFPP_CONTROLLER),
+                         [None, routes[(1, 0)][1]])
+        self.assertEqual(self.lda.get_route(2, None), [routes[(2, 0)][0], None])
+        self.assertEqual(self.lda.get_route(0, None)[0], routes[(0, 1)][0])
+        self.assertRaises(Exception, self.lda.get_route, 5, None)
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~ FLOW DECOMP TESTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def test_eapol_flow_decomp_case(self):
@@ -610,6 +730,325 @@ class test_logical_device_agent(FlowHelpers):
             ]
         ))
 
+    def test_flow_table_kept_on_own_writes(self):
+        def update_flows(_, flows):
+            # an equal message, as the config tree may hand out
+            self.flows = Flows()
+            self.flows.CopyFrom(flows)
+            self.lda._flow_table_updated(self.flows)
+        self.flows_proxy.update = update_flows
+
+        for port_no in (1, 2):
+            self.lda.update_flow_table(mk_simple_flow_mod(
+                match_fields=[in_port(port_no)],
+                actions=[output(0)]
+            ))
+            if port_no == 1:
+                flow_table = self.lda._flow_table
+        self.assertIs(self.lda._flow_table, flow_table)
+        self.assertEqual(len(self.flows.items), 2)
+
+    def test_flow_table_follows_model_changes(self):
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            match_fields=[in_port(1)],
+            actions=[output(0)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+
+        # the flow table is replaced by someone else
+        flow_mod = mk_simple_flow_mod(
+            match_fields=[in_port(2)],
+            actions=[output(0)]
+        )
+        self.flows = Flows(items=[
+            flow_stats_entry_from_flow_mod_message(flow_mod)])
+        self.lda._flow_table_updated(self.flows)
+
+        flow_mod.command = ofp.OFPFC_DELETE_STRICT
+        self.lda.update_flow_table(flow_mod)
+        self.assertEqual(len(self.flows.items), 0)
+
+    def test_check_overlap(self):
+        errors = []
+        self.lda.signal_flow_mod_error = lambda code, mod: errors.append(code)
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=700,
+            match_fields=[in_port(1), vlan_vid(4096 + 10)],
+            actions=[output(0)]
+        ))
+        n_flows = len(self.flows.items)
+
+        # a packet on port 1 with vlan 10 would match both
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=700,
+            flags=ofp.OFPFF_CHECK_OVERLAP,
+            match_fields=[in_port(1)],
+            actions=[output(0)]
+        ))
+        self.assertEqual(errors, [ofp.OFPFMFC_OVERLAP])
+        self.assertEqual(len(self.flows.items), n_flows)
+
+        # other vlan, or other priority: no overlap
+        for priority, vid in ((700, 11), (701, 10)):
+            self.lda.update_flow_table(mk_simple_flow_mod(
+                priority=priority,
+                flags=ofp.OFPFF_CHECK_OVERLAP,
+                match_fields=[in_port(1), vlan_vid(4096 + vid)],
+                actions=[output(0)]
+            ))
+        self.assertEqual(errors, [ofp.OFPFMFC_OVERLAP])
+        self.assertEqual(len(self.flows.items), n_flows + 2)
+
+    def test_bulk_flow_mods_write_flow_table_once(self):
+        writes = []
+        update = self.flows_proxy.update
+        def track(path, flows):
+            writes.append(flows)
+            update(path, flows)
+        self.flows_proxy.update = track
+
+        flow_mods = [mk_simple_flow_mod(
+            priority=700,
+            match_fields=[in_port(i % 2 + 1), vlan_vid(4096 + i)],
+            actions=[output(0)]
+        ) for i in xrange(10)]
+        # applied in order: deletes the one added before
+        delete = mk_simple_flow_mod(
+            command=ofp.OFPFC_DELETE_STRICT, priority=700,
+            match_fields=[in_port(2), vlan_vid(4096 + 3)], actions=[])
+        self.lda.update_flow_table_bulk(flow_mods + [delete])
+        self.assertEqual(len(writes), 1)
+        expected = [flow_stats_entry_from_flow_mod_message(mod)
+                    for i, mod in enumerate(flow_mods) if i != 3]
+        self.assertEqual(list(self.flows.items), expected)
+
+        # no change, no write
+        self.lda.update_flow_table_bulk([delete])
+        self.assertEqual(len(writes), 1)
+        # writes of single flow-mods are not deferred any longer
+        self.lda.update_flow_table(flow_mods[3])
+        self.assertEqual(len(writes), 2)
+
+    def test_failed_flow_mod_does_not_stop_bulk(self):
+        errors = []
+        self.lda.signal_flow_mod_error = \
+            lambda code, flow_mod: errors.append((code, flow_mod))
+        flow_mods = [mk_simple_flow_mod(
+            priority=700, match_fields=[in_port(1), vlan_vid(4096 + i)],
+            actions=[output(0)]
+        ) for i in xrange(3)]
+        modify = mk_simple_flow_mod(
+            command=ofp.OFPFC_MODIFY, priority=700,
+            match_fields=[in_port(1), vlan_vid(4096)], actions=[output(2)])
+        self.lda.update_flow_table_bulk(
+            flow_mods[:1] + [modify] + flow_mods[1:])
+        self.assertEqual(errors, [(ofp.OFPFMFC_UNKNOWN, modify)])
+        self.assertEqual(list(self.flows.items), [
+            flow_stats_entry_from_flow_mod_message(mod)
+            for mod in flow_mods])
+
+    def test_flow_match_by_id(self):
+        flows = [mk_flow_stat(priority=p, match_fields=[in_port(i)],
+                              actions=[output(i)])
+                 for p in (100, 200) for i in (1, 2)]
+        other_actions = mk_flow_stat(priority=200, match_fields=[in_port(1)],
+                                     actions=[])
+        self.assertTrue(LogicalDeviceAgent.flow_match(flows[2], other_actions))
+        self.assertEqual(LogicalDeviceAgent.find_flow(flows, other_actions), 2)
+
+        # flows without id are compared field by field
+        no_id = ofp.ofp_flow_stats()
+        no_id.CopyFrom(other_actions)
+        no_id.id = 0
+        self.assertTrue(LogicalDeviceAgent.flow_match(flows[2], no_id))
+        self.assertFalse(LogicalDeviceAgent.flow_match(flows[3], no_id))
+        self.assertEqual(LogicalDeviceAgent.find_flow(flows, no_id), 2)
+        flows[2] = no_id
+        self.assertEqual(LogicalDeviceAgent.find_flow(flows, other_actions), 2)
+        self.assertEqual(LogicalDeviceAgent.find_flow(flows[:2], no_id), -1)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~ INCREMENTAL DECOMP TESTS ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def track_device_updates(self):
+        updated = []
+        update = self.root_proxy.update
+        def track(path, data):
+            updated.append(path.split('/')[2])
+            update(path, data)
+        self.root_proxy.update = track
+        return updated
+
+    def assertDecomposedAsWhole(self):
+        expected = self.lda.decompose_rules(self.flows.items, self.groups.items)
+        for device_id, (flows, groups) in expected.iteritems():
+            self.assertEqual(list(self.device_flows[device_id].items),
+                             flows.values())
+            self.assertEqual(list(self.device_groups[device_id].items),
+                             groups.values())
+
+    def test_incremental_decomposition(self):
+        updated = self.track_device_updates()
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(sorted(set(updated)), ['olt', 'onu1', 'onu2'])
+
+        # upstream controller-bound flow, installed on the olt only
+        del updated[:]
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[in_port(1), eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(set(updated), {'olt'})
+        self.assertDecomposedAsWhole()
+
+        # downstream unicast flow, installed on onu2 only
+        del updated[:]
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=600,
+            match_fields=[in_port(0), vlan_vid(4096 + 102)],
+            actions=[set_field(vlan_vid(4096 + 0)), output(2)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(set(updated), {'onu2'})
+        self.assertDecomposedAsWhole()
+
+        # nothing changed, nothing to update
+        del updated[:]
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(updated, [])
+
+        del updated[:]
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            command=ofp.OFPFC_DELETE,
+            out_port=ofp.OFPP_ANY,
+            out_group=ofp.OFPG_ANY,
+            match_fields=[],
+            actions=[]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(set(updated), {'olt', 'onu2'})
+        self.assertDecomposedAsWhole()
+
+    def test_group_change_redecomposes_referring_flows(self):
+        self.lda.update_group_table(mk_multicast_group_mod(
+            group_id=2,
+            buckets=[ofp.ofp_bucket(actions=[pop_vlan(), output(1)])]
+        ))
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[
+                in_port(0),
+                eth_type(0x800),
+                vlan_vid(4096 + 140),
+                ipv4_dst(0xe60a0a0a)
+            ],
+            actions=[group(2)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.assertEqual(len(self.device_flows['onu1'].items), 4)
+        self.assertEqual(len(self.device_flows['onu2'].items), 3)
+
+        updated = self.track_device_updates()
+        self.lda.update_group_table(mk_multicast_group_mod(
+            command=ofp.OFPGC_MODIFY,
+            group_id=2,
+            buckets=[ofp.ofp_bucket(actions=[pop_vlan(), output(2)])]
+        ))
+        self.lda._group_table_updated(self.groups)
+        self.assertEqual(set(updated), {'onu1', 'onu2'})
+        self.assertEqual(len(self.device_flows['onu1'].items), 3)
+        self.assertEqual(len(self.device_flows['onu2'].items), 4)
+        self.assertDecomposedAsWhole()
+
+    def test_port_change_redecomposes_all_flows(self):
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[in_port(1), eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+
+        updated = self.track_device_updates()
+        self.lda._port_list_updated(None)
+        self.lda._flow_table_updated(self.flows)
+        # decomposed anew, but the same rules need not be written again
+        self.assertEqual(updated, [])
+        self.assertDecomposedAsWhole()
+
+    def test_decomposition_cache(self):
+        flow_mod = mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[in_port(1), eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)]
+        )
+        self.lda.update_flow_table(flow_mod)
+        self.lda._flow_table_updated(self.flows)
+        metrics = self.lda.decomposition_cache_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (0, 1))
+
+        # deleted and added again: decomposed as before
+        flow_mod.command = ofp.OFPFC_DELETE_STRICT
+        self.lda.update_flow_table(flow_mod)
+        self.lda._flow_table_updated(self.flows)
+        flow_mod.command = ofp.OFPFC_ADD
+        self.lda.update_flow_table(flow_mod)
+        self.lda._flow_table_updated(self.flows)
+        metrics = self.lda.decomposition_cache_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 1))
+
+        # other actions, or other routes: decomposed anew
+        self.lda.update_flow_table(mk_simple_flow_mod(
+            priority=1000,
+            match_fields=[in_port(1), eth_type(0x888e)],
+            actions=[push_vlan(0x8100), output(ofp.OFPP_CONTROLLER)]
+        ))
+        self.lda._flow_table_updated(self.flows)
+        self.lda._port_list_updated(None)
+        self.lda._flow_table_updated(self.flows)
+        metrics = self.lda.decomposition_cache_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (1, 3))
+        self.assertEqual(metrics['generation'], 2)
+        self.assertDecomposedAsWhole()
+
+    def mk_flows_without_id(self):
+        flows = [mk_flow_stat(
+            priority=1000,
+            match_fields=[in_port(port_no), eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)]
+        ) for port_no in (1, 2)] + [mk_flow_stat(
+            priority=1000,
+            match_fields=[in_port(0), vlan_vid(4096 + 101)],
+            actions=[output(1)]
+        )]
+        without_id = []
+        for flow in flows:
+            flow = ofp.ofp_flow_stats()
+            flow.CopyFrom(flows[len(without_id)])
+            flow.id = 0
+            without_id.append(flow)
+        return flows, without_id
+
+    def test_decomposition_cache_of_flows_without_id(self):
+        flows, without_id = self.mk_flows_without_id()
+        rules = self.lda.decompose_rules(without_id, [])
+        metrics = self.lda.decomposition_cache_metrics()
+        self.assertEqual((metrics['hits'], metrics['misses']), (0, 3))
+        self.assertEqual(rules, self.lda.decompose_rules(flows, []))
+        # the eapol flow of each onu made it to its rules
+        self.assertEqual(len(rules['onu1'][0]), 4)
+        self.assertEqual(len(rules['onu2'][0]), 3)
+
+    def test_incremental_decomposition_of_flows_without_id(self):
+        _, without_id = self.mk_flows_without_id()
+        device_rules = {}
+        for flows in (without_id[:1], without_id, without_id[1:]):
+            # only the rules of the devices that changed are returned
+            device_rules.update(
+                self.lda.decompose_rules_incrementally(flows, []))
+            self.assertEqual(device_rules,
+                             self.lda.decompose_rules(flows, []))
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ COMPLEX TESTS ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def test_complex_flow_table_decomposition(self):
@@ -831,5 +1270,367 @@ class test_logical_device_agent(FlowHelpers):
         ))
 
 
+
+class LargeLogicalDevice(object):
+    """Agent of a logical device of one OLT and n_onus ONUs"""
+
+    n_onus = 1000
+
+    def add_onu(self, i):
+        onu = 'onu%d' % i
+        self.devices[onu] = Device(id=onu, parent_id='olt', parent_port_no=1,
+                                   vlan=100 + i)
+        self.ports[onu] = [
+            Port(port_no=0, type=Port.ETHERNET_UNI, device_id=onu),
+            Port(port_no=1, type=Port.PON_ONU, device_id=onu,
+                 peers=[Port.PeerPort(device_id='olt', port_no=1)])]
+        self.ports['olt'][1].peers.add(device_id=onu, port_no=1)
+        port = LogicalPort(id=str(i + 1), device_id=onu, device_port_no=0,
+                           ofp_port=ofp.ofp_port(port_no=i + 1))
+        self.ld_ports.append(port)
+        return port
+
+    def mk_qinq_flows(self, n):
+        """A controller-bound flow, and two Q-in-Q flows per ONU"""
+        flows = [mk_flow_stat(
+            priority=1000,
+            match_fields=[eth_type(0x888e)],
+            actions=[output(ofp.OFPP_CONTROLLER)])]
+        for i in xrange(n):
+            flows.append(mk_flow_stat(
+                priority=500,
+                match_fields=[in_port(i + 1), vlan_vid(4096)],
+                actions=[set_field(vlan_vid(4096 + 100 + i))],
+                next_table_id=1))
+            flows.append(mk_flow_stat(
+                table_id=1, priority=500,
+                match_fields=[in_port(i + 1), vlan_vid(4096 + 100 + i)],
+                actions=[push_vlan(0x8100), set_field(vlan_vid(4096 + 1000)),
+                         output(0)]))
+        return flows
+
+    def mk_agent(self, n=None, agent_cls=LogicalDeviceAgent):
+        n = self.n_onus if n is None else n
+        devices = self.devices = dict(
+            olt=Device(id='olt', root=True, parent_id='id'))
+        ports = self.ports = dict(olt=[
+            Port(port_no=0, type=Port.ETHERNET_NNI, device_id='olt'),
+            Port(port_no=1, type=Port.PON_OLT, device_id='olt')])
+        ld_ports = self.ld_ports = [
+            LogicalPort(id='0', device_id='olt', device_port_no=0,
+                        root_port=True, ofp_port=ofp.ofp_port(port_no=0))]
+        for i in xrange(n):
+            self.add_onu(i)
+
+        self.updated = []
+
+        def get(path):
+            path = path[len('/devices/'):]
+            if path.endswith('/ports'):
+                return ports[path[:-len('/ports')]]
+            return devices[path]
+
+        root_proxy = Mock()
+        root_proxy.get = get
+        root_proxy.update = lambda path, data: self.updated.append(path)
+        ld = LogicalDevice(id='id', root_device_id='olt')
+        ld_proxy = Mock()
+        ld_proxy.get = lambda p: ld_ports if p == '/ports' else ld
+        self.flows = Flows()
+        flows_proxy = Mock()
+        flows_proxy.get = lambda _: self.flows
+        groups_proxy = Mock()
+        groups_proxy.get = lambda _: FlowGroups()
+
+        core = Mock()
+        core.get_proxy = lambda path: \
+            root_proxy if path == '/' else (
+                ld_proxy if path.endswith('id') else (
+                    flows_proxy if path.endswith('flows') else groups_proxy))
+        agent = agent_cls(core, ld)
+        agent.get_all_default_rules()  # prepare routes and default rules
+
+        def flows_updated(_, flows):
+            # as the flow table update callback would
+            self.flows = flows
+            self.on_update(flows)
+        flows_proxy.update = flows_updated
+        return agent
+
+
+class TestFlowDecompositionPerformance(LargeLogicalDevice, TestCase):
+    """
+    Prints the time per flow-mod to decompose the flow table of a logical
+    device of one OLT and 1k ONUs, with a flow per ONU added one at a time,
+    decomposing the whole flow table vs decomposing incrementally.
+    """
+
+    checkpoints = (100, 500, 1000)
+    n_mods = 10  # flow-mods measured at each checkpoint
+
+    def mk_flow_mod(self, i):
+        # an upstream (olt) and a downstream (onu) flow per ONU
+        if i % 2:
+            return mk_simple_flow_mod(
+                priority=1000,
+                match_fields=[in_port(i / 2 + 1), eth_type(0x888e)],
+                actions=[output(ofp.OFPP_CONTROLLER)])
+        return mk_simple_flow_mod(
+            priority=600,
+            match_fields=[in_port(0), vlan_vid(4096 + 100 + i / 2)],
+            actions=[set_field(vlan_vid(4096)), output(i / 2 + 1)])
+
+    def test_add_flows_one_at_a_time(self):
+        agent = self.mk_agent()
+
+        def decompose_whole(flows):
+            agent._update_device_rules(agent.decompose_rules(flows.items, []))
+
+        def decompose_incrementally(flows):
+            agent._flow_table_updated(flows)
+
+        print
+        print '%8s %20s %20s %20s' % ('flows', 'whole [ms/mod]',
+                                      'incremental [ms/mod]',
+                                      'devices per mod')
+        self.on_update = decompose_incrementally
+        i = 0
+        for checkpoint in self.checkpoints:
+            while i < checkpoint:
+                agent.update_flow_table(self.mk_flow_mod(i))
+                i += 1
+            results = []
+            for self.on_update in (decompose_whole, decompose_incrementally):
+                del self.updated[:]
+                t0 = time()
+                for _ in xrange(self.n_mods):
+                    agent.update_flow_table(self.mk_flow_mod(i))
+                    i += 1
+                results.append((1000 * (time() - t0) / self.n_mods,
+                                len(self.updated) / 2 / self.n_mods))
+            print '%8d %20.2f %20.2f %20s' % (
+                checkpoint, results[0][0], results[1][0],
+                '%d / %d' % (results[0][1], results[1][1]))
+
+        # both ways have the same result
+        whole = agent.decompose_rules(self.flows.items, [])
+        self.assertEqual(agent._decomposition.device_rules, whole)
+
+    def test_burst_of_flow_mods(self):
+        """
+        Prints the time to apply a burst of 1k flow-mods (one per ONU)
+        one at a time vs in bulk, as sent by the ofagent
+        """
+        flow_mods = [self.mk_flow_mod(i) for i in xrange(self.n_onus)]
+        print
+        print '%12s %14s %14s %14s' % (
+            'flow-mods', 'time [s]', 'mods/s', 'table writes')
+        results = []
+        for bulk in (False, True):
+            agent = self.mk_agent()
+            writes = []
+            def on_update(flows):
+                writes.append(flows)
+                agent._flow_table_updated(flows)
+            self.on_update = on_update
+            t0 = time()
+            if bulk:
+                agent.update_flow_table_bulk(flow_mods)
+            else:
+                for flow_mod in flow_mods:
+                    agent.update_flow_table(flow_mod)
+            elapsed = time() - t0
+            results.append(agent._decomposition.device_rules)
+            print '%12s %14.2f %14.0f %14d' % (
+                'bulk' if bulk else 'one by one', elapsed,
+                len(flow_mods) / elapsed, len(writes))
+        self.assertEqual(results[0], results[1])
+
+
+class TestFlowIdentityPerformance(TestCase):
+    """
+    Prints the time per flow to compute its id, and to compare it with
+    another, field by field vs by id, for 100k flows.
+    """
+
+    n_flows = 100000
+
+    def test_flow_identity(self):
+        flows = [mk_flow_stat(
+            priority=1000,
+            match_fields=[in_port(i % 64), vlan_vid(4096 + i % 4000),
+                          eth_type(0x800), ipv4_dst(i)],
+            actions=[output(1)]
+        ) for i in xrange(self.n_flows)]
+        others = flows[1:] + flows[:1]
+
+        def former_hash(flow):
+            hex = md5('{},{},{},{},{}'.format(
+                flow.table_id, flow.priority, flow.flags, flow.cookie,
+                flow.match.SerializeToString())).hexdigest()
+            return int(hex[:16], 16)
+
+        def former_match(f1, f2):
+            for key in ('table_id', 'priority', 'flags', 'cookie', 'match'):
+                if getattr(f1, key) != getattr(f2, key):
+                    return False
+            return True
+
+        results = []
+        for hash_flow in (former_hash, hash_flow_stats):
+            t0 = time()
+            for flow in flows:
+                hash_flow(flow)
+            results.append(time() - t0)
+        for match in (former_match, LogicalDeviceAgent.flow_match):
+            t0 = time()
+            for f1, f2 in izip(flows, others):
+                match(f1, f2)
+            results.append(time() - t0)
+
+        print
+        print '%8s %14s %14s %14s %14s' % (
+            'flows', 'md5 hex [us]', 'hash [us]', 'match [us]',
+            'by id [us]')
+        print '%8d %14.2f %14.2f %14.2f %14.2f' % ((self.n_flows,) + tuple(
+            1e6 * r / self.n_flows for r in results))
+
+
+class ScanningRoutesAgent(LogicalDeviceAgent):
+
+    def get_route(self, ingress_port_no, egress_port_no):
+        # half routes found by scanning the route table, as formerly done
+        self._assure_cached_tables_up_to_date()
+        if egress_port_no is not None and \
+                (egress_port_no & 0x7fffffff) == ofp.OFPP_CONTROLLER:
+            egress_port_no = self._nni_logical_port_no
+        if ingress_port_no is None:
+            for (ingress, egress), route in self._routes.iteritems():
+                if egress == egress_port_no:
+                    return [None, route[1]]
+        if egress_port_no is None:
+            for (ingress, egress), route in self._routes.iteritems():
+                if ingress == ingress_port_no:
+                    return [route[0], None]
+        return self._routes.get((ingress_port_no, egress_port_no))
+
+
+class TestDecompositionRoutePerformance(LargeLogicalDevice, TestCase):
+    """
+    Prints the time to decompose a flow table with Q-in-Q flows for each
+    of n ONUs, whose first table flows take half routes, scanning the
+    route table for them vs looking them up in its indexes.
+    """
+
+    sizes = (300, 1000, 3000)
+
+    def test_decompose_rules(self):
+        print
+        print '%8s %8s %16s %16s %16s %16s' % (
+            'onus', 'flows', 'decompose scan', 'decompose index',
+            'half routes scan', 'half routes index')
+        print '%8s %8s %16s %16s %16s %16s' % (
+            '', '', '[ms]', '[ms]', '[ms]', '[ms]')
+        for n in self.sizes:
+            flows = self.mk_qinq_flows(n)
+            results = []
+            for agent_cls in (ScanningRoutesAgent, LogicalDeviceAgent):
+                agent = self.mk_agent(n, agent_cls)
+                t0 = time()
+                rules = agent.decompose_rules(flows, [])
+                t_decompose = time() - t0
+                t0 = time()
+                for i in xrange(n):
+                    agent.get_route(i + 1, None)
+                results.append((t_decompose, time() - t0, rules))
+            self.assertEqual(results[0][2], results[1][2])
+            print '%8d %8d %16.0f %16.0f %16.1f %16.1f' % (
+                n, len(flows), 1000 * results[0][0], 1000 * results[1][0],
+                1000 * results[0][1], 1000 * results[1][1])
+
+
+class TestDecompositionCachePerformance(LargeLogicalDevice, TestCase):
+    """
+    Prints the time to decompose the flow table with Q-in-Q flows for 1k
+    ONUs: whole, with decompositions not cached yet vs cached, and
+    incrementally once all flows were deleted and added again.
+    """
+
+    def test_decompose_again(self):
+        flows = self.mk_qinq_flows(self.n_onus)
+        agent = self.mk_agent()
+        results = []
+        for _ in xrange(2):
+            t0 = time()
+            agent.decompose_rules(flows, [])
+            results.append(time() - t0)
+        agent.decompose_rules_incrementally(flows, [])
+        agent.decompose_rules_incrementally([], [])
+        t0 = time()
+        agent.decompose_rules_incrementally(flows, [])
+        results.append(time() - t0)
+
+        metrics = agent.decomposition_cache_metrics()
+        print
+        print '%8s %14s %14s %14s %8s %8s' % (
+            'flows', 'cold [ms]', 'cached [ms]', 're-added [ms]', 'hits',
+            'misses')
+        print '%8d %14.0f %14.0f %14.0f %8d %8d' % (
+            (len(flows),) + tuple(1000 * r for r in results) +
+            (metrics['hits'], metrics['misses']))
+        self.assertEqual(metrics['misses'], len(flows))
+
+
+class TestRoutePerformance(LargeLogicalDevice, TestCase):
+    """
+    Prints the time to compute the routes of a logical device of one OLT
+    and n ONUs, by shortest paths between all boundary ports vs along the
+    tree, and to patch them for an ONU port added and removed.
+    """
+
+    sizes = (100, 200, 1000, 3000)
+    max_all_pairs = 200  # all pairs take too long beyond
+
+    def test_routes(self):
+        print
+        print '%8s %16s %16s %16s %16s' % (
+            'onus', 'all pairs [ms]', 'tree [ms]', 'port add [ms]',
+            'port rem [ms]')
+        for n in self.sizes:
+            agent = self.mk_agent(n)
+            self.on_update = lambda flows: None
+            t0 = time()
+            graph, routes = agent.compute_routes(
+                agent.root_proxy, self.ld_ports)
+            t_tree = time() - t0
+            self.assertEqual(len(routes), 2 * n)
+
+            t_all_pairs = None
+            if n <= self.max_all_pairs:
+                boundary_ports = dict(
+                    ((lp.device_id, lp.device_port_no), lp.ofp_port.port_no)
+                    for lp in self.ld_ports)
+                t0 = time()
+                self.assertEqual(all_pairs_routes(graph, boundary_ports),
+                                 routes)
+                t_all_pairs = time() - t0
+
+            agent.get_all_default_rules()
+            port = self.add_onu(n)
+            t0 = time()
+            agent._update_cached_tables(port, added=True)
+            t_add = time() - t0
+            self.assertEqual(len(agent._routes), 2 * n + 2)
+            t0 = time()
+            agent._update_cached_tables(port, added=False)
+            t_remove = time() - t0
+            self.assertEqual(len(agent._routes), 2 * n)
+
+            print '%8d %16s %16.2f %16.3f %16.3f' % (
+                n, '-' if t_all_pairs is None else '%.0f' % (
+                    1000 * t_all_pairs),
+                1000 * t_tree, 1000 * t_add, 1000 * t_remove)
+
+
 if __name__ == '__main__':
     main()
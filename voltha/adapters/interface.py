@@ -109,11 +109,17 @@ class IAdapterInterface(Interface):
 
     def update_flows_incrementally(device, flow_changes, group_changes):
         """
-        [This mode is not supported yet.]
+        Called after any flow or group table change, but only if the device
+        supports add/remove mode, which is expressed by the
+        'accepts_add_remove_flow_updates' capability attribute of the device
+        type. Only the changes since the tables were last passed on to the
+        adapter are given, flows being told apart by id and groups by group
+        id. If this fails and the device also supports bulk mode, the tables
+        are then passed on in bulk.
         :param device: A Voltha.Device object.
-        :param flow_changes:
-        :param group_changes:
-        :return:
+        :param flow_changes: An openflow_v13.FlowChanges object
+        :param group_changes: An openflow_v13.FlowGroupChanges object
+        :return: (Deferred or None)
         """
 
     def send_proxied_message(proxy_address, msg):
@@ -20,7 +20,6 @@ Agent to play gateway between CORE and an individual adapter.
 from uuid import uuid4
 
 import structlog
-from google.protobuf.json_format import MessageToJson
 from scapy.packet import Packet
 from twisted.internet.defer import inlineCallbacks, returnValue
 from zope.interface import implementer
@@ -37,6 +36,30 @@ from voltha.registry import registry
 from voltha.core.flow_decomposer import OUTPUT
 
 
+class ProxyAddressTopics(object):
+    """
+    The event bus topics of the messages proxied to and from child devices,
+    made once per proxy address and then looked up by its fields, as they
+    are needed for each message.
+    """
+
+    def __init__(self):
+        self._topics = {}  # (device_id, channel_id) -> (rx topic, tx topic)
+
+    def __len__(self):
+        return len(self._topics)
+
+    def get(self, proxy_address):
+        """Return the rx and tx topics of proxy_address"""
+        key = (proxy_address.device_id, proxy_address.channel_id)
+        topics = self._topics.get(key)
+        if topics is None:
+            # str topics, as the event bus requires
+            address = '{}:{}'.format(*key)
+            topics = self._topics[key] = ('rx:' + address, 'tx:' + address)
+        return topics
+
+
 @implementer(IAdapterAgent)
 class AdapterAgent(object):
     """
@@ -58,6 +81,7 @@ class AdapterAgent(object):
         self.root_proxy = self.core.get_proxy('/')
         self._rx_event_subscriptions = {}
         self._tx_event_subscriptions = {}
+        self._proxy_address_topics = ProxyAddressTopics()
         self.event_bus = EventBusClient()
         self.log = structlog.get_logger(adapter_name=adapter_name)
 
@@ -113,9 +137,10 @@ class AdapterAgent(object):
         Make sure device types are registered in Core
         """
         device_types = self.adapter.device_types()
-        for device_type in device_types.items:
-            key = device_type.id
-            self._make_up_to_date('/device_types', key, device_type)
+        self._make_all_up_to_date(
+            '/device_types',
+            [(device_type.id, device_type)
+             for device_type in device_types.items])
 
     def _make_up_to_date(self, container_path, key, data):
         full_path = container_path + '/' + str(key)
@@ -127,6 +152,21 @@ class AdapterAgent(object):
             root_proxy.add(container_path, data)
         return full_path
 
+    def _make_all_up_to_date(self, container_path, items):
+        """
+        Like _make_up_to_date for many (key, data) items of a container,
+        resulting in a single change of the config tree
+        """
+        root_proxy = self.core.get_proxy('/')
+        ops = []
+        for key, data in items:
+            try:
+                root_proxy.get(container_path + '/' + str(key))
+                ops.append(('update', data))
+            except KeyError:
+                ops.append(('add', data))
+        root_proxy.bulk(container_path, ops)
+
     # ~~~~~~~~~~~~~~~~~~~~~ Core-Facing Service ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def adopt_device(self, device):
@@ -142,7 +182,7 @@ class AdapterAgent(object):
         return self.adapter.update_flows_bulk(device, flows, groups)
 
     def update_flows_incrementally(self, device, flow_changes, group_changes):
-        return self.update_flows_incrementally(
+        return self.adapter.update_flows_incrementally(
             device, flow_changes, group_changes)
 
     # ~~~~~~~~~~~~~~~~~~~ Adapter-Facing Service ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -268,13 +308,11 @@ class AdapterAgent(object):
 
     def _gen_rx_proxy_address_topic(self, proxy_address):
         """Generate unique topic name specific to this proxy address for rx"""
-        topic = 'rx:' + MessageToJson(proxy_address)
-        return topic
+        return self._proxy_address_topics.get(proxy_address)[0]
 
     def _gen_tx_proxy_address_topic(self, proxy_address):
         """Generate unique topic name specific to this proxy address for tx"""
-        topic = 'tx:' + MessageToJson(proxy_address)
-        return topic
+        return self._proxy_address_topics.get(proxy_address)[1]
 
     def register_for_proxied_messages(self, proxy_address):
         topic = self._gen_rx_proxy_address_topic(proxy_address)
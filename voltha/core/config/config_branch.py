@@ -31,6 +31,7 @@ class ConfigBranch(object):
         '_origin',  # _latest at time of branching on default branch
         '_revs',  # dict of rev-hash to ref of ConfigRevision
         '_latest',  # ref to latest committed ConfigRevision
+        '_touched',  # per field name, keys of children changed in branch
         '__weakref__'
     )
 
@@ -40,6 +41,7 @@ class ConfigBranch(object):
         self._origin = origin
         self._revs = WeakValueDictionary() if auto_prune else OrderedDict()
         self._latest = origin
+        self._touched = None if txid is None else {}
 
     def __getitem__(self, hash):
         return self._revs[hash]
@@ -51,3 +53,15 @@ class ConfigBranch(object):
     @property
     def origin(self):
         return self._origin
+
+    def touch(self, field_name, key):
+        """
+        Record that the child of given key in given field was added, changed
+        or removed in this (transaction) branch, so that merging the branch
+        needs to look at those children only.
+        """
+        if self._touched is not None:
+            touched = self._touched.get(field_name)
+            if touched is None:
+                touched = self._touched[field_name] = OrderedDict()
+            touched[key] = None
@@ -0,0 +1,525 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Immutable, ordered and key-indexed container of child config revisions.
+
+Keyed container fields (e.g., /devices or /logical_devices/{id}/ports) can
+hold many thousands of children. Keeping them in plain lists made every
+keyed lookup a linear scan and every change a full copy of the list. The
+KeyedChildren class below keeps the children in two persistent treaps:
+
+- an order tree, sorted by an insertion sequence number, which keeps the
+  original insertion order of the children and supports positional access;
+- a key tree, sorted by the value of the key field, which maps each key to
+  its sequence number in the order tree.
+
+All modifications are done by path copying, so a modified container shares
+all but O(log N) tree nodes with the container it was derived from, and the
+original stays intact. This is what makes it safe to share the containers
+between config revisions.
+
+Node priorities are derived from the child keys, not from random numbers.
+The shape of the order tree is therefore a function of the ordered set of
+keys only, no matter what sequence of operations led to it. This allows
+each order tree node to carry a Merkle digest over the revision hashes of
+its subtree: the digest of the root node depends only on the ordered list
+of child revision hashes, yet replacing, adding or removing a child
+re-hashes only the O(log N) nodes on the modified path.
+
+The LazyChildren class at the end is the children dict of a revision that
+was loaded from persistence. It holds only the hashes of the children of
+each field until the field is accessed, at which point the children are
+loaded by a loader callback.
+"""
+
+from zlib import crc32
+
+from voltha.core.config import config_hash
+
+
+def _priority(key):
+    if isinstance(key, unicode):
+        key = key.encode('utf-8')
+    else:
+        key = str(key)
+    return crc32(key) & 0xffffffff
+
+
+class _OrderNode(object):
+    """Node of the order tree, holding a child rev"""
+
+    __slots__ = ('seq', 'rev', 'prio', 'left', 'right', 'size', 'hash')
+
+    def __init__(self, seq, rev, prio, left=None, right=None):
+        self.seq = seq
+        self.rev = rev
+        self.prio = prio
+        self.left = left
+        self.right = right
+        self._update()
+
+    def _update(self):
+        left, right = self.left, self.right
+        if left is None:
+            if right is None:
+                self.size = 1
+                self.hash = config_hash.hash_blobs(self.rev._hash)
+            else:
+                self.size = 1 + right.size
+                self.hash = config_hash.hash_blobs(self.rev._hash, right.hash)
+        elif right is None:
+            self.size = 1 + left.size
+            self.hash = config_hash.hash_blobs(left.hash, self.rev._hash)
+        else:
+            self.size = 1 + left.size + right.size
+            self.hash = config_hash.hash_blobs(
+                left.hash, self.rev._hash, right.hash)
+
+
+class _KeyNode(object):
+    """Node of the key tree, mapping a key to a sequence number"""
+
+    __slots__ = ('key', 'seq', 'prio', 'left', 'right')
+
+    def __init__(self, key, seq, prio, left=None, right=None):
+        self.key = key
+        self.seq = seq
+        self.prio = prio
+        self.left = left
+        self.right = right
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ order tree ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _merge(a, b):
+    """Join two order trees where all of a precedes all of b"""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    # on ties the left node wins, which keeps the tree shape canonical
+    if a.prio >= b.prio:
+        return _OrderNode(a.seq, a.rev, a.prio, a.left, _merge(a.right, b))
+    return _OrderNode(b.seq, b.rev, b.prio, _merge(a, b.left), b.right)
+
+
+def _replace(node, seq, rev):
+    if seq < node.seq:
+        return _OrderNode(node.seq, node.rev, node.prio,
+                          _replace(node.left, seq, rev), node.right)
+    if seq > node.seq:
+        return _OrderNode(node.seq, node.rev, node.prio,
+                          node.left, _replace(node.right, seq, rev))
+    return _OrderNode(seq, rev, node.prio, node.left, node.right)
+
+
+def _remove(node, seq):
+    if seq < node.seq:
+        return _OrderNode(node.seq, node.rev, node.prio,
+                          _remove(node.left, seq), node.right)
+    if seq > node.seq:
+        return _OrderNode(node.seq, node.rev, node.prio,
+                          node.left, _remove(node.right, seq))
+    return _merge(node.left, node.right)
+
+
+def _find(node, seq):
+    while node is not None:
+        if seq < node.seq:
+            node = node.left
+        elif seq > node.seq:
+            node = node.right
+        else:
+            return node
+    raise KeyError(seq)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ key tree ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _kmerge(a, b):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    if a.prio >= b.prio:
+        return _KeyNode(a.key, a.seq, a.prio, a.left, _kmerge(a.right, b))
+    return _KeyNode(b.key, b.seq, b.prio, _kmerge(a, b.left), b.right)
+
+
+def _ksplit(node, key):
+    """Split key tree into nodes with keys below and above key"""
+    if node is None:
+        return None, None
+    if key < node.key:
+        left, right = _ksplit(node.left, key)
+        return left, _KeyNode(node.key, node.seq, node.prio, right, node.right)
+    left, right = _ksplit(node.right, key)
+    return _KeyNode(node.key, node.seq, node.prio, node.left, left), right
+
+
+def _kinsert(node, new):
+    if node is None:
+        return new
+    if new.prio > node.prio:
+        left, right = _ksplit(node, new.key)
+        return _KeyNode(new.key, new.seq, new.prio, left, right)
+    if new.key < node.key:
+        return _KeyNode(node.key, node.seq, node.prio,
+                        _kinsert(node.left, new), node.right)
+    return _KeyNode(node.key, node.seq, node.prio,
+                    node.left, _kinsert(node.right, new))
+
+
+def _kremove(node, key):
+    if key < node.key:
+        return _KeyNode(node.key, node.seq, node.prio,
+                        _kremove(node.left, key), node.right)
+    if key > node.key:
+        return _KeyNode(node.key, node.seq, node.prio,
+                        node.left, _kremove(node.right, key))
+    return _kmerge(node.left, node.right)
+
+
+def _klookup(node, key):
+    while node is not None:
+        if key < node.key:
+            node = node.left
+        elif key > node.key:
+            node = node.right
+        else:
+            return node.seq
+    raise KeyError(key)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ bulk build ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _build(nodes):
+    """
+    Link up an already sorted list of fresh nodes into a treap in O(N),
+    using the classic stack based Cartesian tree construction. Since the
+    nodes are not shared yet, it is ok to modify them in place.
+    """
+    stack = []
+    for node in nodes:
+        last = None
+        while stack and stack[-1].prio < node.prio:
+            last = stack.pop()
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    return stack[0] if stack else None
+
+
+def _fix_order_nodes(node):
+    """Recompute size and digest of order tree nodes linked up by _build"""
+    if node.left is not None:
+        _fix_order_nodes(node.left)
+    if node.right is not None:
+        _fix_order_nodes(node.right)
+    if node.left is not None or node.right is not None:
+        node._update()
+
+
+class KeyedChildren(object):
+    """
+    Ordered, key-indexed and immutable collection of child revisions of a
+    keyed container field. All modifier methods return a new instance.
+    """
+
+    __slots__ = (
+        '_keyname',  # name of key field in child data
+        '_root',  # root of order tree
+        '_keys',  # root of key tree
+        '_next_seq'  # sequence number to use for next appended child
+    )
+
+    def __init__(self, keyname, revs=()):
+        self._keyname = keyname
+        order_nodes = []
+        key_nodes = []
+        for seq, rev in enumerate(revs):
+            key = getattr(rev._config._data, keyname)
+            prio = _priority(key)
+            order_nodes.append(_OrderNode(seq, rev, prio))
+            key_nodes.append(_KeyNode(key, seq, prio))
+        key_nodes.sort(key=lambda n: n.key)
+        for i in xrange(1, len(key_nodes)):
+            if key_nodes[i - 1].key == key_nodes[i].key:
+                raise ValueError('Duplicate key "{}"'.format(key_nodes[i].key))
+        self._root = _build(order_nodes)
+        if self._root is not None:
+            _fix_order_nodes(self._root)
+        self._keys = _build(key_nodes)
+        self._next_seq = len(order_nodes)
+
+    def _derive(self, root, keys, next_seq):
+        new = object.__new__(KeyedChildren)
+        new._keyname = self._keyname
+        new._root = root
+        new._keys = keys
+        new._next_seq = next_seq
+        return new
+
+    @property
+    def keyname(self):
+        return self._keyname
+
+    @property
+    def hash(self):
+        """
+        Merkle digest over the ordered hashes of the children. Two
+        containers holding the same children in the same order have the
+        same digest.
+        """
+        return '' if self._root is None else self._root.hash
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ accessors ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def __len__(self):
+        return 0 if self._root is None else self._root.size
+
+    def __iter__(self):
+        stack = []
+        node = self._root
+        while stack or node is not None:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                yield node.rev
+                node = node.right
+
+    def __getitem__(self, index):
+        """Positional access, in insertion order"""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError('child index out of range')
+        node = self._root
+        while 1:
+            left_size = 0 if node.left is None else node.left.size
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.rev
+            else:
+                index -= left_size + 1
+                node = node.right
+
+    def changed_since(self, known, visited):
+        """
+        Return the children stored below those tree nodes whose digest is
+        not in known, in no particular order. Sub-trees with a known digest
+        are skipped, which makes this proportional to the number of changes
+        if known holds the digests of a former version of the container.
+        The digests of the visited tree nodes are appended to visited.
+        """
+        revs = []
+        stack = [] if self._root is None else [self._root]
+        while stack:
+            node = stack.pop()
+            if node.hash in known:
+                continue
+            visited.append(node.hash)
+            revs.append(node.rev)
+            if node.left is not None:
+                stack.append(node.left)
+            if node.right is not None:
+                stack.append(node.right)
+        return revs
+
+    def keys(self):
+        keyname = self._keyname
+        return [getattr(rev._config._data, keyname) for rev in self]
+
+    def by_key(self, key):
+        """Return child rev with given key or raise KeyError"""
+        try:
+            seq = _klookup(self._keys, key)
+        except KeyError:
+            raise KeyError('key {}={} not found'.format(self._keyname, key))
+        return _find(self._root, seq).rev
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if not isinstance(other, KeyedChildren):
+            return False
+        return self.hash == other.hash
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'KeyedChildren({}, {})'.format(
+            self._keyname, [rev._hash for rev in self])
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ modifiers ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def replace(self, rev):
+        """Return a NEW container where the child with same key is replaced"""
+        key = getattr(rev._config._data, self._keyname)
+        try:
+            seq = _klookup(self._keys, key)
+        except KeyError:
+            raise KeyError('key {}={} not found'.format(self._keyname, key))
+        root = _replace(self._root, seq, rev)
+        return self._derive(root, self._keys, self._next_seq)
+
+    def append(self, rev):
+        """Return a NEW container with the child added to the end"""
+        key = getattr(rev._config._data, self._keyname)
+        try:
+            _klookup(self._keys, key)
+        except KeyError:
+            pass
+        else:
+            raise ValueError('Duplicate key "{}"'.format(key))
+        seq = self._next_seq
+        prio = _priority(key)
+        root = _merge(self._root, _OrderNode(seq, rev, prio))
+        keys = _kinsert(self._keys, _KeyNode(key, seq, prio))
+        return self._derive(root, keys, seq + 1)
+
+    def remove(self, key):
+        """Return a NEW container without the child of given key"""
+        try:
+            seq = _klookup(self._keys, key)
+        except KeyError:
+            raise KeyError('key {}={} not found'.format(self._keyname, key))
+        root = _remove(self._root, seq)
+        keys = _kremove(self._keys, key)
+        return self._derive(root, keys, self._next_seq)
+
+
+class PendingChildren(object):
+    """Hashes of the not yet loaded children of a field"""
+
+    __slots__ = (
+        'hashes',  # ordered list of child revision hashes
+        'digest',  # Merkle digest of keyed children, if known
+        'keyed',  # True for keyed containers
+        'children'  # loaded children, shared by all holders
+    )
+
+    def __init__(self, hashes, keyed, digest=None):
+        self.hashes = hashes
+        self.keyed = keyed
+        self.digest = digest
+        self.children = None
+
+    def hash_parts(self):
+        """
+        Return what the children contribute to the hash of the revision
+        holding them, or None if that cannot be told without loading them.
+        """
+        if not self.keyed:
+            return self.hashes
+        if self.digest is not None:
+            return [self.digest]
+        return None
+
+
+class LazyChildren(dict):
+    """
+    Dict of field name to children, where the children of a field are
+    loaded on first access as loader(field_name, hashes). Copies share the
+    loaded children, so that a field is loaded only once.
+    """
+
+    __slots__ = (
+        '_loader',
+        '_pending'  # dict of field name to PendingChildren
+    )
+
+    def __init__(self, loader, pending):
+        super(LazyChildren, self).__init__()
+        self._loader = loader
+        self._pending = pending
+
+    def __missing__(self, name):
+        pending = self._pending[name]
+        if pending.children is None:
+            pending.children = self._loader(name, pending.hashes)
+        del self._pending[name]
+        dict.__setitem__(self, name, pending.children)
+        return pending.children
+
+    def __setitem__(self, name, children):
+        self._pending.pop(name, None)
+        dict.__setitem__(self, name, children)
+
+    def __contains__(self, name):
+        return dict.__contains__(self, name) or name in self._pending
+
+    def __len__(self):
+        return dict.__len__(self) + len(self._pending)
+
+    def __iter__(self):
+        for name in dict.__iter__(self):
+            yield name
+        for name in self._pending.keys():
+            yield name
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self)
+
+    def get(self, name, default=None):
+        return self[name] if name in self else default
+
+    def pending(self, name):
+        """Return PendingChildren of field, or None if already loaded"""
+        return self._pending.get(name)
+
+    def loaded_values(self):
+        return dict.values(self)
+
+    def load_all(self):
+        for name in self._pending.keys():
+            self[name]
+
+    def itervalues(self):
+        self.load_all()
+        return dict.itervalues(self)
+
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def iteritems(self):
+        self.load_all()
+        return dict.iteritems(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
+
+    def copy(self):
+        new = LazyChildren(self._loader, dict(self._pending))
+        dict.update(new, self)
+        return new
+
+    def __repr__(self):
+        return 'LazyChildren(loaded={}, pending={})'.format(
+            dict.keys(self), self._pending.keys())
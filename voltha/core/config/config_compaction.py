@@ -0,0 +1,292 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Mark-and-sweep compaction of the kv store of a persisted config tree.
+
+Revisions do not delete their blobs when they are garbage collected, so
+blobs of superseded revisions accumulate in the kv store until compacted.
+A compaction cycle first marks everything that is still needed:
+
+- the config revisions reachable in memory from the latest committed
+  revision, from tags and from open transaction branches, plus all other
+  config revisions alive in memory, as any of them may become (part of)
+  the committed tree;
+- everything reachable in the kv store from the persisted 'root' record,
+  which may lag behind the tree in memory when written behind;
+- everything reachable in the kv store from the hashes of children that
+  were not loaded yet (see LazyChildren).
+
+Since the tree keeps changing while the cycle runs, the roots are marked
+once more at the end of the mark phase, which visits only what is new.
+It then deletes all other keys in batches. Both phases are split into
+ticks that do a bounded amount of work, so that a cycle over a large store
+does not block the reactor.
+"""
+from time import time
+
+import structlog
+from simplejson import loads
+
+from voltha.core.config.config_children import LazyChildren
+from voltha.core.config.config_record import DICTIONARY_KEY_PREFIX
+from voltha.core.config.config_rev import _rev_cache
+from voltha.core.config.config_rev_persisted import PersistedConfigRevision, \
+    fetch_many
+
+log = structlog.get_logger()
+
+
+class KVStoreCompactor(object):
+
+    def __init__(self, root, interval=300, tick_interval=0.1,
+                 work_per_tick=1000, clock=None):
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self._root = root
+        self._kv_store = root._kv_store
+        self._interval = interval  # between cycles
+        self._tick_interval = tick_interval  # between ticks of a cycle
+        self._work_per_tick = work_per_tick  # max keys visited per tick
+        self._clock = clock
+        self._scheduled = None
+
+        # state of current cycle
+        self._phase = None  # None, 'mark' or 'sweep'
+        self._stage = 0  # 1: roots marked once more, 2: alive revs marked
+        self._marked = None
+        self._revs = None  # revisions to walk in memory
+        self._hashes = None  # hashes to walk in kv store
+        self._root_latest = None  # latest in 'root' record as walked
+        self._sweep_keys = None
+        self._cycle_started = None
+
+        # metrics
+        self.cycles = 0
+        self.ticks = 0
+        self.reclaimed_blobs = 0
+        self.reclaimed_bytes = 0
+        self.last_reclaimed_blobs = 0
+        self.last_reclaimed_bytes = 0
+        self.last_cycle_duration = 0.
+
+    def start(self):
+        if self._scheduled is None:
+            self._scheduled = self._clock.callLater(
+                self._interval, self._scheduled_tick)
+        return self
+
+    def stop(self):
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+
+    def _scheduled_tick(self):
+        self._scheduled = None
+        try:
+            done = self.tick()
+        except Exception, e:
+            log.exception('compaction-failed', e=e)
+            self._phase = None
+            done = True
+        self._scheduled = self._clock.callLater(
+            self._interval if done else self._tick_interval,
+            self._scheduled_tick)
+
+    def run(self):
+        """Run a complete cycle now"""
+        while not self.tick():
+            pass
+
+    def tick(self):
+        """Do a bounded amount of work; return True when a cycle is done"""
+        self.ticks += 1
+        if self._phase is None:
+            self._start_cycle()
+            return False
+        elif self._phase == 'mark':
+            self._mark_some()
+            return False
+        else:
+            return self._sweep_some()
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ mark ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _start_cycle(self):
+        self._cycle_started = time()
+        self._marked = set()
+        self._revs = []
+        self._hashes = []
+        self._root_latest = None
+        self._stage = 0
+        self._push_roots()
+        self._phase = 'mark'
+
+    def _push_roots(self):
+        root = self._root
+        self._revs.append(root.latest)
+        self._revs.extend(root._tags.itervalues())
+        for txid, nodes in root._dirty_nodes.iteritems():
+            for node in nodes:
+                branch = node._branches.get(txid)
+                if branch is not None:
+                    self._revs.append(branch._latest)
+        self._push_persisted_root()
+
+    def _push_persisted_root(self):
+        try:
+            root_data = loads(self._kv_store['root'])
+        except KeyError:
+            return
+        if root_data['latest'] != self._root_latest:
+            self._root_latest = root_data['latest']
+            self._hashes.append(root_data['latest'])
+            self._hashes.extend(root_data['tags'].itervalues())
+
+    def _mark_alive(self):
+        # ConfigDataRevisions are in the cache as well, without children
+        for rev in _rev_cache.values():
+            if rev._hash not in self._marked:
+                self._marked.add(rev._hash)
+                if isinstance(getattr(rev, '_children', None), LazyChildren):
+                    self._revs.append(rev)
+
+    def _mark_some(self):
+        budget = self._work_per_tick
+        budget -= self._mark_revs(budget)
+        if budget > 0:
+            budget -= self._mark_hashes(budget)
+        if budget < self._work_per_tick:
+            return
+
+        # nothing left to walk
+        if self._stage == 0:
+            self._stage = 1
+            self._push_roots()
+        elif self._stage == 1:
+            self._stage = 2
+            self._mark_alive()
+        else:
+            marked = self._marked
+            # zstd dictionaries are tiny and kept, as blobs of old
+            # revisions may still be decoded with them
+            self._sweep_keys = [
+                key for key in self._kv_store.keys()
+                if key not in marked and key != 'root' and
+                not key.startswith(DICTIONARY_KEY_PREFIX)]
+            self._revs = self._hashes = None
+            self.last_reclaimed_blobs = 0
+            self.last_reclaimed_bytes = 0
+            self._phase = 'sweep'
+
+    def _mark_revs(self, budget):
+        marked = self._marked
+        revs = self._revs
+        visited = 0
+        while revs and visited < budget:
+            rev = revs.pop()
+            visited += 1
+            all_children = rev._children
+            # alive revisions are marked already, but still to be walked
+            if rev._hash in marked and \
+                    not isinstance(all_children, LazyChildren):
+                continue
+            marked.add(rev._hash)
+            marked.add(rev._config._hash)
+            if all_children is None:
+                continue
+            for field_name in all_children:
+                if isinstance(all_children, LazyChildren):
+                    pending = all_children.pending(field_name)
+                    if pending is not None:
+                        self._hashes.extend(pending.hashes)
+                        continue
+                for child_rev in all_children[field_name]:
+                    if child_rev._hash not in marked:
+                        revs.append(child_rev)
+        return visited
+
+    def _mark_hashes(self, budget):
+        marked = self._marked
+        stack = self._hashes
+        hashes = []
+        while stack and len(hashes) < budget:
+            hash = stack.pop()
+            if hash not in marked:
+                marked.add(hash)
+                hashes.append(hash)
+
+        for blob in fetch_many(self._kv_store, hashes):
+            record = PersistedConfigRevision.decode_record(blob)
+            marked.add(record['config'])
+            for child_hashes in record['children'].itervalues():
+                stack.extend(h for h in child_hashes if h not in marked)
+        return len(hashes)
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ sweep ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _sweep_some(self):
+        keys = self._sweep_keys[-self._work_per_tick:]
+        del self._sweep_keys[-self._work_per_tick:]
+
+        # keys may have been added again meanwhile, by revisions re-created
+        # with the same content since the cycle started
+        keys = [key for key in keys if key not in _rev_cache]
+        if keys:
+            n_bytes = sum(
+                len(blob) for blob in fetch_many(self._kv_store, keys))
+            self._delete(keys)
+            if self._root._write_behind is not None:
+                self._root._write_behind.forget(keys)
+            self.last_reclaimed_blobs += len(keys)
+            self.last_reclaimed_bytes += n_bytes
+
+        if self._sweep_keys:
+            return False
+
+        self._phase = None
+        self._marked = None
+        self._sweep_keys = None
+        self.cycles += 1
+        self.reclaimed_blobs += self.last_reclaimed_blobs
+        self.reclaimed_bytes += self.last_reclaimed_bytes
+        self.last_cycle_duration = time() - self._cycle_started
+        log.debug('compaction-done', reclaimed_blobs=self.last_reclaimed_blobs,
+                  reclaimed_bytes=self.last_reclaimed_bytes,
+                  duration=self.last_cycle_duration)
+        return True
+
+    def _delete(self, keys):
+        kv_store = self._kv_store
+        delete_many = getattr(kv_store, 'delete_many', None)
+        if delete_many is not None:
+            delete_many(keys)
+        else:
+            for key in keys:
+                del kv_store[key]
+
+    def metrics(self):
+        return dict(
+            phase=self._phase,
+            cycles=self.cycles,
+            ticks=self.ticks,
+            reclaimed_blobs=self.reclaimed_blobs,
+            reclaimed_bytes=self.reclaimed_bytes,
+            last_reclaimed_blobs=self.last_reclaimed_blobs,
+            last_reclaimed_bytes=self.last_reclaimed_bytes,
+            last_cycle_duration=self.last_cycle_duration
+        )
@@ -0,0 +1,66 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Pluggable hash function used to identify config revisions.
+
+All config revision hashes (config data, revision content and the Merkle
+digests of keyed children) are computed with hash_blobs(*blobs), which
+hashes the concatenation of the given byte strings.
+
+The default is the 64-bit xxHash function if the xxhash package is
+installed, and (truncated) md5 otherwise. The hash function must be
+selected with set_hash_function() before any config tree is created, since
+revisions hashed with different functions are not comparable.
+"""
+
+from hashlib import md5
+
+try:
+    from xxhash import xxh64
+except ImportError:
+    xxh64 = None
+
+
+def md5_hash(*blobs):
+    return md5(''.join(blobs)).hexdigest()[:12]
+
+
+def xxh64_hash(*blobs):
+    return xxh64(''.join(blobs)).hexdigest()
+
+
+hash_functions = {'md5': md5_hash}
+if xxh64 is not None:
+    hash_functions['xxh64'] = xxh64_hash
+
+hash_blobs = xxh64_hash if xxh64 is not None else md5_hash
+
+
+def set_hash_function(name):
+    """Select one of the functions in hash_functions by name"""
+    global hash_blobs
+    try:
+        hash_blobs = hash_functions[name]
+    except KeyError:
+        raise ValueError('Unknown or unavailable hash function "{}"'.format(
+            name))
+
+
+def get_hash_function_name():
+    for name, func in hash_functions.iteritems():
+        if func is hash_blobs:
+            return name
@@ -13,13 +13,12 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 #
-from copy import copy
-
 from jsonpatch import JsonPatch
 from jsonpatch import make_patch
 
 from common.utils.json_format import MessageToDict
 from voltha.core.config.config_branch import ConfigBranch
+from voltha.core.config.config_children import KeyedChildren
 from voltha.core.config.config_proxy import CallbackType, ConfigProxy
 from voltha.core.config.config_rev import is_proto_message, children_fields, \
     ConfigRevision, access_rights
@@ -46,13 +45,6 @@ def check_access_violation(new_msg, old_msg):
                          ', '.join('"%s"' % f for f in violated_fields))
 
 
-def find_rev_by_key(revs, keyname, value):
-    for i, rev in enumerate(revs):
-        if getattr(rev._config._data, keyname) == value:
-            return i, rev
-    raise KeyError('key {}={} not found'.format(keyname, value))
-
-
 class ConfigNode(object):
     """
     Represents a configuration node which can hold a number of revisions
@@ -103,15 +95,9 @@ class ConfigNode(object):
             field_value = getattr(data, field_name)
             if field.is_container:
                 if field.key:
-                    keys_seen = set()
-                    children[field_name] = lst = []
-                    for v in field_value:
-                        rev = self._mknode(v, txid=txid).latest
-                        key = getattr(v, field.key)
-                        if key in keys_seen:
-                            raise ValueError('Duplicate key "{}"'.format(key))
-                        lst.append(rev)
-                        keys_seen.add(key)
+                    children[field_name] = KeyedChildren(field.key, [
+                        self._mknode(v, txid=txid).latest
+                        for v in field_value])
                 else:
                     children[field_name] = [
                         self._mknode(v, txid=txid).latest for v in field_value]
@@ -141,7 +127,8 @@ class ConfigNode(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~ get operation ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def get(self, path=None, hash=None, depth=0, deep=False, txid=None):
+    def get(self, path=None, hash=None, depth=0, deep=False, txid=None,
+            readonly=False):
 
         # depth preparation
         if deep:
@@ -161,12 +148,12 @@ class ConfigNode(object):
         else:
             rev = branch.latest
 
-        return self._get(rev, path, depth)
+        return self._get(rev, path, depth, readonly)
 
-    def _get(self, rev, path, depth):
+    def _get(self, rev, path, depth, readonly=False):
 
         if not path:
-            return self._do_get(rev, depth)
+            return self._do_get(rev, depth, readonly)
 
         # ... otherwise
         name, _, path = path.partition('/')
@@ -178,15 +165,15 @@ class ConfigNode(object):
                     # need to escalate further
                     key, _, path = path.partition('/')
                     key = field.key_from_str(key)
-                    _, child_rev = find_rev_by_key(children, field.key, key)
+                    child_rev = children.by_key(key)
                     child_node = child_rev.node
-                    return child_node._get(child_rev, path, depth)
+                    return child_node._get(child_rev, path, depth, readonly)
                 else:
                     # we are the node of interest
                     response = []
                     for child_rev in children:
                         child_node = child_rev.node
-                        value = child_node._do_get(child_rev, depth)
+                        value = child_node._do_get(child_rev, depth, readonly)
                         response.append(value)
                     return response
             else:
@@ -196,17 +183,22 @@ class ConfigNode(object):
                 response = []
                 for child_rev in rev._children[name]:
                     child_node = child_rev.node
-                    value = child_node._do_get(child_rev, depth)
+                    value = child_node._do_get(child_rev, depth, readonly)
                     response.append(value)
                 return response
         else:
             child_rev = rev._children[name][0]
             child_node = child_rev.node
-            return child_node._get(child_rev, path, depth)
-
-    def _do_get(self, rev, depth):
-        msg = rev.get(depth)
-        if self._proxy is not None:
+            return child_node._get(child_rev, path, depth, readonly)
+
+    def _do_get(self, rev, depth, readonly=False):
+        msg = rev.get(depth, readonly)
+        if self._proxy is not None and \
+                self._proxy.has_callbacks(CallbackType.GET):
+            if readonly:
+                # callbacks may augment the message, so they need a copy
+                shared_msg, msg = msg, msg.__class__()
+                msg.CopyFrom(shared_msg)
             msg = self._proxy.invoke_callbacks(CallbackType.GET, msg)
         return msg
 
@@ -234,8 +226,8 @@ class ConfigNode(object):
             if field.key:
                 key, _, path = path.partition('/')
                 key = field.key_from_str(key)
-                children = copy(rev._children[name])
-                idx, child_rev = find_rev_by_key(children, field.key, key)
+                children = rev._children[name]
+                child_rev = children.by_key(key)
                 child_node = child_rev.node
                 new_child_rev = child_node.update(
                     path, data, strict, txid, mk_branch)
@@ -244,7 +236,8 @@ class ConfigNode(object):
                     return branch._latest
                 if getattr(new_child_rev.data, field.key) != key:
                     raise ValueError('Cannot change key field')
-                children[idx] = new_child_rev
+                children = children.replace(new_child_rev)
+                branch.touch(name, key)
                 rev = rev.update_children(name, children, branch)
                 self._make_latest(branch, rev)
                 return rev
@@ -323,16 +316,17 @@ class ConfigNode(object):
                     if self._proxy is not None:
                         self._proxy.invoke_callbacks(
                             CallbackType.PRE_ADD, data)
-                    children = copy(rev._children[name])
+                    children = rev._children[name]
                     key = getattr(data, field.key)
                     try:
-                        find_rev_by_key(children, field.key, key)
+                        children.by_key(key)
                     except KeyError:
                         pass
                     else:
                         raise ValueError('Duplicate key "{}"'.format(key))
                     child_rev = self._mknode(data).latest
-                    children.append(child_rev)
+                    children = children.append(child_rev)
+                    branch.touch(name, key)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev,
                                       ((CallbackType.POST_ADD, data),))
@@ -345,11 +339,12 @@ class ConfigNode(object):
                     # need to escalate
                     key, _, path = path.partition('/')
                     key = field.key_from_str(key)
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = children.by_key(key)
                     child_node = child_rev.node
                     new_child_rev = child_node.add(path, data, txid, mk_branch)
-                    children[idx] = new_child_rev
+                    children = children.replace(new_child_rev)
+                    branch.touch(name, key)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev)
                     return rev
@@ -383,18 +378,19 @@ class ConfigNode(object):
                 key = field.key_from_str(key)
                 if path:
                     # need to escalate
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = children.by_key(key)
                     child_node = child_rev.node
                     new_child_rev = child_node.remove(path, txid, mk_branch)
-                    children[idx] = new_child_rev
+                    children = children.replace(new_child_rev)
+                    branch.touch(name, key)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev)
                     return rev
                 else:
                     # need to remove from this very node
-                    children = copy(rev._children[name])
-                    idx, child_rev = find_rev_by_key(children, field.key, key)
+                    children = rev._children[name]
+                    child_rev = children.by_key(key)
                     if self._proxy is not None:
                         data = child_rev.data
                         self._proxy.invoke_callbacks(
@@ -402,7 +398,8 @@ class ConfigNode(object):
                         post_anno = ((CallbackType.POST_REMOVE, data),)
                     else:
                         post_anno = ()
-                    del children[idx]
+                    children = children.remove(key)
+                    branch.touch(name, key)
                     rev = rev.update_children(name, children, branch)
                     self._make_latest(branch, rev, post_anno)
                     return rev
@@ -411,6 +408,88 @@ class ConfigNode(object):
         else:
             raise ValueError('Cannot remove non-conatiner field')
 
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ bulk operation ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def bulk(self, path, ops, strict=False, txid=None, mk_branch=None):
+        """
+        Apply many operations on the children of the keyed container at
+        path, making a single new revision of this node. Operations are
+        ('add', data), ('update', data) and ('remove', key) tuples.
+        """
+        while path.startswith('/'):
+            path = path[1:]
+        if not path:
+            raise ValueError('Cannot bulk change non-container node')
+
+        try:
+            branch = self._branches[txid]
+        except KeyError:
+            branch = mk_branch(self)
+
+        rev = branch._latest  # change is always made to latest
+        name, _, path = path.partition('/')
+        field = children_fields(self._type)[name]
+        if not field.is_container or not field.key:
+            raise ValueError('Can only bulk change keyed containers')
+        children = rev._children[name]
+
+        if path:
+            # need to escalate
+            key, _, path = path.partition('/')
+            key = field.key_from_str(key)
+            child_rev = children.by_key(key)
+            new_child_rev = child_rev.node.bulk(
+                path, ops, strict, txid, mk_branch)
+            children = children.replace(new_child_rev)
+            branch.touch(name, key)
+
+        else:
+            post_anno = []
+            for op in ops:
+                kind = op[0]
+                if kind == 'add':
+                    data = op[1]
+                    if self._proxy is not None:
+                        self._proxy.invoke_callbacks(
+                            CallbackType.PRE_ADD, data)
+                    key = getattr(data, field.key)
+                    try:
+                        children.by_key(key)
+                    except KeyError:
+                        pass
+                    else:
+                        raise ValueError('Duplicate key "{}"'.format(key))
+                    children = children.append(self._mknode(data).latest)
+                    post_anno.append((CallbackType.POST_ADD, data))
+                elif kind == 'update':
+                    data = op[1]
+                    key = getattr(data, field.key)
+                    child_rev = children.by_key(key)
+                    new_child_rev = child_rev.node.update(
+                        '', data, strict, txid, mk_branch)
+                    if new_child_rev.hash == child_rev.hash:
+                        continue
+                    children = children.replace(new_child_rev)
+                elif kind == 'remove':
+                    key = op[1]
+                    if isinstance(key, basestring):
+                        key = field.key_from_str(key)
+                    child_rev = children.by_key(key)
+                    if self._proxy is not None:
+                        data = child_rev.data
+                        self._proxy.invoke_callbacks(
+                            CallbackType.PRE_REMOVE, data)
+                        post_anno.append((CallbackType.POST_REMOVE, data))
+                    children = children.remove(key)
+                else:
+                    raise ValueError(
+                        'Unknown bulk operation "{}"'.format(kind))
+                branch.touch(name, key)
+
+        rev = rev.update_children(name, children, branch)
+        self._make_latest(branch, rev, post_anno if not path else ())
+        return rev
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ Branching ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _mk_txbranch(self, txid):
@@ -444,7 +523,8 @@ class ConfigNode(object):
         dst_rev = dst_branch.latest  # head rev of target branch
 
         rev, changes = merge_3way(
-            fork_rev, src_rev, dst_rev, merge_child, dry_run)
+            fork_rev, src_rev, dst_rev, merge_child, dry_run,
+            src_branch._touched)
 
         if not dry_run:
             self._make_latest(dst_branch, rev, change_announcements=changes)
@@ -539,8 +619,7 @@ class ConfigNode(object):
             if field.key:
                 key, _, path = path.partition('/')
                 key = field.key_from_str(key)
-                children = rev._children[name]
-                _, child_rev = find_rev_by_key(children, field.key, key)
+                child_rev = rev._children[name].by_key(key)
                 child_node = child_rev.node
                 return child_node._get_proxy(path, root, full_path, exclusive)
 
@@ -561,13 +640,14 @@ class ConfigNode(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~ Persistence loading ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def load_latest(self, latest_hash):
+    def load_latest(self, latest_hash, lazy=False, blob=None,
+                    config_blob=None):
 
         root = self._root
         kv_store = root._kv_store
 
-        branch = ConfigBranch(self, self._auto_prune)
+        branch = ConfigBranch(self, auto_prune=self._auto_prune)
         rev = PersistedConfigRevision.load(
-            branch, kv_store, self._type, latest_hash)
+            branch, kv_store, self._type, latest_hash, lazy, blob, config_blob)
         self._make_latest(branch, rev)
         self._branches[None] = branch
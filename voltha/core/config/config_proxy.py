@@ -89,8 +89,9 @@ class ConfigProxy(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~ CRUD handlers ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-    def get(self, path='/', depth=None, deep=None, txid=None):
-        return self._node.get(path, depth=depth, deep=deep, txid=txid)
+    def get(self, path='/', depth=None, deep=None, txid=None, readonly=False):
+        return self._node.get(path, depth=depth, deep=deep, txid=txid,
+                              readonly=readonly)
 
     def update(self, path, data, strict=False, txid=None):
         assert path.startswith('/')
@@ -107,6 +108,19 @@ class ConfigProxy(object):
         full_path = self._path if path == '/' else self._path + path
         return self._root.remove(full_path, txid=txid)
 
+    def bulk(self, path, ops, strict=False):
+        """
+        Add, update and remove many children of the keyed container at path
+        in one go, see ConfigRoot.bulk(). For instance:
+
+            proxy.bulk('/devices', [('add', device1),
+                                    ('update', device2),
+                                    ('remove', '5678')])
+        """
+        assert path.startswith('/')
+        full_path = self._path if path == '/' else self._path + path
+        return self._root.bulk(full_path, ops, strict)
+
     # ~~~~~~~~~~~~~~~~~~~~~~~~~~ Transaction support ~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     def open_transaction(self):
@@ -139,6 +153,9 @@ class ConfigProxy(object):
 
     # ~~~~~~~~~~~~~~~~~~~~~ Callback dispatch ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
+    def has_callbacks(self, callback_type):
+        return bool(self._callbacks.get(callback_type))
+
     def invoke_callbacks(self, callback_type, context, proceed_on_errors=False):
         lst = self._callbacks.get(callback_type, [])
         for callback, args, kw in lst:
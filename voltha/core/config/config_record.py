@@ -0,0 +1,359 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Binary encoding of the blobs of a persisted config tree.
+
+Each blob starts with a three byte header: a zero byte, the format version
+and the id of the codec the rest of the blob is encoded with. No blob of
+the former formats can start with a zero byte (revision records were JSON,
+optionally bz2 compressed, and config data blobs were serialized protobuf
+messages, which never start with a zero tag), so old and new blobs can
+coexist in a store while it is migrated (see migrate()).
+
+Config data blobs hold the serialized message, compressed by the selected
+codec: none, zlib or zstd. Zstd can use a dictionary trained on samples of
+serialized config data (see train_dictionary()), which makes compressing
+small messages worthwhile. Since the dictionary is needed for decoding,
+dictionaries are stored in the kv store too, under DICTIONARY_KEY_PREFIX
+and their id, and listed in the 'root' record.
+
+Revision records hold the raw (not hex) hash of the config data, and the
+raw hashes of the children per field, as:
+
+    hash width W (1 byte)
+    config hash (W bytes)
+    number of fields (varint)
+    per field:
+        protobuf field number (varint)
+        flags (1 byte, FLAG_DIGEST if a Merkle digest follows the hashes)
+        number of children N (varint)
+        child hashes (N * W bytes)
+        digest of keyed children (W bytes, if flagged and N > 0, as the
+        digest of no children is empty)
+
+Records consist of hashes, which do not compress, so they are not.
+"""
+import zlib
+from binascii import hexlify, unhexlify
+from bz2 import decompress as bz2_decompress
+
+from simplejson import loads
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+FORMAT_VERSION = 1
+
+DICTIONARY_KEY_PREFIX = 'zstd-dict/'
+
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+codecs = {'none': CODEC_NONE, 'zlib': CODEC_ZLIB}
+if zstandard is not None:
+    codecs['zstd'] = CODEC_ZSTD
+
+FLAG_DIGEST = 1
+
+_codec = CODEC_NONE
+_level = None
+_dictionary = None  # zstd dictionary used for compression, if any
+_dictionaries = {}  # dict id -> zstd dictionary, for decompression
+_dictionary_data = {}  # dict id -> serialized dictionary
+_compressor = None
+_decompressors = {}  # dict id -> zstd decompressor
+
+
+def set_codec(name, level=None, dictionary=None):
+    """
+    Select the codec used for config data blobs written from now on, by
+    name (see codecs), optionally with compression level and, for zstd, a
+    dictionary as returned by train_dictionary().
+    """
+    global _codec, _level, _dictionary, _compressor
+    try:
+        codec = codecs[name]
+    except KeyError:
+        raise ValueError('Unknown or unavailable codec "{}"'.format(name))
+    if dictionary is not None and codec != CODEC_ZSTD:
+        raise ValueError('Only zstd supports dictionaries')
+    _codec, _level, _dictionary, _compressor = codec, level, None, None
+    if codec == CODEC_ZSTD:
+        if dictionary is not None:
+            _dictionary = add_dictionary(dictionary)
+        kw = dict(level=3 if level is None else level)
+        if _dictionary is not None:
+            kw['dict_data'] = _dictionaries[_dictionary]
+        _compressor = zstandard.ZstdCompressor(**kw)
+
+
+def get_codec_name():
+    for name, codec in codecs.iteritems():
+        if codec == _codec:
+            return name
+
+
+def train_dictionary(samples, dict_size=16384):
+    """
+    Train a zstd dictionary on samples of serialized config data, e.g., the
+    serialized config data of a populated tree. Returns the dictionary in
+    its serialized form.
+    """
+    if zstandard is None:
+        raise ValueError('zstd is not available')
+    return zstandard.train_dictionary(dict_size, list(samples)).as_bytes()
+
+
+def add_dictionary(data):
+    """Make a serialized zstd dictionary available; returns its id"""
+    if zstandard is None:
+        raise ValueError('zstd is not available')
+    dictionary = zstandard.ZstdCompressionDict(data)
+    dict_id = dictionary.dict_id()
+    _dictionaries[dict_id] = dictionary
+    _dictionary_data[dict_id] = data
+    return dict_id
+
+
+def dictionaries():
+    """Return dict of id to serialized form of known zstd dictionaries"""
+    return _dictionary_data
+
+
+def dictionary_key(dict_id):
+    return '{}{}'.format(DICTIONARY_KEY_PREFIX, dict_id)
+
+
+def _header(codec):
+    return '\x00' + chr(FORMAT_VERSION) + chr(codec)
+
+
+_headers = dict((codec, _header(codec)) for codec in codecs.itervalues())
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ config data ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def encode_config(serialized):
+    """Encode serialized config data for storage"""
+    if _codec == CODEC_NONE:
+        return _headers[CODEC_NONE] + serialized
+    elif _codec == CODEC_ZLIB:
+        if _level is None:
+            return _headers[CODEC_ZLIB] + zlib.compress(serialized)
+        return _headers[CODEC_ZLIB] + zlib.compress(serialized, _level)
+    else:
+        return _headers[CODEC_ZSTD] + _compressor.compress(serialized)
+
+
+def decode_config(blob, legacy_bz2=False):
+    """
+    Return the serialized config data of a stored blob. Blobs written
+    before the binary format may be bz2 compressed, which is not told by
+    the blob itself, but by the record referencing it.
+    """
+    if not blob.startswith('\x00'):
+        return bz2_decompress(blob) if legacy_bz2 else blob
+    codec = ord(blob[2])
+    if codec == CODEC_NONE:
+        return blob[3:]
+    elif codec == CODEC_ZLIB:
+        return zlib.decompress(blob[3:])
+    elif codec == CODEC_ZSTD:
+        return _zstd_decompress(blob[3:])
+    raise ValueError('Unknown codec {}'.format(codec))
+
+
+def _zstd_decompress(data):
+    if zstandard is None:
+        raise ValueError('zstd is not available')
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    decompressor = _decompressors.get(dict_id)
+    if decompressor is None:
+        if dict_id:
+            try:
+                dictionary = _dictionaries[dict_id]
+            except KeyError:
+                raise ValueError('Unknown zstd dictionary {}'.format(dict_id))
+            decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+        else:
+            decompressor = zstandard.ZstdDecompressor()
+        _decompressors[dict_id] = decompressor
+    return decompressor.decompress(data)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ revision records ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def _varint(value):
+    parts = []
+    while value > 0x7f:
+        parts.append(chr(0x80 | (value & 0x7f)))
+        value >>= 7
+    parts.append(chr(value))
+    return ''.join(parts)
+
+
+def _read_varint(blob, pos):
+    value = 0
+    shift = 0
+    while 1:
+        byte = ord(blob[pos])
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+_field_numbers_cache = {}  # message class -> dict of field name to number
+
+
+def _field_numbers(msg_cls):
+    numbers = _field_numbers_cache.get(msg_cls)
+    if numbers is None:
+        numbers = _field_numbers_cache[msg_cls] = dict(
+            (field.name, field.number) for field in msg_cls.DESCRIPTOR.fields)
+    return numbers
+
+
+def encode_record(msg_cls, config_hash, children, digests):
+    """
+    Encode a revision record of a message of msg_cls, given its config
+    hash, a dict of field name to the list of child hashes and a dict of
+    field name to the Merkle digest of keyed children.
+    """
+    numbers = _field_numbers(msg_cls)
+    parts = [_headers[CODEC_NONE], chr(len(config_hash) / 2),
+             unhexlify(config_hash), _varint(len(children))]
+    for field_name, hashes in children.iteritems():
+        digest = digests.get(field_name)
+        parts.append(_varint(numbers[field_name]))
+        parts.append('\x00' if digest is None else chr(FLAG_DIGEST))
+        parts.append(_varint(len(hashes)))
+        parts.append(unhexlify(''.join(hashes)))
+        if digest:
+            parts.append(unhexlify(digest))
+    return ''.join(parts)
+
+
+def decode_record(blob, msg_cls=None):
+    """
+    Decode a revision record into a dict with the config hash under
+    'config', the lists of child hashes per field under 'children' and
+    the digests of keyed children per field under 'digests'. Fields are
+    identified by name if msg_cls is given, and by number otherwise (which
+    is fine for those just interested in the hashes). Records of former
+    formats are decoded as well; these are marked with 'legacy' (and
+    'legacy_bz2' if compressed).
+    """
+    if not blob.startswith('\x00'):
+        if blob.startswith('BZh'):
+            record = loads(bz2_decompress(blob))
+            record['legacy_bz2'] = True
+        else:
+            record = loads(blob)
+        record['legacy'] = True
+        record.setdefault('digests', {})
+        return record
+
+    version = ord(blob[1])
+    if version != FORMAT_VERSION:
+        raise ValueError('Unknown record format version {}'.format(version))
+
+    width = ord(blob[3])
+    pos = 4
+    config_hash = hexlify(blob[pos:pos + width])
+    pos += width
+    n_fields, pos = _read_varint(blob, pos)
+    if msg_cls is not None:
+        fields = msg_cls.DESCRIPTOR.fields_by_number
+    children = {}
+    digests = {}
+    hex_width = 2 * width
+    for _ in xrange(n_fields):
+        number, pos = _read_varint(blob, pos)
+        flags = ord(blob[pos])
+        pos += 1
+        count, pos = _read_varint(blob, pos)
+        hashes = hexlify(blob[pos:pos + count * width])
+        pos += count * width
+        field = number if msg_cls is None else fields[number].name
+        children[field] = [hashes[i:i + hex_width]
+                           for i in xrange(0, len(hashes), hex_width)]
+        if flags & FLAG_DIGEST:
+            if count:
+                digests[field] = hexlify(blob[pos:pos + width])
+                pos += width
+            else:
+                digests[field] = ''
+    return dict(config=config_hash, children=children, digests=digests)
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ migration ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def migrate(kv_store, root_msg_cls, batch_size=100):
+    """
+    Rewrite all blobs reachable from the 'root' record that are in a former
+    format, or use another codec than the one selected, in place. Since
+    keys are hashes of content, not of its encoding, this is safe while the
+    store is in use.
+
+    This is a generator, yielding after each batch of blobs, so that it can
+    be run cooperatively, e.g., with twisted.internet.task.cooperate(). It
+    yields the number of blobs rewritten so far.
+    """
+    # imported here to avoid circular imports
+    from voltha.core.config.config_rev import children_fields, lookup_type
+
+    root_data = loads(kv_store['root'])
+    stack = [(root_data['latest'], root_msg_cls)]
+    visited = set()
+    rewritten = 0
+    current_header = _headers[_codec]
+    while stack:
+        batch = stack[-batch_size:]
+        del stack[-batch_size:]
+        for hash, msg_cls in batch:
+            if hash in visited:
+                continue
+            visited.add(hash)
+            record = decode_record(kv_store[hash], msg_cls)
+
+            # the config blob first, as a legacy record tells how to decode it
+            config_hash = record['config']
+            if config_hash not in visited:
+                visited.add(config_hash)
+                config_blob = kv_store[config_hash]
+                if not config_blob.startswith(current_header):
+                    kv_store[config_hash] = encode_config(decode_config(
+                        config_blob, record.get('legacy_bz2', False)))
+                    rewritten += 1
+
+            if record.get('legacy'):
+                kv_store[hash] = encode_record(
+                    msg_cls, record['config'], record['children'],
+                    record['digests'])
+                rewritten += 1
+
+            for field_name, meta in children_fields(msg_cls).iteritems():
+                child_msg_cls = lookup_type(meta.module, meta.type)
+                stack.extend((child_hash, child_msg_cls) for child_hash
+                             in record['children'][field_name])
+        yield rewritten
@@ -23,23 +23,33 @@ classes directly must obey the rules.
 
 import weakref
 from copy import copy
-from hashlib import md5
-
 from google.protobuf.descriptor import Descriptor
+from importlib import import_module
 from simplejson import dumps
 
 from common.utils.json_format import MessageToJson
+from common.utils.lru_cache import LRUCache
+from voltha.core.config import config_hash
+from voltha.core.config.config_children import KeyedChildren, LazyChildren
 from voltha.protos import third_party
 from voltha.protos import meta_pb2
 
 
+_is_proto_cache = {}  # to memoize if a class is a protobuf message class
+
+
 def is_proto_message(o):
     """
     Return True if object o appears to be a protobuf message; False otherwise.
     """
-    # use a somewhat empirical approach to decide if something looks like
-    # a protobuf message
-    return isinstance(getattr(o, 'DESCRIPTOR', None), Descriptor)
+    cls = o.__class__
+    is_proto = _is_proto_cache.get(cls)
+    if is_proto is None:
+        # use a somewhat empirical approach to decide if something looks like
+        # a protobuf message
+        is_proto = _is_proto_cache[cls] = isinstance(
+            getattr(cls, 'DESCRIPTOR', None), Descriptor)
+    return is_proto
 
 
 def message_to_json_concise(m):
@@ -56,6 +66,13 @@ _rev_cache = weakref.WeakValueDictionary()  # cache of config revs
 _children_fields_cache = {}  # to memoize externally stored field name info
 
 
+_type_registry = {}  # (module name, class name) -> child message class
+
+
+# cache of assembled (rev-hash, depth) -> message results of read-only gets
+_readonly_get_cache = LRUCache(1024)
+
+
 class _ChildType(object):
     """Used to store key metadata about child_node fields in protobuf messages.
     """
@@ -144,6 +161,8 @@ def children_fields(cls):
                             raise NotImplementedError()
 
                     field_class = field.message_type._concrete_class
+                    _type_registry[(field_class.__module__,
+                                    field_class.__name__)] = field_class
                     names[field.name] = _ChildType(
                         module=field_class.__module__,
                         type=field_class.__name__,
@@ -157,6 +176,18 @@ def children_fields(cls):
     return names
 
 
+def lookup_type(module_name, cls_name):
+    """
+    Return the message class of a child field, as recorded in the
+    children_fields() meta data.
+    """
+    cls = _type_registry.get((module_name, cls_name))
+    if cls is None:
+        cls = _type_registry[(module_name, cls_name)] = getattr(
+            import_module(module_name), cls_name)
+    return cls
+
+
 _access_right_cache = {}  # to memoize field access right restrictions
 
 
@@ -196,12 +227,14 @@ class ConfigDataRevision(object):
     __slots__ = (
         '_data',
         '_hash',
+        '_serialized',  # serialized data, if kept for persistence
         '__weakref__'
     )
 
-    def __init__(self, data):
+    def __init__(self, data, keep_serialized=False):
         self._data = data
-        self._hash = self._hash_data(data)
+        self._hash, serialized = self._hash_data(data)
+        self._serialized = serialized if keep_serialized else None
 
     @property
     def data(self):
@@ -211,19 +244,40 @@ class ConfigDataRevision(object):
     def hash(self):
         return self._hash
 
+    def pop_serialized(self):
+        """
+        Return serialized data if it was kept at creation (None otherwise)
+        and forget it, so it is not held in memory any longer than needed.
+        """
+        serialized, self._serialized = self._serialized, None
+        return serialized
+
     @staticmethod
     def _hash_data(data):
-        """Hash function to be used to track version changes of config nodes"""
-        if isinstance(data, (dict, list)):
-            to_hash = dumps(data)
-        elif is_proto_message(data):
-            to_hash = ':'.join((
-                data.__class__.__module__,
-                data.__class__.__name__,
-                data.SerializeToString()))
+        """
+        Hash function to be used to track version changes of config nodes.
+        Returns the hash and, for protobuf messages, the serialized message
+        so that the serialization can be reused for persistence.
+        """
+        if is_proto_message(data):
+            serialized = data.SerializeToString()
+            return config_hash.hash_blobs(
+                _type_prefix(data.__class__), serialized), serialized
+        elif isinstance(data, (dict, list)):
+            return config_hash.hash_blobs(dumps(data)), None
         else:
-            to_hash = str(hash(data))
-        return md5(to_hash).hexdigest()[:12]
+            return config_hash.hash_blobs(str(hash(data))), None
+
+
+_type_prefix_cache = {}  # to memoize type prefix of hashed data
+
+
+def _type_prefix(cls):
+    prefix = _type_prefix_cache.get(cls)
+    if prefix is None:
+        prefix = _type_prefix_cache[cls] = '{}:{}:'.format(
+            cls.__module__, cls.__name__)
+    return prefix
 
 
 class ConfigRevision(object):
@@ -243,9 +297,12 @@ class ConfigRevision(object):
         '__weakref__'
     )
 
+    # keep serialized config data around for persistence (see subclasses)
+    keep_serialized = False
+
     def __init__(self, branch, data, children=None):
         self._branch = branch
-        self._config = ConfigDataRevision(data)
+        self._config = ConfigDataRevision(data, self.keep_serialized)
         self._children = children
         self._finalize()
 
@@ -259,13 +316,28 @@ class ConfigRevision(object):
             self._config = _rev_cache[self._config._hash]  # re-use!
 
     def _hash_content(self):
-        # hash is derived from config hash and hashes of all children
-        m = md5('' if self._config is None else self._config._hash)
-        if self._children is not None:
-            for children in self._children.itervalues():
-                assert isinstance(children, list)
-                m.update(''.join(c._hash for c in children))
-        return m.hexdigest()[:12]
+        # hash is derived from config hash and hashes of all children;
+        # keyed containers provide a Merkle digest over their children, so
+        # we do not need to walk them, and children not loaded yet from
+        # persistence contribute their recorded hashes
+        parts = ['' if self._config is None else self._config._hash]
+        all_children = self._children
+        if all_children is not None:
+            lazy = isinstance(all_children, LazyChildren)
+            for field_name in sorted(all_children):
+                if lazy:
+                    pending = all_children.pending(field_name)
+                    if pending is not None:
+                        pending_parts = pending.hash_parts()
+                        if pending_parts is not None:
+                            parts.extend(pending_parts)
+                            continue
+                children = all_children[field_name]
+                if isinstance(children, KeyedChildren):
+                    parts.append(children.hash)
+                else:
+                    parts.extend(c._hash for c in children)
+        return config_hash.hash_blobs(*parts)
 
     @property
     def hash(self):
@@ -283,12 +355,33 @@ class ConfigRevision(object):
     def type(self):
         return self._config.data.__class__
 
-    def get(self, depth):
+    def get(self, depth, readonly=False):
         """
         Get config data of node. If depth > 0, recursively assemble the
         branch nodes. If depth is < 0, this results in a fully exhaustive
         "complete config".
+
+        If readonly is True, the returned message is shared with the config
+        tree and other readers, and the caller must not modify it. Since the
+        revision hash covers the whole sub-tree, assembled messages are
+        cached per (hash, depth), so repeated reads of an unchanged sub-tree
+        do not copy or allocate anything.
         """
+        if not readonly:
+            return self._assemble(depth, False)
+
+        if not depth:
+            return self._config.data
+        if depth < 0:
+            depth = -1  # all negative depths mean the same
+        key = (self._hash, depth)
+        data = _readonly_get_cache.get(key)
+        if data is None:
+            data = self._assemble(depth, True)
+            _readonly_get_cache[key] = data
+        return data
+
+    def _assemble(self, depth, readonly):
         orig_data = self._config.data
         data = orig_data.__class__()
         data.CopyFrom(orig_data)
@@ -298,12 +391,12 @@ class ConfigRevision(object):
             for field_name, field in cfields:
                 if field.is_container:
                     for rev in self._children[field_name]:
-                        child_data = rev.get(depth=depth - 1)
+                        child_data = rev.get(depth - 1, readonly)
                         child_data_holder = getattr(data, field_name).add()
                         child_data_holder.MergeFrom(child_data)
                 else:
                     rev = self._children[field_name][0]
-                    child_data = rev.get(depth=depth - 1)
+                    child_data = rev.get(depth - 1, readonly)
                     child_data_holder = getattr(data, field_name)
                     child_data_holder.MergeFrom(child_data)
         return data
@@ -312,7 +405,7 @@ class ConfigRevision(object):
         """Return a NEW revision which is updated for the modified data"""
         new_rev = copy(self)
         new_rev._branch = branch
-        new_rev._config = self._config.__class__(data)
+        new_rev._config = self._config.__class__(data, self.keep_serialized)
         new_rev._finalize()
         return new_rev
 
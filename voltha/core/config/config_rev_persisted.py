@@ -17,111 +17,194 @@
 """
 A config rev object that persists itself
 """
-from bz2 import compress, decompress
+import gc
+from contextlib import contextmanager
+from functools import partial
+from itertools import izip
 
 import structlog
-from simplejson import dumps, loads
 
-from voltha.core.config.config_rev import ConfigRevision, children_fields
+from voltha.core.config import config_record
+from voltha.core.config.config_children import KeyedChildren, LazyChildren, \
+    PendingChildren
+from voltha.core.config.config_rev import ConfigRevision, children_fields, \
+    lookup_type
 
 log = structlog.get_logger()
 
 
 class PersistedConfigRevision(ConfigRevision):
 
-    compress = False
+    keep_serialized = True
 
     __slots__ = ('_kv_store',)
 
-    def __init__(self, branch, data, children=None):
-        self._kv_store = branch._node._root.kv_store
-        super(PersistedConfigRevision, self).__init__(branch, data, children)
-
     def _finalize(self):
+        # looked up here, as derived revisions shall not inherit the store
+        # (or its absence) of the revision they are derived from
+        self._kv_store = self._branch._node._root.kv_store
         super(PersistedConfigRevision, self)._finalize()
-        self.store()
+        # there is no kv store while loading from persistence, or when a
+        # write-behind writer stores us later; revisions of transaction
+        # branches are not stored, merging creates those to be committed
+        if self._kv_store is not None and self._branch._txid is None:
+            self.store()
 
-    def __del__(self):
-        try:
-            if self._config.__weakref__ is None:
-                del self._kv_store[self._config._hash]
-            assert self.__weakref__ is None
-            del self._kv_store[self._hash]
-        except Exception, e:
-            # this should never happen
-            log.exception('del-error', hash=hash, e=e)
-
-    def store(self):
-        # crude serialization of children hash and config data hash
-        if self._hash in self._kv_store:
+    def store(self, kv_store=None):
+        if kv_store is None:
+            kv_store = self._kv_store
+
+        if self._hash in kv_store:
             return
 
-        self.store_config()
+        self.store_config(kv_store)
 
         children_lists = {}
-        for field_name, children in self._children.iteritems():
-            hashes = [rev.hash for rev in children]
-            children_lists[field_name] = hashes
-
-        data = dict(
-            children=children_lists,
-            config=self._config._hash
-        )
-        blob = dumps(data)
-        if self.compress:
-            blob = compress(blob)
-
-        self._kv_store[self._hash] = blob
+        digests = {}
+        all_children = self._children
+        lazy = isinstance(all_children, LazyChildren)
+        for field_name in all_children:
+            pending = all_children.pending(field_name) if lazy else None
+            if pending is not None:
+                # not loaded yet, but the recorded hashes are all we need
+                children_lists[field_name] = pending.hashes
+                if pending.digest is not None:
+                    digests[field_name] = pending.digest
+            else:
+                children = all_children[field_name]
+                children_lists[field_name] = [rev._hash for rev in children]
+                if isinstance(children, KeyedChildren):
+                    digests[field_name] = children.hash
+
+        # digests let lazy loading hash a revision without loading children
+        kv_store[self._hash] = config_record.encode_record(
+            self._config._data.__class__, self._config._hash, children_lists,
+            digests)
 
     @classmethod
-    def load(cls, branch, kv_store, msg_cls, hash):
-        blob = kv_store[hash]
-        if cls.compress:
-            blob = decompress(blob)
-        data = loads(blob)
-
-        config_hash = data['config']
-        config_data = cls.load_config(kv_store, msg_cls, config_hash)
+    def load(cls, branch, kv_store, msg_cls, hash, lazy=False, blob=None,
+             config_blob=None):
+        """
+        Load revision of given hash. With lazy set, children are loaded
+        only when accessed. Blobs fetched in advance can be passed in.
+        """
+        if blob is None:
+            blob = kv_store[hash]
+        data = cls.decode_record(blob, msg_cls)
+
+        if config_blob is None:
+            config_blob = kv_store[data['config']]
+        config_data = cls.decode_config(
+            msg_cls, config_blob, data.get('legacy_bz2', False))
 
         children_list = data['children']
-        assembled_children = {}
         node = branch._node
-        for field_name, meta in children_fields(msg_cls).iteritems():
-            child_msg_cls = tmp_cls_loader(meta.module, meta.type)
-            children = []
-            for child_hash in children_list[field_name]:
-                child_node = node._mknode(child_msg_cls)
-                child_node.load_latest(child_hash)
-                child_rev = child_node.latest
-                children.append(child_rev)
-            assembled_children[field_name] = children
+        if lazy:
+            digests = data['digests']
+            pending = dict(
+                (field_name, PendingChildren(children_list[field_name],
+                                             bool(meta.key),
+                                             digests.get(field_name)))
+                for field_name, meta in children_fields(msg_cls).iteritems())
+            assembled_children = LazyChildren(
+                partial(cls.load_children_lazily, node, kv_store), pending)
+        else:
+            assembled_children = dict(
+                (field_name, cls.load_children(
+                    node, kv_store, field_name, children_list[field_name]))
+                for field_name in children_fields(msg_cls))
         rev = cls(branch, config_data, assembled_children)
+        # it is in the kv store already
+        rev._config.pop_serialized()
         return rev
 
-    def store_config(self):
-        if self._config._hash in self._kv_store:
+    @classmethod
+    def decode_record(cls, blob, msg_cls=None):
+        """
+        Decode a stored revision record into a dict with the config hash
+        under 'config' and the lists of child hashes per field under
+        'children', see config_record.decode_record().
+        """
+        return config_record.decode_record(blob, msg_cls)
+
+    @classmethod
+    def load_children(cls, node, kv_store, field_name, hashes, lazy=False):
+        """
+        Load child revisions of given hashes of a field of node. The blobs
+        of all children are fetched in bulk, see fetch_many().
+        """
+        meta = children_fields(node._type)[field_name]
+        child_msg_cls = lookup_type(meta.module, meta.type)
+        blobs = fetch_many(kv_store, hashes)
+        records = [cls.decode_record(blob) for blob in blobs]
+        config_blobs = fetch_many(
+            kv_store, [record['config'] for record in records])
+        children = []
+        for hash, blob, config_blob in izip(hashes, blobs, config_blobs):
+            child_node = node._mknode(child_msg_cls)
+            child_node.load_latest(hash, lazy, blob, config_blob)
+            children.append(child_node.latest)
+        if meta.key:
+            children = KeyedChildren(meta.key, children)
+        return children
+
+    @classmethod
+    def load_children_lazily(cls, node, kv_store, field_name, hashes):
+        root = node._root
+        loading, root._loading = root._loading, True
+        try:
+            with gc_paused():
+                children = cls.load_children(
+                    node, kv_store, field_name, hashes, lazy=True)
+        finally:
+            root._loading = loading
+        root.loaded_from_persistence(children)
+        return children
+
+    def store_config(self, kv_store):
+        # reuse the serialization done for hashing where possible
+        blob = self._config.pop_serialized()
+        if self._config._hash in kv_store:
             return
 
-        # crude serialization of config data
-        blob = self._config._data.SerializeToString()
-        if self.compress:
-            blob = compress(blob)
-        self._kv_store[self._config._hash] = blob
+        if blob is None:
+            blob = self._config._data.SerializeToString()
+        kv_store[self._config._hash] = config_record.encode_config(blob)
 
     @classmethod
     def load_config(cls, kv_store, msg_cls, config_hash):
-        blob = kv_store[config_hash]
-        if cls.compress:
-            blob = decompress(blob)
+        return cls.decode_config(msg_cls, kv_store[config_hash])
 
-        # TODO use a loader later on
+    @classmethod
+    def decode_config(cls, msg_cls, blob, legacy_bz2=False):
         data = msg_cls()
-        data.ParseFromString(blob)
+        data.ParseFromString(config_record.decode_config(blob, legacy_bz2))
         return data
 
 
-def tmp_cls_loader(module_name, cls_name):
-    # TODO this shall be generalized
-    from voltha.protos import voltha_pb2, health_pb2, adapter_pb2, \
-        logical_device_pb2, device_pb2, openflow_13_pb2
-    return getattr(locals()[module_name], cls_name)
+@contextmanager
+def gc_paused():
+    """
+    Loading creates many long lived objects. This triggers many runs of
+    the cyclic garbage collector, each scanning the growing heap, while
+    there is no garbage to be found.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def fetch_many(kv_store, keys):
+    """
+    Return the blobs of given keys. Stores that can fetch many keys in one
+    request (e.g., in one Consul transaction) shall provide a
+    get_many(keys) method returning the blobs in the order of the keys.
+    """
+    get_many = getattr(kv_store, 'get_many', None)
+    if get_many is not None:
+        return get_many(keys)
+    return [kv_store[key] for key in keys]
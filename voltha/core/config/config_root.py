@@ -18,9 +18,12 @@ from uuid import uuid4
 import structlog
 from simplejson import dumps, loads
 
+from voltha.core.config import config_hash, config_record
 from voltha.core.config.config_node import ConfigNode
 from voltha.core.config.config_rev import ConfigRevision
-from voltha.core.config.config_rev_persisted import PersistedConfigRevision
+from voltha.core.config.config_rev_persisted import PersistedConfigRevision, \
+    gc_paused
+from voltha.core.config.config_write_behind import Durability, WriteBehind
 from voltha.core.config.merge_3way import MergeConflictException
 
 log = structlog.get_logger()
@@ -33,10 +36,13 @@ class ConfigRoot(ConfigNode):
         '_kv_store',
         '_loading',
         '_rev_cls',
-        '_deferred_callback_queue'
+        '_deferred_callback_queue',
+        '_write_behind',
+        '_stored_dictionaries'  # ids of zstd dictionaries in the kv store
     )
 
-    def __init__(self, initial_data, kv_store=None, rev_cls=ConfigRevision):
+    def __init__(self, initial_data, kv_store=None, rev_cls=ConfigRevision,
+                 durability=Durability.SYNC, flush_interval=0.1, clock=None):
         self._kv_store = kv_store
         self._dirty_nodes = {}
         self._loading = False
@@ -45,15 +51,22 @@ class ConfigRoot(ConfigNode):
             rev_cls = PersistedConfigRevision
         self._rev_cls = rev_cls
         self._deferred_callback_queue = []
+        self._stored_dictionaries = set()
+        if kv_store is not None and durability != Durability.SYNC:
+            self._write_behind = WriteBehind(
+                self, kv_store, durability, flush_interval, clock)
+        else:
+            self._write_behind = None
         super(ConfigRoot, self).__init__(self, initial_data, False)
 
     @property
     def kv_store(self):
         if self._loading:
-            # provide fake store for storing things
-            # TODO this shall be a fake_dict providing noop for all relevant
-            # operations
-            return dict()
+            # revisions loaded from the kv store need not store themselves
+            return None
+        elif self._write_behind is not None:
+            # revisions do not store themselves, the writer does that
+            return None
         else:
             return self._kv_store
 
@@ -72,17 +85,49 @@ class ConfigRoot(ConfigNode):
         del self._dirty_nodes[txid]
 
     def fold_txbranch(self, txid):
-        try:
-            self._merge_txbranch(txid, dry_run=1)
-        except MergeConflictException:
-            self.del_txbranch(txid)
-            raise
+        # only commits made since the branch was made can conflict with it,
+        # so without any there is no need for a dry run detecting conflicts
+        if self._branches[None]._latest is not self._branches[txid]._origin:
+            try:
+                self._merge_txbranch(txid, dry_run=1)
+            except MergeConflictException:
+                self.del_txbranch(txid)
+                raise
 
         try:
             self._merge_txbranch(txid)
         finally:
+            # the merge visits changed nodes only, others may be left with
+            # a branch, e.g., those updated without actual change, and a
+            # failed merge leaves all of them with one
+            for dirty_node in self._dirty_nodes.pop(txid):
+                dirty_node._branches.pop(txid, None)
             self.execute_deferred_callbacks()
 
+    def bulk(self, path, ops, strict=False):
+        """
+        Apply many operations on the children of the keyed container at
+        path as a single change, see ConfigNode.bulk(). They are made in a
+        transaction branch that is folded once, hence result in a single
+        new revision, and POST_* callbacks are invoked only once all of
+        them were made. If any of them fails, none is applied.
+        """
+        self.check_callback_queue()
+        txid = self.mk_txbranch()
+        dirtied = self._dirty_nodes[txid]
+
+        def track_dirty(node):
+            dirtied.add(node)
+            return node._mk_txbranch(txid)
+
+        try:
+            super(ConfigRoot, self).bulk(path, ops, strict, txid, track_dirty)
+        except Exception:
+            self.del_txbranch(txid)
+            raise
+        self.fold_txbranch(txid)
+        return self.latest
+
     # ~~~~~~ Overridden, root-level CRUD methods to handle transactions ~~~~~~~
 
     def update(self, path, data, strict=None, txid=None, mk_branch=None):
@@ -154,7 +199,12 @@ class ConfigRoot(ConfigNode):
     # ~~~~~~~~~~~~~~~~ Persistence related ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
     @classmethod
-    def load(cls, root_msg_cls, kv_store):
+    def load(cls, root_msg_cls, kv_store, durability=Durability.SYNC,
+             flush_interval=0.1, clock=None, lazy=True):
+        """
+        Load config tree from kv store. With lazy set, the children of each
+        node are loaded from the kv store only when first accessed.
+        """
         # need to use fake kv store during initial load for not to override
         # our real k vstore
         fake_kv_store = dict()  # shall use more efficient mock dict
@@ -162,21 +212,59 @@ class ConfigRoot(ConfigNode):
                    rev_cls=PersistedConfigRevision)
         # we can install the real store now
         root._kv_store = kv_store
-        root.load_from_persistence(root_msg_cls)
+        if durability != Durability.SYNC:
+            root._write_behind = WriteBehind(
+                root, kv_store, durability, flush_interval, clock)
+        root.load_from_persistence(root_msg_cls, lazy)
         return root
 
+    def root_blob(self, latest):
+        root_data = dict(
+            latest=latest._hash,
+            tags=dict((k, v._hash) for k, v in self._tags.iteritems()),
+            hash_function=config_hash.get_hash_function_name(),
+            format=config_record.FORMAT_VERSION,
+            dictionaries=sorted(config_record.dictionaries())
+        )
+        return dumps(root_data)
+
+    def root_items(self, latest):
+        """
+        Return the items to write to make latest the persisted revision:
+        the zstd dictionaries not in the kv store yet, and the 'root'
+        record listing them. Call root_items_written() once written.
+        """
+        items = [(config_record.dictionary_key(dict_id), data)
+                 for dict_id, data in config_record.dictionaries().iteritems()
+                 if dict_id not in self._stored_dictionaries]
+        items.append(('root', self.root_blob(latest)))
+        return items
+
+    def root_items_written(self):
+        self._stored_dictionaries.update(config_record.dictionaries())
+
     def _make_latest(self, branch, *args, **kw):
         super(ConfigRoot, self)._make_latest(branch, *args, **kw)
         # only persist the committed branch
         if self._kv_store is not None and branch._txid is None:
-            root_data = dict(
-                latest=branch._latest._hash,
-                tags=dict((k, v._hash) for k, v in self._tags.iteritems())
-            )
-            blob = dumps(root_data)
-            self._kv_store['root'] = blob
-
-    def load_from_persistence(self, root_msg_cls):
+            if self._write_behind is None:
+                items = self.root_items(branch._latest)
+                for key, blob in items:
+                    self._kv_store[key] = blob
+                self.root_items_written()
+            elif not self._loading:
+                self._write_behind.committed(branch._latest)
+
+    def flush(self):
+        """Write pending changes to the kv store (if written behind)"""
+        if self._write_behind is not None:
+            self._write_behind.flush()
+
+    def persistence_metrics(self):
+        if self._write_behind is not None:
+            return self._write_behind.metrics()
+
+    def load_from_persistence(self, root_msg_cls, lazy=True):
         self._loading = True
         blob = self._kv_store['root']
         root_data = loads(blob)
@@ -184,7 +272,26 @@ class ConfigRoot(ConfigNode):
         for tag, hash in root_data['tags'].iteritems():
             raise NotImplementedError()
 
-        self.load_latest(root_data['latest'])
+        # needed to decode config data compressed with them
+        for dict_id in root_data.get('dictionaries', ()):
+            if dict_id not in config_record.dictionaries():
+                config_record.add_dictionary(
+                    self._kv_store[config_record.dictionary_key(dict_id)])
+            self._stored_dictionaries.add(dict_id)
+
+        # lazy loading trusts the recorded hashes, which is only possible if
+        # they were made with the same hash function
+        lazy = lazy and root_data.get('hash_function') == \
+            config_hash.get_hash_function_name()
+        with gc_paused():
+            self.load_latest(root_data['latest'], lazy)
+        if lazy:
+            self.loaded_from_persistence([self.latest])
 
         self._loading = False
 
+    def loaded_from_persistence(self, revs):
+        """Called with revisions that were loaded from the kv store"""
+        if self._write_behind is not None:
+            self._write_behind.mark_written(revs)
+
@@ -0,0 +1,220 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Write-behind persistence of a config tree.
+
+In SYNC mode every persisted config revision writes itself to the kv store
+as it is created, including intermediate revisions that are superseded
+right away. The WriteBehind writer instead leaves revisions in memory and,
+at flush time, writes only what is reachable from the latest committed root
+revision and has not been written before. Since revisions are content
+addressed and immutable, anything already written is never written again,
+and the sub-trees below it need not be visited. For keyed children the
+Merkle digests of the container are remembered as well, so that unchanged
+parts of large child lists are skipped without looking at each child.
+
+All blobs of a flush, including the 'root' record, are handed to the kv
+store in one batch. If the store has an update() method (as dicts do), the
+batch is passed to it in one call, so a networked store can implement it
+as a single transaction (e.g., a Consul transaction). Otherwise the blobs
+are written one by one, children before parents and 'root' last.
+"""
+from collections import OrderedDict
+from time import time
+
+import structlog
+from enum import Enum
+
+from voltha.core.config.config_children import KeyedChildren, LazyChildren
+
+log = structlog.get_logger()
+
+
+class Durability(Enum):
+
+    # every revision is written to the kv store when created
+    SYNC = 1
+
+    # reachable new revisions are written in one batch per committed change
+    PER_COMMIT = 2
+
+    # reachable new revisions are written in one batch at most once per
+    # flush interval; commits within the interval are coalesced
+    PER_INTERVAL = 3
+
+
+class _Batch(OrderedDict):
+    """Collects blobs of a flush; knows what has been written already"""
+
+    def __init__(self, written):
+        super(_Batch, self).__init__()
+        self._written = written
+
+    def __contains__(self, key):
+        return key in self._written or OrderedDict.__contains__(self, key)
+
+
+class WriteBehind(object):
+
+    def __init__(self, root, kv_store, durability, flush_interval=0.1,
+                 clock=None):
+        assert durability != Durability.SYNC
+        if clock is None:
+            from twisted.internet import reactor
+            clock = reactor
+        self._root = root
+        self._kv_store = kv_store
+        self._durability = durability
+        self._flush_interval = flush_interval
+        self._clock = clock
+        self._latest = None  # latest committed root revision
+        self._written = set()  # hashes known to be in the kv store
+        self._digests = set()  # of keyed children sub-trees written in full
+        self._scheduled = None  # delayed call of pending flush
+        self._dirty_since = None  # clock time of oldest unflushed commit
+        self._pending_commits = 0
+
+        # metrics
+        self.flushes = 0
+        self.commits = 0
+        self.blobs_written = 0
+        self.bytes_written = 0
+        self.last_flush_duration = 0.
+        self.max_flush_duration = 0.
+        self.max_lag = 0.
+
+    @property
+    def durability(self):
+        return self._durability
+
+    def committed(self, rev):
+        """Called by the root each time the committed branch changes"""
+        self._latest = rev
+        self.commits += 1
+        self._pending_commits += 1
+        if self._dirty_since is None:
+            self._dirty_since = self._clock.seconds()
+        if self._durability == Durability.PER_COMMIT:
+            self.flush()
+        elif self._scheduled is None:
+            self._scheduled = self._clock.callLater(
+                self._flush_interval, self._scheduled_flush)
+
+    def mark_written(self, revs):
+        """Record revisions known to be in the kv store already"""
+        written = self._written
+        for rev in revs:
+            written.add(rev._hash)
+            written.add(rev._config._hash)
+        if isinstance(revs, KeyedChildren):
+            self._digests.add(revs.hash)
+
+    def forget(self, keys):
+        """Record that given keys were deleted from the kv store"""
+        self._written.difference_update(keys)
+        # we cannot tell which sub-trees were affected
+        self._digests.clear()
+
+    def _scheduled_flush(self):
+        self._scheduled = None
+        try:
+            self.flush()
+        except Exception, e:
+            # we will retry with the next commit
+            log.exception('write-behind-flush-failed', e=e)
+
+    def flush(self):
+        """Write all reachable, not yet written revisions now"""
+        if self._scheduled is not None:
+            self._scheduled.cancel()
+            self._scheduled = None
+        if self._dirty_since is None:
+            return
+
+        t0 = time()
+        lag = self._clock.seconds() - self._dirty_since
+
+        batch = _Batch(self._written)
+        digests = []
+        self._collect(self._latest, batch, digests)
+        # children before parents, so that a partially completed
+        # non-transactional write never leaves dangling references
+        items = list(reversed(batch.items()))
+        n_revision_items = len(items)
+        items.extend(self._root.root_items(self._latest))
+        self._write(items)
+        self._root.root_items_written()
+
+        for key, _ in items[:n_revision_items]:
+            self._written.add(key)
+        self._digests.update(digests)
+        self._dirty_since = None
+        self._pending_commits = 0
+
+        duration = time() - t0
+        self.flushes += 1
+        self.blobs_written += len(items)
+        self.bytes_written += sum(len(blob) for _, blob in items)
+        self.last_flush_duration = duration
+        self.max_flush_duration = max(self.max_flush_duration, duration)
+        self.max_lag = max(self.max_lag, lag)
+
+    def _collect(self, rev, batch, digests):
+        stack = [rev]
+        while stack:
+            rev = stack.pop()
+            if rev._hash in batch:
+                continue
+            rev.store(batch)
+            all_children = rev._children
+            if isinstance(all_children, LazyChildren):
+                # what is not loaded yet is in the kv store anyway
+                all_children = all_children.loaded_values()
+            else:
+                all_children = all_children.itervalues()
+            for children in all_children:
+                if isinstance(children, KeyedChildren):
+                    children = children.changed_since(self._digests, digests)
+                for child_rev in children:
+                    if child_rev._hash not in batch:
+                        stack.append(child_rev)
+
+    def _write(self, items):
+        kv_store = self._kv_store
+        if hasattr(kv_store, 'update'):
+            kv_store.update(OrderedDict(items))
+        else:
+            for key, blob in items:
+                kv_store[key] = blob
+
+    def metrics(self):
+        if self._dirty_since is None:
+            lag = 0.
+        else:
+            lag = self._clock.seconds() - self._dirty_since
+        return dict(
+            durability=self._durability.name,
+            commits=self.commits,
+            flushes=self.flushes,
+            pending_commits=self._pending_commits,
+            lag=lag,
+            max_lag=self.max_lag,
+            blobs_written=self.blobs_written,
+            bytes_written=self.bytes_written,
+            last_flush_duration=self.last_flush_duration,
+            max_flush_duration=self.max_flush_duration
+        )
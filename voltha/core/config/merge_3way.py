@@ -18,7 +18,6 @@
 3-way merge function for config rev objects.
 """
 from collections import OrderedDict
-from copy import copy
 
 from voltha.core.config.config_proxy import CallbackType, OperationContext
 from voltha.core.config.config_rev import children_fields
@@ -28,7 +27,8 @@ class MergeConflictException(Exception):
     pass
 
 
-def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
+def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False,
+               touched=None):
     """
     Attempt to merge src_rev into dst_rev but taking into account what have
     changed in both revs since the last known common point, the fork_rev.
@@ -45,6 +45,10 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
     may need merge (determined from the local changes)
     :param dry_run: If True, do not perform the merge, but detect merge
     conflicts.
+    :param touched: If known, the keys of the children of each keyed field
+    that were changed since the fork in src_rev's branch (see
+    ConfigBranch.touch). Only those children are then looked at, so that the
+    cost of the merge does not depend on the number of children.
     :return: The new dst_rev (a new rev instance) the list of changes that
     occurred in this node or any of its children as part of this merge.
     """
@@ -53,11 +57,25 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
     changes = []
 
     class AnalyzeChanges(object):
-        def __init__(self, lst1, lst2, keyname):
-            self.keymap1 = OrderedDict((getattr(rev._config._data, keyname), i)
-                                       for i, rev in enumerate(lst1))
-            self.keymap2 = OrderedDict((getattr(rev._config._data, keyname), i)
-                                       for i, rev in enumerate(lst2))
+        def __init__(self, lst1, lst2, keyname, keys=None):
+            if keys is None:
+                self.keymap1 = OrderedDict(
+                    (getattr(rev._config._data, keyname), rev)
+                    for rev in lst1)
+                self.keymap2 = OrderedDict(
+                    (getattr(rev._config._data, keyname), rev)
+                    for rev in lst2)
+            else:
+                # only children of these keys may differ between the lists
+                self.keymap1 = OrderedDict()
+                self.keymap2 = OrderedDict()
+                for key in keys:
+                    rev = _by_key(lst1, key)
+                    if rev is not None:
+                        self.keymap1[key] = rev
+                    rev = _by_key(lst2, key)
+                    if rev is not None:
+                        self.keymap2[key] = rev
             self.added_keys = [
                 k for k in self.keymap2.iterkeys() if k not in self.keymap1]
             self.removed_keys = [
@@ -65,7 +83,7 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
             self.changed_keys = [
                 k for k in self.keymap1.iterkeys()
                 if k in self.keymap2 and
-                    lst1[self.keymap1[k]]._hash != lst2[self.keymap2[k]]._hash
+                    self.keymap1[k]._hash != self.keymap2[k]._hash
             ]
 
     # Note: there are a couple of special cases that can be optimized
@@ -90,12 +108,20 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
         fork_list = fork_rev._children[field_name]
         src_list = src_rev._children[field_name]
         dst_list = dst_rev._children[field_name]
+        keys = None if touched is None or not field.key else \
+            touched.get(field_name, ())
 
         if dst_list == src_list:
             # we do not need to change the dst, however we still need
             # to complete the branch purging in child nodes so not
             # to leave dangling branches around
-            [merge_child_func(rev) for rev in src_list]
+            if keys is None:
+                [merge_child_func(rev) for rev in src_list]
+            else:
+                for key in keys:
+                    rev = _by_key(src_list, key)
+                    if rev is not None:
+                        merge_child_func(rev)
             continue
 
         if not field.key:
@@ -127,14 +153,16 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
                 # We need to analyze only the changes on the incoming rev
                 # since fork
-                src = AnalyzeChanges(fork_list, src_list, field.key)
+                src = AnalyzeChanges(fork_list, src_list, field.key, keys)
 
-                new_list = copy(src_list)  # we start from the source list
+                new_list = src_list  # we start from the source list
 
                 for key in src.added_keys:
-                    idx = src.keymap2[key]
-                    new_rev = merge_child_func(new_list[idx])
-                    new_list[idx] = new_rev
+                    src_child_rev = src.keymap2[key]
+                    new_rev = merge_child_func(src_child_rev)
+                    # children made outside the transaction are already in
+                    if not dry_run and new_rev is not src_child_rev:
+                        new_list = new_list.replace(new_rev)
                     changes.append(
                         (CallbackType.POST_ADD,
                          new_rev.data))
@@ -144,7 +172,7 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                          #     data=new_rev.data)))
 
                 for key in src.removed_keys:
-                    old_rev = fork_list[src.keymap1[key]]
+                    old_rev = src.keymap1[key]
                     changes.append((
                         CallbackType.POST_REMOVE,
                         old_rev.data))
@@ -154,9 +182,10 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                         #     data=old_rev.data)))
 
                 for key in src.changed_keys:
-                    idx = src.keymap2[key]
-                    new_rev = merge_child_func(new_list[idx])
-                    new_list[idx] = new_rev
+                    src_child_rev = src.keymap2[key]
+                    new_rev = merge_child_func(src_child_rev)
+                    if not dry_run and new_rev is not src_child_rev:
+                        new_list = new_list.replace(new_rev)
                     # updated child gets its own change event
 
                 new_children[field_name] = new_list
@@ -167,18 +196,19 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                 # added, removed, or changed in both branches and do a
                 # fine-grained collision detection and merge
 
-                src = AnalyzeChanges(fork_list, src_list, field.key)
-                dst = AnalyzeChanges(fork_list, dst_list, field.key)
+                # the dst side matters only for keys changed in src
+                src = AnalyzeChanges(fork_list, src_list, field.key, keys)
+                dst = AnalyzeChanges(fork_list, dst_list, field.key, keys)
 
-                new_list = copy(dst_list)  # this time we start with the dst
+                new_list = dst_list  # this time we start with the dst
 
                 for key in src.added_keys:
                     # we cannot add if it has been added and is different
                     if key in dst.added_keys:
                         # it has been added to both, we need to check if
                         # they are the same
-                        child_dst_rev = dst_list[dst.keymap2[key]]
-                        child_src_rev = src_list[src.keymap2[key]]
+                        child_dst_rev = dst.keymap2[key]
+                        child_src_rev = src.keymap2[key]
                         if child_dst_rev.hash == child_src_rev.hash:
                             # they match, so we do not need to change the
                             # dst list, but we still need to purge the src
@@ -191,8 +221,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                             )
                     else:
                         # this is a brand new key, need to add it
-                        new_rev = merge_child_func(src_list[src.keymap2[key]])
-                        new_list.append(new_rev)
+                        new_rev = merge_child_func(src.keymap2[key])
+                        new_list = new_list.append(new_rev)
                         changes.append((
                             CallbackType.POST_ADD,
                             new_rev.data))
@@ -210,8 +240,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                     # if it changed in dst as well, we need to check if they
                     # match (same change
                     elif key in dst.changed_keys:
-                        child_dst_rev = dst_list[dst.keymap2[key]]
-                        child_src_rev = src_list[src.keymap2[key]]
+                        child_dst_rev = dst.keymap2[key]
+                        child_src_rev = src.keymap2[key]
                         if child_dst_rev.hash == child_src_rev.hash:
                             # they match, so we do not need to change the
                             # dst list, but we still need to purge the src
@@ -223,19 +253,19 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
                                 'different'
                             )
                         else:
-                            new_rev = merge_child_func(
-                                src_list[src.keymap2[key]])
-                            new_list[dst.keymap2[key]] = new_rev
+                            new_rev = merge_child_func(src.keymap2[key])
+                            if not dry_run:
+                                new_list = new_list.replace(new_rev)
                             # no announcement for child update
 
                     else:
                         # it only changed in src branch
-                        new_rev = merge_child_func(src_list[src.keymap2[key]])
-                        new_list[dst.keymap2[key]] = new_rev
+                        new_rev = merge_child_func(src.keymap2[key])
+                        if not dry_run:
+                            new_list = new_list.replace(new_rev)
                         # no announcement for child update
 
-                for key in reversed(src.removed_keys):  # we go from highest
-                                                        # index to lowest
+                for key in reversed(src.removed_keys):
 
                     # we cannot remove if it has changed in dst
                     if key in dst.changed_keys:
@@ -244,8 +274,8 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
                     # if it has not been removed yet from dst, then remove it
                     if key not in dst.removed_keys:
-                        dst_idx = dst.keymap2[key]
-                        old_rev = new_list.pop(dst_idx)
+                        old_rev = dst.keymap2[key]
+                        new_list = new_list.remove(key)
                         changes.append((
                             CallbackType.POST_REMOVE,
                             old_rev.data))
@@ -265,3 +295,10 @@ def merge_3way(fork_rev, src_rev, dst_rev, merge_child_func, dry_run=False):
 
     else:
         return None, None
+
+
+def _by_key(children, key):
+    try:
+        return children.by_key(key)
+    except KeyError:
+        return None
@@ -23,7 +23,10 @@ from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks, returnValue
 
 from voltha.core.config.config_proxy import CallbackType
+from voltha.core.flow_diff import diff_flows, diff_groups, has_changes
+from voltha.core.flow_push_scheduler import FlowPushScheduler
 from voltha.protos.common_pb2 import AdminState, OperStatus
+from voltha.protos.openflow_13_pb2 import Flows, FlowGroups
 from voltha.registry import registry
 
 
@@ -32,6 +35,10 @@ class InvalidStateTransition(Exception): pass
 
 class DeviceAgent(object):
 
+    # seconds to wait for further flow and group table updates before
+    # pushing them to the device, see FlowPushScheduler
+    flow_push_window = 0.01
+
     def __init__(self, core, initial_data):
 
         self.core = core
@@ -58,6 +65,13 @@ class DeviceAgent(object):
         self.device_type = core.get_proxy(
             '/device_types/{}'.format(initial_data.type)).get()
 
+        # the flow and group tables as last passed on to the adapter; none
+        # so far, so the first push passes on those already in the model
+        self._flows = Flows()
+        self._groups = FlowGroups()
+        self._flow_push = FlowPushScheduler(
+            self._update_flows, window=self.flow_push_window)
+
         self.adapter_agent = None
         self.log = structlog.get_logger(device_id=initial_data.id)
 
@@ -76,6 +90,7 @@ class DeviceAgent(object):
             CallbackType.PRE_UPDATE, self._validate_update)
         self.proxy.unregister_callback(
             CallbackType.POST_UPDATE, self._process_update)
+        self._flow_push.stop()
         self.log.info('stopped')
 
     def _set_adapter_agent(self):
@@ -189,46 +204,62 @@ class DeviceAgent(object):
 
     ## <======================= FLOW TABLE UPDATE HANDLING ====================
 
-    @inlineCallbacks
     def _flow_table_updated(self, flows):
         self.log.debug('flow-table-updated',
                   logical_device_id=self.last_data.id, flows=flows)
-
-        # if device accepts bulk flow update, lets just call that
-        if self.device_type.accepts_bulk_flow_update:
-            groups = self.groups_proxy.get('/') # gather flow groups
-            yield self.adapter_agent.update_flows_bulk(
-                device=self.last_data,
-                flows=flows,
-                groups=groups)
-            # TODO place to feed back completion
-
-        elif self.accepts_add_remove_flow_updates:
-            raise NotImplementedError()
-
-        else:
-            raise NotImplementedError()
+        groups = self.groups_proxy.get('/')  # gather flow groups
+        self._flow_push.schedule(flows, groups)
 
     ## <======================= GROUP TABLE UPDATE HANDLING ===================
 
-    @inlineCallbacks
     def _group_table_updated(self, groups):
         self.log.debug('group-table-updated',
                   logical_device_id=self.last_data.id,
                   flow_groups=groups)
+        flows = self.flows_proxy.get('/')  # gather flows
+        self._flow_push.schedule(flows, groups)
+
+    def flow_push_metrics(self):
+        """Return the queue depth, coalesce ratio and latency of pushes"""
+        return self._flow_push.metrics()
+
+    @inlineCallbacks
+    def _update_flows(self, flows, groups):
+        """
+        Pass the changes of the flow and group tables since they were last
+        passed on to the adapter: only those changes if the device accepts
+        add/remove flow updates, else (or if that fails) both tables in
+        bulk. Nothing is passed on if neither table changed. The tables are
+        taken as passed on only once the adapter took them, so the changes
+        of a failed push are passed on again with the next one. Called by
+        the FlowPushScheduler, one call at a time.
+        """
+        flow_changes = diff_flows(self._flows.items, flows.items)
+        group_changes = diff_groups(self._groups.items, groups.items)
+        if not (has_changes(flow_changes) or has_changes(group_changes)):
+            return
+
+        if self.device_type.accepts_add_remove_flow_updates:
+            try:
+                yield self.adapter_agent.update_flows_incrementally(
+                    device=self.last_data,
+                    flow_changes=flow_changes,
+                    group_changes=group_changes)
+                # TODO place to feed back completion
+                self._flows, self._groups = flows, groups
+                return
+            except Exception, e:
+                if not self.device_type.accepts_bulk_flow_update:
+                    raise
+                self.log.exception('incremental-flow-update-failed', e=e)
 
-        # if device accepts bulk flow update, lets just call that
         if self.device_type.accepts_bulk_flow_update:
-            flows = self.flows_proxy.get('/')  # gather flows
             yield self.adapter_agent.update_flows_bulk(
                 device=self.last_data,
                 flows=flows,
                 groups=groups)
             # TODO place to feed back completion
-
-        elif self.accepts_add_remove_flow_updates:
-            raise NotImplementedError()
+            self._flows, self._groups = flows, groups
 
         else:
             raise NotImplementedError()
-
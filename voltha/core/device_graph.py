@@ -19,11 +19,96 @@ import networkx as nx
 from voltha.core.flow_decomposer import RouteHop
 
 
+class RouteTable(object):
+    """
+    Routes by (ingress port no, egress port no), also indexed by ingress
+    and by egress port, so that a route from or to a given port is found
+    without scanning all routes, e.g., for half routes.
+    """
+
+    def __init__(self, routes=()):
+        self._routes = {}
+        self._by_ingress = {}  # ingress port no -> egress port no -> route
+        self._by_egress = {}  # egress port no -> ingress port no -> route
+        for key, route in routes:
+            self[key] = route
+
+    def __len__(self):
+        return len(self._routes)
+
+    def __iter__(self):
+        return iter(self._routes)
+
+    def __contains__(self, key):
+        return key in self._routes
+
+    def __getitem__(self, key):
+        return self._routes[key]
+
+    def __setitem__(self, key, route):
+        ingress, egress = key
+        self._routes[key] = route
+        self._by_ingress.setdefault(ingress, {})[egress] = route
+        self._by_egress.setdefault(egress, {})[ingress] = route
+
+    def __eq__(self, other):
+        if isinstance(other, RouteTable):
+            other = other._routes
+        return self._routes == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, key, default=None):
+        return self._routes.get(key, default)
+
+    def setdefault(self, key, route):
+        if key not in self._routes:
+            self[key] = route
+        return self._routes[key]
+
+    def pop(self, key, *default):
+        if key not in self._routes:
+            return self._routes.pop(key, *default)
+        ingress, egress = key
+        for index, port_no, other in ((self._by_ingress, ingress, egress),
+                                      (self._by_egress, egress, ingress)):
+            routes = index[port_no]
+            del routes[other]
+            if not routes:
+                del index[port_no]
+        return self._routes.pop(key)
+
+    def keys(self):
+        return self._routes.keys()
+
+    def iteritems(self):
+        return self._routes.iteritems()
+
+    def any_from(self, ingress_port_no):
+        """Return a route from the given port, or None"""
+        routes = self._by_ingress.get(ingress_port_no)
+        return next(routes.itervalues()) if routes else None
+
+    def any_to(self, egress_port_no):
+        """Return a route to the given port, or None"""
+        routes = self._by_egress.get(egress_port_no)
+        return next(routes.itervalues()) if routes else None
+
+
 class DeviceGraph(object):
 
     """
     Mixin class to compute routes in the device graph within
     a logical device.
+
+    Routes lead from a boundary port of a device to a boundary port of a
+    peer device, e.g., from the NNI port of the OLT to the UNI port of an
+    ONU and back, as the device graph of a logical device is a tree of
+    single fan-out. Hence the routes of a boundary port are found among
+    the ports of its device and its peer devices only, and can be added
+    and removed with the port, see add_boundary_port() and
+    remove_boundary_port().
     """
 
     def compute_routes(self, root_proxy, logical_ports):
@@ -31,93 +116,163 @@ class DeviceGraph(object):
         routes = self._build_routes(boundary_ports, graph)
         return graph, routes
 
+    def add_boundary_port(self, root_proxy, graph, routes, logical_port):
+        """
+        Add the routes from and to a new logical port to routes, adding
+        its device to graph if not yet there. Ports added to devices after
+        they were added to graph are not in graph, in which case routes are
+        not changed, and both graph and routes are to be rebuilt.
+        :return: ids of the devices added to graph, None if to be rebuilt
+        """
+        port_id = (logical_port.device_id, logical_port.device_port_no)
+        added = []
+        if logical_port.device_id not in graph:
+            device = root_proxy.get(
+                '/devices/{}'.format(logical_port.device_id))
+            missing = []
+            self._add_device(root_proxy, graph, device, {}, added, missing)
+            if missing:
+                return None
+        elif not self._has_ports(root_proxy, graph, logical_port.device_id):
+            return None
+        graph.node[port_id]['boundary'] = True
+        graph.node[port_id]['port_no'] = logical_port.ofp_port.port_no
+        for key, route in self._port_routes(port_id, graph):
+            routes[key] = route
+        return added
+
+    def remove_boundary_port(self, graph, routes, logical_port):
+        """Remove the routes from and to a logical port from routes"""
+        port_id = (logical_port.device_id, logical_port.device_port_no)
+        if port_id not in graph:
+            return
+        for key, _ in self._port_routes(port_id, graph):
+            routes.pop(key, None)
+        graph.node[port_id]['boundary'] = False
+
     def _build_graph(self, root_proxy, logical_ports):
 
         graph = nx.Graph()
 
         # walk logical device's device and port links to discover full graph
-        devices_added = set()  # set of device.id's
-        ports_added = set()  # set of (device.id, port_no) tuples
-        peer_links = set()
-
         boundary_ports = dict(
             ((lp.device_id, lp.device_port_no), lp.ofp_port.port_no)
             for lp in logical_ports
         )
 
-        def add_device(device):
-            if device.id in devices_added:
-                return
-
-            graph.add_node(device.id, device=device)
-            devices_added.add(device.id)
-
-            ports = root_proxy.get('/devices/{}/ports'.format(device.id))
-            for port in ports:
-                port_id = (device.id, port.port_no)
-                if port_id not in ports_added:
-                    boundary = port_id in boundary_ports
-                    graph.add_node(port_id, port=port, boundary=boundary)
-                    graph.add_edge(device.id, port_id)
-                for peer in port.peers:
-                    if peer.device_id not in devices_added:
-                        peer_device = root_proxy.get(
-                            '/devices/{}'.format(peer.device_id))
-                        add_device(peer_device)
-                    else:
-                        peer_port_id = (peer.device_id, peer.port_no)
-                        if port_id < peer_port_id:
-                            peer_link = (port_id, peer_port_id)
-                        else:
-                            peer_link = (peer_port_id, port_id)
-                        if peer_link not in peer_links:
-                            graph.add_edge(*peer_link)
-                            peer_links.add(peer_link)
-
         for logical_port in logical_ports:
             device_id = logical_port.device_id
-            device = root_proxy.get('/devices/{}'.format(device_id))
-            add_device(device)
+            if device_id not in graph:
+                device = root_proxy.get('/devices/{}'.format(device_id))
+                self._add_device(root_proxy, graph, device, boundary_ports)
 
         return boundary_ports, graph
 
-    def _build_routes(self, boundary_ports, graph):
-
-        routes = {}
-
-        for source, source_port_no in boundary_ports.iteritems():
-            for target, target_port_no in boundary_ports.iteritems():
-
-                if source is target:
-                    continue
+    def _add_device(self, root_proxy, graph, device, boundary_ports,
+                    added=None, missing=None):
+        """
+        Add device, and the peer devices not in graph yet, to graph; the
+        ids of the devices added are appended to added, if given, and the
+        ids of the peer ports of devices in graph but missing from it to
+        missing, if given
+        """
+        if device.id in graph:
+            return
 
-                path = nx.shortest_path(graph, source, target)
+        graph.add_node(device.id, device=device)
+        if added is not None:
+            added.append(device.id)
 
-                # number of nodes in valid paths is always multiple of 3
-                if len(path) % 3:
-                    continue
+        ports = root_proxy.get('/devices/{}/ports'.format(device.id))
+        for port in ports:
+            port_id = (device.id, port.port_no)
+            if port_id not in graph:
+                boundary = port_id in boundary_ports
+                graph.add_node(port_id, port=port, boundary=boundary,
+                               port_no=boundary_ports.get(port_id))
+                graph.add_edge(device.id, port_id)
+            for peer in port.peers:
+                if peer.device_id not in graph:
+                    peer_device = root_proxy.get(
+                        '/devices/{}'.format(peer.device_id))
+                    self._add_device(
+                        root_proxy, graph, peer_device, boundary_ports, added)
+                else:
+                    peer_port_id = (peer.device_id, peer.port_no)
+                    if peer_port_id not in graph:
+                        if missing is not None:
+                            missing.append(peer_port_id)
+                    elif not graph.has_edge(port_id, peer_port_id):
+                        graph.add_edge(port_id, peer_port_id)
 
-                # in fact, we currently deal with single fan-out networks,
-                # so the number of hops is always 6
-                assert len(path) == 6
+    def _has_ports(self, root_proxy, graph, device_id):
+        """
+        Tell if graph holds the ports of a device in it, and their links to
+        the peer devices in it
+        """
+        for port in root_proxy.get('/devices/{}/ports'.format(device_id)):
+            port_id = (device_id, port.port_no)
+            if port_id not in graph:
+                return False
+            for peer in port.peers:
+                if peer.device_id in graph and not graph.has_edge(
+                        port_id, (peer.device_id, peer.port_no)):
+                    return False
+        return True
 
-                ingress_input_port, ingress_device, ingress_output_port, \
-                egress_input_port, egress_device, egress_output_port = path
+    def _build_routes(self, boundary_ports, graph):
 
-                ingress_hop = RouteHop(
-                    device=graph.node[ingress_device]['device'],
-                    ingress_port=graph.node[ingress_input_port]['port'],
-                    egress_port=graph.node[ingress_output_port]['port']
-                )
-                egress_hop = RouteHop(
-                    device=graph.node[egress_device]['device'],
-                    ingress_port=graph.node[egress_input_port]['port'],
-                    egress_port=graph.node[egress_output_port]['port']
-                )
+        routes = RouteTable()
 
-                routes[(source_port_no, target_port_no)] = [
-                    ingress_hop, egress_hop
-                ]
+        for source in boundary_ports:
+            for key, route in self._port_routes(source, graph, False):
+                routes.setdefault(key, route)
 
         return routes
 
+    def _port_routes(self, port_id, graph, reverse=True):
+        """
+        Generate the routes from boundary port port_id, as (key, route)
+        pairs, to the boundary ports of its peer devices; with reverse set,
+        also generate the routes in the opposite direction.
+        """
+        node = graph.node
+        device_id = port_id[0]
+        device = node[device_id]['device']
+        port = node[port_id]['port']
+        port_no = node[port_id]['port_no']
+
+        for output_port_id in graph.neighbors(device_id):
+            if output_port_id == port_id:
+                continue
+            output_port = node[output_port_id]['port']
+            for peer_port_id in graph.neighbors(output_port_id):
+                peer_device_id = peer_port_id[0] \
+                    if isinstance(peer_port_id, tuple) else None
+                if peer_device_id is None or peer_device_id == device_id:
+                    continue
+                peer_device = node[peer_device_id]['device']
+                peer_port = node[peer_port_id]['port']
+                for target_port_id in graph.neighbors(peer_device_id):
+                    target = node[target_port_id]
+                    if target_port_id == peer_port_id or \
+                            not target['boundary']:
+                        continue
+                    target_port_no = target['port_no']
+                    yield (port_no, target_port_no), [
+                        RouteHop(device=device,
+                                 ingress_port=port,
+                                 egress_port=output_port),
+                        RouteHop(device=peer_device,
+                                 ingress_port=peer_port,
+                                 egress_port=target['port'])
+                    ]
+                    if reverse:
+                        yield (target_port_no, port_no), [
+                            RouteHop(device=peer_device,
+                                     ingress_port=target['port'],
+                                     egress_port=peer_port),
+                            RouteHop(device=device,
+                                     ingress_port=output_port,
+                                     egress_port=port)
+                        ]
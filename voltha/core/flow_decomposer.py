@@ -18,11 +18,13 @@
 A mix-in class implementing flow decomposition
 """
 from collections import OrderedDict
-from copy import copy, deepcopy
+from copy import copy
 from hashlib import md5
+from struct import Struct
 
 import structlog
 
+from common.utils.lru_cache import LRUCache
 from voltha.protos import third_party
 from voltha.protos import openflow_13_pb2 as ofp
 
@@ -336,16 +338,28 @@ def mk_multicast_group_mod(group_id, buckets, command=ofp.OFPGC_ADD):
 def hash_flow_stats(flow):
     """
     Return unique 64-bit integer hash for flow covering the following
-    attributes: 'table_id', 'priority', 'flags', 'cookie', 'match'
+    attributes: 'table_id', 'priority', 'flags', 'cookie', 'match'.
+    Computed once, when the flow is made, as its id; the id then stands
+    for these attributes, e.g., in LogicalDeviceAgent.flow_match(). It is
+    persisted, so it must not change: the first 64 bits of the md5 digest
+    of the attributes, formatted as ever (the partial serialization is the
+    same in proto3, there being no required fields to check).
     """
-    hex = md5('{},{},{},{},{}'.format(
+    return _unpack_uint64(md5('{},{},{},{},{}'.format(
         flow.table_id,
         flow.priority,
         flow.flags,
         flow.cookie,
-        flow.match.SerializeToString()
-    )).hexdigest()
-    return int(hex[:16], 16)
+        flow.match.SerializePartialToString()
+    )).digest())[0]
+
+
+_unpack_uint64 = Struct('>Q').unpack_from
+
+
+def _flow_id(flow):
+    # flows made by the decomposer have their id set, compute it otherwise
+    return flow.id or hash_flow_stats(flow)
 
 
 def flow_stats_entry_from_flow_mod_message(mod):
@@ -404,10 +418,71 @@ class RouteHop(object):
             self._egress_port == other._egress_port)
 
 
+class FlowDecomposition(object):
+    """State kept by FlowDecomposer.decompose_rules_incrementally()"""
+    __slots__ = ('default_rules', 'group_map', 'flows', 'device_rules')
+    def __init__(self, default_rules, device_rules):
+        self.default_rules = default_rules
+        self.group_map = {}
+        # flow id -> (flow, group id, device rules of flow), in table order
+        self.flows = OrderedDict()
+        # device id -> (device flows, device groups), as last returned
+        self.device_rules = device_rules
+
+
+class DecompositionCache(object):
+    """
+    Bounded memo of flow decompositions. A flow decomposes the same as long
+    as it, the group it refers to, and the routes and default rules are the
+    same. Entries are keyed by a digest of the former two and the topology
+    generation, which counts the changes of the latter.
+    """
+    __slots__ = ('_cache', '_default_rules', 'generation')
+
+    def __init__(self, maxsize):
+        self._cache = LRUCache(maxsize)
+        self._default_rules = None
+        self.generation = 0
+
+    def set_topology(self, default_rules):
+        # a new default rules object comes with the routes changing
+        if default_rules is not self._default_rules:
+            self._default_rules = default_rules
+            self.generation += 1
+
+    def key(self, flow, group_map):
+        group_id = get_group(flow)
+        group = group_map.get(group_id) if group_id is not None else None
+        return (
+            self.generation,
+            _flow_id(flow),  # the hash of the match and alike
+            ''.join(i.SerializeToString() for i in flow.instructions),
+            None if group is None else group.desc.SerializeToString()
+        )
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def __setitem__(self, key, rules):
+        self._cache[key] = rules
+
+    def metrics(self):
+        return dict(
+            hits=self._cache.hits,
+            misses=self._cache.misses,
+            size=len(self._cache),
+            generation=self.generation
+        )
+
+
 class FlowDecomposer(object):
 
+    decomposition_cache_size = 10000
+    _decomposition_cache = None  # created when first used
+
     def __init__(self, *args, **kw):
         self.logical_device_id = 'this shall be overwritten in derived class'
+        self._decomposition = None
         super(FlowDecomposer, self).__init__(*args, **kw)
 
     # ~~~~~~~~~~~~~~~~~~~~ methods exposed *to* derived class ~~~~~~~~~~~~~~~~~
@@ -422,22 +497,128 @@ class FlowDecomposer(object):
             (OrderedDict-of-device-flows, OrderedDict-of-device-flow-groups))
         """
 
-        device_rules = deepcopy(self.get_all_default_rules())
+        default_rules = self.get_all_default_rules()
+        # the rules themselves are not modified, so copying the dicts will do
+        device_rules = dict(
+            (device_id, (OrderedDict(_flows), OrderedDict(_groups)))
+            for device_id, (_flows, _groups) in default_rules.iteritems())
         group_map = dict((g.desc.group_id, g) for g in groups)
 
+        cache = self._get_decomposition_cache(default_rules)
         for flow in flows:
-            for device_id, (_flows, _groups) \
-                    in self.decompose_flow(flow, group_map).iteritems():
-                fl_lst, gr_lst = device_rules.setdefault(
-                    device_id, (OrderedDict(), OrderedDict()))
-                for _flow in _flows:
-                    if _flow.id not in fl_lst:
-                        fl_lst[_flow.id] = _flow
-                for _group in _groups:
-                    if _group.group_id not in gr_lst:
-                        gr_lst[_group.group_id] = _group
+            self._add_device_rules(
+                device_rules, self._decompose_flow(cache, flow, group_map))
         return device_rules
 
+    def decompose_rules_incrementally(self, flows, groups):
+        """
+        Like decompose_rules(), but the decomposition of each flow is kept
+        between calls, so that only flows that were added or changed since
+        the previous call, or that refer to a group that changed, need to
+        be decomposed. All flows are decomposed again once the default
+        rules (and with them the routes) changed.
+        :param flows: logical device flows
+        :param groups: logical device flow groups
+        :return: dict(device_id ->
+            (OrderedDict-of-device-flows, OrderedDict-of-device-flow-groups))
+            holding only the devices whose rules changed since the previous
+            call
+        """
+        default_rules = self.get_all_default_rules()
+        group_map = dict((g.desc.group_id, g) for g in groups)
+        cache = self._get_decomposition_cache(default_rules)
+
+        state = self._decomposition
+        if state is None or state.default_rules is not default_rules:
+            state = self._decomposition = FlowDecomposition(
+                default_rules, {} if state is None else state.device_rules)
+            affected = set(default_rules)
+            changed_groups = ()
+        else:
+            affected = set()
+            changed_groups = set(
+                group_id for group_id in set(group_map) | set(state.group_map)
+                if group_map.get(group_id) != state.group_map.get(group_id))
+        state.group_map = group_map
+
+        # decompose new and changed flows only
+        old_flows = state.flows
+        new_flows = OrderedDict()
+        for flow in flows:
+            flow_id = _flow_id(flow)
+            entry = old_flows.get(flow_id)
+            if entry is not None:
+                if entry[0] == flow and entry[1] not in changed_groups:
+                    new_flows[flow_id] = entry
+                    continue
+                affected.update(entry[2])
+            rules = self._decompose_flow(cache, flow, group_map)
+            affected.update(rules)
+            new_flows[flow_id] = (flow, get_group(flow), rules)
+        for flow_id, entry in old_flows.iteritems():
+            if flow_id not in new_flows:
+                affected.update(entry[2])
+        state.flows = new_flows
+
+        # re-assemble the rules of the affected devices, in flow table order
+        device_rules = dict(
+            (device_id, (OrderedDict(_flows), OrderedDict(_groups)))
+            for device_id, (_flows, _groups) in default_rules.iteritems()
+            if device_id in affected)
+        for _, _, rules in new_flows.itervalues():
+            for device_id in rules:
+                if device_id in affected:
+                    self._add_device_rules(device_rules, rules, device_id)
+
+        changed = {}
+        for device_id in affected:
+            rules = device_rules.get(device_id, (OrderedDict(), OrderedDict()))
+            if state.device_rules.get(device_id) != rules:
+                state.device_rules[device_id] = changed[device_id] = rules
+        return changed
+
+    def decomposition_cache_metrics(self):
+        """Return the hit and miss counts, and alike, of the memo"""
+        cache = self._get_decomposition_cache(None)
+        return cache.metrics()
+
+    def _get_decomposition_cache(self, default_rules):
+        cache = self._decomposition_cache
+        if cache is None:
+            cache = self._decomposition_cache = DecompositionCache(
+                self.decomposition_cache_size)
+        if default_rules is not None:
+            cache.set_topology(default_rules)
+        return cache
+
+    def _decompose_flow(self, cache, flow, group_map):
+        """decompose_flow(), reusing the rules of an equal decomposition"""
+        key = cache.key(flow, group_map)
+        rules = cache.get(key)
+        if rules is None:
+            rules = cache[key] = self.decompose_flow(flow, group_map)
+        return rules
+
+    @staticmethod
+    def _add_device_rules(device_rules, rules, device_id=None):
+        """
+        Add the per device flows and groups of a decomposed flow to
+        device_rules (of all devices, or of the given one only)
+        """
+        if device_id is None:
+            items = rules.iteritems()
+        else:
+            items = [(device_id, rules[device_id])]
+        for device_id, (_flows, _groups) in items:
+            fl_lst, gr_lst = device_rules.setdefault(
+                device_id, (OrderedDict(), OrderedDict()))
+            for _flow in _flows:
+                if _flow.id not in fl_lst:
+                    fl_lst[_flow.id] = _flow
+            for _group in _groups:
+                if _group.group_id not in gr_lst:
+                    gr_lst[_group.group_id] = _group
+
     def decompose_flow(self, flow, group_map):
         assert isinstance(flow, ofp.ofp_flow_stats)
 
@@ -0,0 +1,86 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Changes between two versions of the flow and group tables of a device
+"""
+from collections import OrderedDict
+
+from voltha.core.flow_decomposer import hash_flow_stats
+from voltha.protos import third_party
+from voltha.protos.openflow_13_pb2 import FlowChanges, FlowGroupChanges
+
+_ = third_party
+
+
+def diff_flows(old_flows, new_flows):
+    """
+    Return the FlowChanges turning the old_flows into the new_flows (both
+    iterables of ofp_flow_stats). Flows are told apart by id, which stands
+    for their table, priority, flags, cookie and match; a flow of both
+    having other instructions or timeouts is modified. Counters are not
+    compared, as they do not tell what the device is to do.
+    """
+    old = _by_flow_id(old_flows)
+    new = _by_flow_id(new_flows)
+    changes = FlowChanges()
+    for flow_id, flow in new.iteritems():
+        old_flow = old.get(flow_id)
+        if old_flow is None:
+            changes.to_add.items.extend([flow])
+        elif _flow_differs(old_flow, flow):
+            changes.to_modify.items.extend([flow])
+    changes.to_remove.items.extend(
+        flow for flow_id, flow in old.iteritems() if flow_id not in new)
+    return changes
+
+
+def diff_groups(old_groups, new_groups):
+    """
+    Return the FlowGroupChanges turning the old_groups into the new_groups
+    (both iterables of ofp_group_entry). Groups are told apart by group id;
+    a group of both with another description is modified.
+    """
+    old = OrderedDict((group.desc.group_id, group) for group in old_groups)
+    new = OrderedDict((group.desc.group_id, group) for group in new_groups)
+    changes = FlowGroupChanges()
+    for group_id, group in new.iteritems():
+        old_group = old.get(group_id)
+        if old_group is None:
+            changes.to_add.items.extend([group])
+        elif old_group.desc != group.desc:
+            changes.to_modify.items.extend([group])
+    changes.to_remove.items.extend(
+        group for group_id, group in old.iteritems() if group_id not in new)
+    return changes
+
+
+def has_changes(changes):
+    """Tell if FlowChanges or FlowGroupChanges change anything"""
+    return bool(changes.to_add.items or changes.to_remove.items or
+                changes.to_modify.items)
+
+
+def _by_flow_id(flows):
+    # flows made by the decomposer have their id set, compute it otherwise
+    return OrderedDict((flow.id or hash_flow_stats(flow), flow)
+                       for flow in flows)
+
+
+def _flow_differs(old_flow, flow):
+    return (old_flow.instructions != flow.instructions or
+            old_flow.idle_timeout != flow.idle_timeout or
+            old_flow.hard_timeout != flow.hard_timeout)
@@ -0,0 +1,125 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Coalescing of the flow and group table pushes to a device
+"""
+import structlog
+from twisted.internet import reactor
+from twisted.internet.defer import maybeDeferred
+
+log = structlog.get_logger()
+
+
+class FlowPushScheduler(object):
+    """
+    Pushes the flow and group tables of a device, as updated, to it: window
+    seconds after the first update not pushed yet came, with only the
+    latest tables being pushed, and one push at a time. Updates coming
+    while a push is in flight are pushed once it completed (and the window
+    passed), so the last tables pushed are always the latest ones. With a
+    window of 0, updates are pushed at once, unless a push is in flight.
+    """
+
+    def __init__(self, push, window=0.01, clock=reactor):
+        self.push = push  # (flows, groups) -> Deferred or None
+        self.window = window
+        self.clock = clock
+        self.pending = None  # latest (flows, groups) not pushed yet
+        self.pending_updates = 0  # number of updates they stand for
+        self.pending_since = None  # when the first of them came
+        self.timer = None
+        self.in_flight = False
+        self.updates = 0
+        self.pushes = 0
+        self.pushed_updates = 0  # number of updates the pushes stood for
+        self.failures = 0
+        self.last_latency = None
+        self.max_latency = 0.0
+        self.total_latency = 0.0
+
+    def schedule(self, flows, groups):
+        if self.pending is None:
+            self.pending_since = self.clock.seconds()
+        self.pending = (flows, groups)
+        self.pending_updates += 1
+        self.updates += 1
+        if not self.in_flight and self.timer is None:
+            self._start_timer()
+
+    def stop(self):
+        """Drop the pending update, if any"""
+        if self.timer is not None:
+            if self.timer.active():
+                self.timer.cancel()
+            self.timer = None
+        self.pending = None
+        self.pending_updates = 0
+
+    def metrics(self):
+        """
+        Return the number of updates waiting to be pushed (queue_depth),
+        the number of updates per push (coalesce_ratio), and the time from
+        the first update a push covers to its completion (latency), in
+        seconds.
+        """
+        return dict(
+            queue_depth=self.pending_updates,
+            in_flight=self.in_flight,
+            updates=self.updates,
+            pushes=self.pushes,
+            failures=self.failures,
+            coalesce_ratio=(float(self.pushed_updates) / self.pushes
+                            if self.pushes else 0.0),
+            last_latency=self.last_latency,
+            max_latency=self.max_latency,
+            mean_latency=(self.total_latency / self.pushes
+                          if self.pushes else 0.0)
+        )
+
+    def _start_timer(self):
+        if self.window:
+            self.timer = self.clock.callLater(self.window, self._push)
+        else:
+            self._push()
+
+    def _push(self):
+        self.timer = None
+        if self.pending is None:
+            return
+        (flows, groups), since = self.pending, self.pending_since
+        n_updates = self.pending_updates
+        self.pending = None
+        self.pending_updates = 0
+        self.in_flight = True
+        d = maybeDeferred(self.push, flows, groups)
+        d.addErrback(self._failed)
+        d.addCallback(self._pushed, since, n_updates)
+
+    def _failed(self, failure):
+        self.failures += 1
+        log.error('flow-push-failed', failure=failure.getTraceback())
+
+    def _pushed(self, _, since, n_updates):
+        latency = self.clock.seconds() - since
+        self.pushes += 1
+        self.pushed_updates += n_updates
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+        self.in_flight = False
+        if self.pending is not None:
+            self._start_timer()
@@ -0,0 +1,360 @@
+#
+# Copyright 2017 the original author or authors.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Indexed flow table of a logical device
+"""
+from binascii import hexlify
+from collections import OrderedDict
+
+from voltha.core.flow_decomposer import hash_flow_stats
+from voltha.protos import third_party
+from voltha.protos import openflow_13_pb2 as ofp
+from voltha.protos.openflow_13_pb2 import Flows
+
+_ = third_party
+
+ALL_COOKIE_BITS = 0xffffffffffffffff
+
+
+class FlowTable(object):
+    """
+    The flows of a logical device, in table order, indexed for the lookups
+    done when handling flow-mods:
+
+    - by flow id, for strict matching: the id hashes exactly the fields
+      strict matching compares (table_id, priority, flags, cookie and
+      match, see hash_flow_stats()); flows without id are indexed by the
+      id they would have,
+    - by table id, cookie, output port and output group, to narrow down
+      the flows a non-strict flow-mod may cover,
+    - by match, to find overlapping flows (see OverlapIndex), which is
+      built when first needed.
+    """
+
+    def __init__(self, flows=()):
+        self._flows = OrderedDict()  # flow id -> flow
+        self._seq = {}  # flow id -> sequence number, telling table order
+        self._next_seq = 0
+        self._by_table = {}  # table id -> set of flow ids
+        self._by_cookie = {}  # cookie -> set of flow ids
+        self._by_out_port = {}  # output port -> set of flow ids
+        self._by_out_group = {}  # group id -> set of flow ids
+        self._overlap = None
+        for flow in flows:
+            self.add(flow)
+
+    def __len__(self):
+        return len(self._flows)
+
+    def __iter__(self):
+        return self._flows.itervalues()
+
+    def __contains__(self, flow_id):
+        return flow_id in self._flows
+
+    def find(self, flow):
+        """Return the flow strictly matching the given one, or None"""
+        return self._flows.get(_flow_id(flow))
+
+    def add(self, flow):
+        """Add flow, replacing the flow strictly matching it, if any"""
+        flow_id = _flow_id(flow)
+        old_flow = self._flows.get(flow_id)
+        if old_flow is not None:
+            self._unindex(old_flow)
+        else:
+            self._seq[flow_id] = self._next_seq
+            self._next_seq += 1
+        self._flows[flow_id] = flow
+        self._index(flow)
+
+    def remove(self, flow):
+        """Remove the flow strictly matching the given one, if any"""
+        flow_id = _flow_id(flow)
+        old_flow = self._flows.pop(flow_id, None)
+        if old_flow is not None:
+            del self._seq[flow_id]
+            self._unindex(old_flow)
+        return old_flow
+
+    def candidates(self, flow_mod):
+        """
+        Return the flows a non-strict flow_mod may cover: a superset of
+        those covered, as narrow as the indexes allow. The caller still has
+        to check each of them.
+        """
+        candidate_sets = []
+        if flow_mod.cookie_mask == ALL_COOKIE_BITS:
+            candidate_sets.append(self._by_cookie.get(flow_mod.cookie, ()))
+        if flow_mod.table_id != ofp.OFPTT_ALL:
+            candidate_sets.append(self._by_table.get(flow_mod.table_id, ()))
+        if (flow_mod.out_port & 0x7fffffff) != ofp.OFPP_ANY:
+            candidate_sets.append(
+                self._by_out_port.get(flow_mod.out_port, ()))
+        if (flow_mod.out_group & 0x7fffffff) != ofp.OFPG_ANY:
+            candidate_sets.append(
+                self._by_out_group.get(flow_mod.out_group, ()))
+        if not candidate_sets:
+            return list(self._flows.itervalues())
+        return self._in_order(min(candidate_sets, key=len))
+
+    def with_out_group(self, group_id):
+        """Return the flows with an output to the given group"""
+        return self._in_order(self._by_out_group.get(group_id, ()))
+
+    def overlapping(self, flow, return_on_first=False):
+        """
+        Return the flows overlapping with flow (or flow-mod): those of the
+        same table and priority a packet may match along with it.
+        """
+        if self._overlap is None:
+            self._overlap = OverlapIndex()
+            for f in self._flows.itervalues():
+                self._overlap.add(f)
+        return self._in_order(
+            self._overlap.overlapping(flow, return_on_first))
+
+    def to_message(self):
+        return Flows(items=self._flows.values())
+
+    # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ indexing ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    def _in_order(self, flow_ids):
+        return [self._flows[flow_id]
+                for flow_id in sorted(flow_ids, key=self._seq.__getitem__)]
+
+    def _index(self, flow):
+        if self._overlap is not None:
+            self._overlap.add(flow)
+        flow_id = _flow_id(flow)
+        self._by_table.setdefault(flow.table_id, set()).add(flow_id)
+        self._by_cookie.setdefault(flow.cookie, set()).add(flow_id)
+        out_ports, out_groups = self._outputs(flow)
+        for port in out_ports:
+            self._by_out_port.setdefault(port, set()).add(flow_id)
+        for group_id in out_groups:
+            self._by_out_group.setdefault(group_id, set()).add(flow_id)
+
+    def _unindex(self, flow):
+        if self._overlap is not None:
+            self._overlap.remove(flow)
+        flow_id = _flow_id(flow)
+        _discard(self._by_table, flow.table_id, flow_id)
+        _discard(self._by_cookie, flow.cookie, flow_id)
+        out_ports, out_groups = self._outputs(flow)
+        for port in out_ports:
+            _discard(self._by_out_port, port, flow_id)
+        for group_id in out_groups:
+            _discard(self._by_out_group, group_id, flow_id)
+
+    @staticmethod
+    def _outputs(flow):
+        """
+        Return the output ports and groups of the apply actions of flow, as
+        checked by LogicalDeviceAgent.flow_has_out_port()/_out_group()
+        """
+        out_ports = []
+        out_groups = []
+        for instruction in flow.instructions:
+            if instruction.type == ofp.OFPIT_APPLY_ACTIONS:
+                for action in instruction.actions.actions:
+                    if action.type == ofp.OFPAT_OUTPUT:
+                        out_ports.append(action.output.port)
+                    elif action.type == ofp.OFPAT_GROUP:
+                        out_groups.append(action.group.group_id)
+        return out_ports, out_groups
+
+
+def _flow_id(flow):
+    # flows made by the decomposer have their id set, compute it otherwise
+    return flow.id or hash_flow_stats(flow)
+
+
+def _discard(index, key, flow_id):
+    flow_ids = index.get(key)
+    if flow_ids is not None:
+        flow_ids.discard(flow_id)
+        if not flow_ids:
+            del index[key]
+
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ overlap detection ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+def match_fields(match):
+    """
+    Return the OpenFlow basic fields of match as dict of field type to
+    (value, mask), with values and masks as integers and mask None if the
+    field is matched exactly. Other (experimenter) fields are left out, as
+    they cannot be told apart anyway.
+    """
+    fields = {}
+    for oxm_field in match.oxm_fields:
+        if oxm_field.oxm_class != ofp.OFPXMC_OPENFLOW_BASIC:
+            continue
+        field = oxm_field.ofb_field
+        which = field.WhichOneof('value')
+        value = 0 if which is None else _to_int(getattr(field, which))
+        mask = None
+        if field.has_mask:
+            which = field.WhichOneof('mask')
+            if which is not None:
+                mask = _to_int(getattr(field, which))
+                value &= mask
+        fields[field.type] = (value, mask)
+    return fields
+
+
+def _to_int(value):
+    if isinstance(value, basestring):
+        return int(hexlify(value), 16) if value else 0
+    return value
+
+
+def fields_overlap(fields1, fields2):
+    """
+    Tell if a packet may match both of the given match fields (as returned
+    by match_fields()), i.e., if all fields they have in common agree on
+    the bits both of them match on.
+    """
+    if len(fields1) > len(fields2):
+        fields1, fields2 = fields2, fields1
+    for field_type, (value1, mask1) in fields1.iteritems():
+        field2 = fields2.get(field_type)
+        if field2 is None:
+            continue
+        value2, mask2 = field2
+        diff = value1 ^ value2
+        if mask1 is not None:
+            diff &= mask1
+        if mask2 is not None:
+            diff &= mask2
+        if diff:
+            return False
+    return True
+
+
+class OverlapIndex(object):
+    """
+    Index of the match fields of flows, telling the flows that overlap with
+    a given one. Flows only overlap with flows of the same table and
+    priority, so flows are indexed per (table id, priority) bucket, see
+    _OverlapBucket.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # (table id, priority) -> _OverlapBucket
+
+    def add(self, flow):
+        key = (flow.table_id, flow.priority)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _OverlapBucket()
+        bucket.add(_flow_id(flow), match_fields(flow.match))
+
+    def remove(self, flow):
+        key = (flow.table_id, flow.priority)
+        bucket = self._buckets[key]
+        bucket.remove(_flow_id(flow))
+        if not bucket.fields:
+            del self._buckets[key]
+
+    def overlapping(self, flow, return_on_first=False):
+        """Return the ids of flows overlapping with flow (or flow-mod)"""
+        bucket = self._buckets.get((flow.table_id, flow.priority))
+        if bucket is None:
+            return []
+        fields = match_fields(flow.match)
+        overlapping = []
+        for flow_id in bucket.candidates(fields):
+            if fields_overlap(fields, bucket.fields[flow_id]):
+                overlapping.append(flow_id)
+                if return_on_first:
+                    break
+        return overlapping
+
+
+class _OverlapBucket(object):
+    """
+    The match fields of the flows of a table and priority. For each field
+    type any of them matches on, the flows are indexed by the value they
+    match exactly, or as matching it masked, or as not matching it at all.
+    The flows that may overlap with a match are found in those of the most
+    selective field of the match: the ones matching its value exactly, or
+    masked, or not matching the field at all.
+    """
+    __slots__ = ('fields', 'exact', 'masked', 'lacking')
+
+    def __init__(self):
+        self.fields = {}  # flow id -> match fields
+        self.exact = {}  # field type -> value -> set of flow ids
+        self.masked = {}  # field type -> set of flow ids
+        self.lacking = {}  # field type -> set of flow ids
+
+    def add(self, flow_id, fields):
+        for field_type in fields:
+            if field_type not in self.lacking:
+                # all flows so far lack this one
+                self.lacking[field_type] = set(self.fields)
+                self.exact[field_type] = {}
+                self.masked[field_type] = set()
+        for field_type, flow_ids in self.lacking.iteritems():
+            if field_type not in fields:
+                flow_ids.add(flow_id)
+        for field_type, (value, mask) in fields.iteritems():
+            if mask is None:
+                self.exact[field_type].setdefault(value, set()).add(flow_id)
+            else:
+                self.masked[field_type].add(flow_id)
+        self.fields[flow_id] = fields
+
+    def remove(self, flow_id):
+        fields = self.fields.pop(flow_id)
+        for field_type in self.lacking.keys():
+            if field_type not in fields:
+                self.lacking[field_type].discard(flow_id)
+                continue
+            value, mask = fields[field_type]
+            if mask is None:
+                _discard(self.exact[field_type], value, flow_id)
+            else:
+                self.masked[field_type].discard(flow_id)
+            if not self.exact[field_type] and not self.masked[field_type]:
+                # no flow matches on this field type any longer
+                del self.lacking[field_type]
+                del self.exact[field_type]
+                del self.masked[field_type]
+
+    def candidates(self, fields):
+        """Return ids of the flows that may overlap with fields"""
+        best = None
+        best_size = len(self.fields)
+        for field_type, (value, mask) in fields.iteritems():
+            lacking = self.lacking.get(field_type)
+            if lacking is None or mask is not None:
+                # no flow is told apart by this field, or all flows that
+                # match it exactly would need to be checked
+                continue
+            size = len(lacking) + len(self.masked[field_type]) + len(
+                self.exact[field_type].get(value, ()))
+            if size < best_size:
+                best, best_size = field_type, size
+        if best is None:
+            return self.fields.keys()
+        candidates = list(self.lacking[best])
+        candidates.extend(self.masked[best])
+        candidates.extend(self.exact[best].get(fields[best][0], ()))
+        return candidates
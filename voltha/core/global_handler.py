@@ -178,6 +178,28 @@ class GlobalHandler(VolthaGlobalServiceServicer):
             request,
             context)
 
+    @twisted_async
+    def UpdateLogicalDeviceFlowTableBulk(self, request, context):
+        log.info('grpc-request', id=request.id,
+                 flow_mods=len(request.flow_mods))
+
+        try:
+            instance_id = self.dispatcher.instance_id_by_logical_device_id(
+                request.id
+            )
+        except KeyError:
+            context.set_details(
+                'Logical device \'{}\' not found'.format(request.id))
+            context.set_code(StatusCode.NOT_FOUND)
+            return Empty()
+
+        return self.dispatcher.dispatch(
+            instance_id,
+            VolthaLocalServiceStub,
+            'UpdateLogicalDeviceFlowTableBulk',
+            request,
+            context)
+
     @twisted_async
     def ListLogicalDeviceFlowGroups(self, request, context):
         log.info('grpc-request', request=request)
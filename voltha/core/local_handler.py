@@ -64,24 +64,24 @@ class LocalHandler(VolthaLocalServiceServicer):
     def GetVolthaInstance(self, request, context):
         log.info('grpc-request', request=request)
         depth = int(dict(context.invocation_metadata()).get('get-depth', 0))
-        res = self.root.get('/', depth=depth)
+        res = self.root.get('/', depth=depth, readonly=True)
         return res
 
     @twisted_async
     def GetHealth(self, request, context):
         log.info('grpc-request', request=request)
-        return self.root.get('/health')
+        return self.root.get('/health', readonly=True)
 
     @twisted_async
     def ListAdapters(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/adapters')
+        items = self.root.get('/adapters', readonly=True)
         return Adapters(items=items)
 
     @twisted_async
     def ListLogicalDevices(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/logical_devices')
+        items = self.root.get('/logical_devices', readonly=True)
         return LogicalDevices(items=items)
 
     @twisted_async
@@ -97,7 +97,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return LogicalDevice()
 
         try:
-            return self.root.get('/logical_devices/' + request.id, depth=depth)
+            return self.root.get('/logical_devices/' + request.id,
+                                 depth=depth, readonly=True)
         except KeyError:
             context.set_details(
                 'Logical device \'{}\' not found'.format(request.id))
@@ -115,7 +116,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return LogicalPorts()
 
         try:
-            items = self.root.get('/logical_devices/{}/ports'.format(request.id))
+            items = self.root.get(
+                '/logical_devices/{}/ports'.format(request.id), readonly=True)
             return LogicalPorts(items=items)
         except KeyError:
             context.set_details(
@@ -134,7 +136,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Flows()
 
         try:
-            flows = self.root.get('/logical_devices/{}/flows'.format(request.id))
+            flows = self.root.get(
+                '/logical_devices/{}/flows'.format(request.id), readonly=True)
             return flows
         except KeyError:
             context.set_details(
@@ -163,6 +166,27 @@ class LocalHandler(VolthaLocalServiceServicer):
             context.set_code(StatusCode.NOT_FOUND)
             return Empty()
 
+    @twisted_async
+    def UpdateLogicalDeviceFlowTableBulk(self, request, context):
+        log.info('grpc-request', id=request.id,
+                 flow_mods=len(request.flow_mods))
+
+        if '/' in request.id:
+            context.set_details(
+                'Malformed logical device id \'{}\''.format(request.id))
+            context.set_code(StatusCode.INVALID_ARGUMENT)
+            return Empty()
+
+        try:
+            agent = self.core.get_logical_device_agent(request.id)
+            agent.update_flow_table_bulk(request.flow_mods)
+            return Empty()
+        except KeyError:
+            context.set_details(
+                'Logical device \'{}\' not found'.format(request.id))
+            context.set_code(StatusCode.NOT_FOUND)
+            return Empty()
+
     @twisted_async
     def ListLogicalDeviceFlowGroups(self, request, context):
         log.info('grpc-request', request=request)
@@ -175,7 +199,8 @@ class LocalHandler(VolthaLocalServiceServicer):
 
         try:
             groups = self.root.get(
-                '/logical_devices/{}/flow_groups'.format(request.id))
+                '/logical_devices/{}/flow_groups'.format(request.id),
+                readonly=True)
             return groups
         except KeyError:
             context.set_details(
@@ -206,7 +231,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     @twisted_async
     def ListDevices(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/devices')
+        items = self.root.get('/devices', readonly=True)
         return Devices(items=items)
 
     @twisted_async
@@ -222,7 +247,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Device()
 
         try:
-            return self.root.get('/devices/' + request.id, depth=depth)
+            return self.root.get('/devices/' + request.id, depth=depth,
+                                 readonly=True)
         except KeyError:
             context.set_details(
                 'Device \'{}\' not found'.format(request.id))
@@ -299,7 +325,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Ports()
 
         try:
-            items = self.root.get('/devices/{}/ports'.format(request.id))
+            items = self.root.get(
+                '/devices/{}/ports'.format(request.id), readonly=True)
             return Ports(items=items)
         except KeyError:
             context.set_details(
@@ -319,7 +346,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return Flows()
 
         try:
-            flows = self.root.get('/devices/{}/flows'.format(request.id))
+            flows = self.root.get(
+                '/devices/{}/flows'.format(request.id), readonly=True)
             return flows
         except KeyError:
             context.set_details(
@@ -339,7 +367,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return FlowGroups()
 
         try:
-            groups = self.root.get('/devices/{}/flow_groups'.format(request.id))
+            groups = self.root.get(
+                '/devices/{}/flow_groups'.format(request.id), readonly=True)
             return groups
         except KeyError:
             context.set_details(
@@ -350,7 +379,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     @twisted_async
     def ListDeviceTypes(self, request, context):
         log.info('grpc-request', request=request)
-        items = self.root.get('/device_types')
+        items = self.root.get('/device_types', readonly=True)
         return DeviceTypes(items=items)
 
     @twisted_async
@@ -366,7 +395,8 @@ class LocalHandler(VolthaLocalServiceServicer):
             return DeviceType()
 
         try:
-            return self.root.get('/device_types/' + request.id, depth=depth)
+            return self.root.get('/device_types/' + request.id, depth=depth,
+                                 readonly=True)
         except KeyError:
             context.set_details(
                 'Device type \'{}\' not found'.format(request.id))
@@ -377,7 +407,7 @@ class LocalHandler(VolthaLocalServiceServicer):
     def ListDeviceGroups(self, request, context):
         log.info('grpc-request', request=request)
         # TODO is this mapped to tree or taken from coordinator?
-        items = self.root.get('/device_groups')
+        items = self.root.get('/device_groups', readonly=True)
         return DeviceGroups(items=items)
 
     @twisted_async
@@ -394,7 +424,8 @@ class LocalHandler(VolthaLocalServiceServicer):
 
         # TODO is this mapped to tree or taken from coordinator?
         try:
-            return self.root.get('/device_groups/' + request.id, depth=depth)
+            return self.root.get('/device_groups/' + request.id, depth=depth,
+                                 readonly=True)
         except KeyError:
             context.set_details(
                 'Device group \'{}\' not found'.format(request.id))
@@ -29,6 +29,7 @@ from voltha.core.flow_decomposer import FlowDecomposer, \
     flow_stats_entry_from_flow_mod_message, group_entry_from_group_mod, \
     mk_flow_stat, in_port, vlan_vid, vlan_pcp, pop_vlan, output, set_field, \
     push_vlan
+from voltha.core.flow_table import FlowTable
 from voltha.protos import third_party
 from voltha.protos import openflow_13_pb2 as ofp
 from voltha.protos.device_pb2 import Port
@@ -72,7 +73,13 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
         self.log = structlog.get_logger(logical_device_id=logical_device.id)
 
+        self._graph = None
         self._routes = None
+        self._decomposition = None
+        self._flow_table = None  # indexed copy of the flows, see flow_table()
+        self._writing_flows = False  # see _write_flow_table()
+        self._batching = False  # writes deferred, see update_flow_table_bulk
+        self._batch_changed = False
 
     def start(self):
         self.log.debug('starting')
@@ -131,6 +138,28 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             self.log.warn('unhandled-flow-mod',
                           command=command, flow_mod=flow_mod)
 
+    def update_flow_table_bulk(self, flow_mods):
+        """
+        Apply the flow_mods in order, as with update_flow_table(), but
+        write the flow table to the model once, so that it changes in a
+        single revision and its flows are decomposed once. A flow-mod that
+        fails is reported and skipped, without affecting the others.
+        """
+        self._batching = True
+        self._batch_changed = False
+        try:
+            for flow_mod in flow_mods:
+                try:
+                    self.update_flow_table(flow_mod)
+                except Exception, e:
+                    self.log.exception('flow-mod-failed', e=e,
+                                       flow_mod=flow_mod)
+                    self.signal_flow_mod_error(ofp.OFPFMFC_UNKNOWN, flow_mod)
+        finally:
+            self._batching = False
+            if self._batch_changed:
+                self._write_flow_table()
+
     def update_group_table(self, group_mod):
 
         command = group_mod.command
@@ -150,12 +179,33 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
     # ~~~~~~~~~~~~~~~~~~~~~~~~~ LOW LEVEL FLOW HANDLERS ~~~~~~~~~~~~~~~~~~~~~~~
 
+    def flow_table(self):
+        """
+        Return the indexed flow table, which is (re)built from the model
+        unless it holds the flows last written by us
+        """
+        if self._flow_table is None:
+            self._flow_table = FlowTable(self.flows_proxy.get('/').items)
+        return self._flow_table
+
+    def _write_flow_table(self):
+        if self._batching:
+            self._batch_changed = True
+            return
+        # the flow table updates announced while writing are ours, the
+        # config tree announcing them before the update returns
+        self._writing_flows = True
+        try:
+            self.flows_proxy.update('/', self._flow_table.to_message())
+        finally:
+            self._writing_flows = False
+
     def flow_add(self, mod):
         assert isinstance(mod, ofp.ofp_flow_mod)
         assert mod.cookie_mask == 0
 
         # read from model
-        flows = list(self.flows_proxy.get('/').items)
+        flows = self.flow_table()
 
         changed = False
         check_overlap = mod.flags & ofp.OFPFF_CHECK_OVERLAP
@@ -166,52 +216,45 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
             else:
                 # free to add as new flow
                 flow = flow_stats_entry_from_flow_mod_message(mod)
-                flows.append(flow)
+                flows.add(flow)
                 changed = True
                 self.log.debug('flow-added', flow=mod)
 
         else:
             flow = flow_stats_entry_from_flow_mod_message(mod)
-            idx = self.find_flow(flows, flow)
-            if idx >= 0:
-                old_flow = flows[idx]
+            old_flow = flows.find(flow)
+            if old_flow is not None:
                 if not (mod.flags & ofp.OFPFF_RESET_COUNTS):
                     flow.byte_count = old_flow.byte_count
                     flow.packet_count = old_flow.packet_count
-                flows[idx] = flow
+                flows.add(flow)
                 changed = True
                 self.log.debug('flow-updated', flow=flow)
 
             else:
-                flows.append(flow)
+                flows.add(flow)
                 changed = True
                 self.log.debug('flow-added', flow=mod)
 
         # write back to model
         if changed:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flow_table()
 
     def flow_delete(self, mod):
         assert isinstance(mod, ofp.ofp_flow_mod)
 
         # read from model
-        flows = list(self.flows_proxy.get('/').items)
+        flows = self.flow_table()
 
-        # build a list of what to keep vs what to delete
-        to_keep = []
-        to_delete = []
-        for f in flows:
-            if self.flow_matches_spec(f, mod):
-                to_delete.append(f)
-            else:
-                to_keep.append(f)
-
-        # replace flow table with keepers
-        flows = to_keep
+        # the indexes tell which flows may be covered by the spec
+        to_delete = [f for f in flows.candidates(mod)
+                     if self.flow_matches_spec(f, mod)]
+        for f in to_delete:
+            flows.remove(f)
 
         # write back
         if to_delete:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flow_table()
 
         # send notifications for discarded flow as required by OpenFlow
         self.announce_flows_deleted(to_delete)
@@ -220,20 +263,18 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         assert isinstance(mod, ofp.ofp_flow_mod)
 
         # read from model
-        flows = list(self.flows_proxy.get('/').items)
+        flows = self.flow_table()
         changed = False
 
         flow = flow_stats_entry_from_flow_mod_message(mod)
-        idx = self.find_flow(flows, flow)
-        if (idx >= 0):
-            del flows[idx]
+        if flows.remove(flow) is not None:
             changed = True
         else:
             # TODO need to check what to do with this case
             self.log.warn('flow-cannot-delete', flow=flow)
 
         if changed:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flow_table()
 
     def flow_modify(self, mod):
         raise NotImplementedError()
@@ -246,14 +287,22 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         Return list of overlapping flow(s)
         Two flows overlap if a packet may match both and if they have the
         same priority.
+        :param flows: FlowTable of the logical device
         :param mod: Flow request
         :param return_on_first: if True, return with the first entry
-        :return:
+        :return: overlapping flows, in table order
         """
-        return []  # TODO finish implementation
+        return flows.overlapping(mod, return_on_first)
 
     @classmethod
     def find_flow(cls, flows, flow):
+        flow_id = flow.id
+        if flow_id:
+            # see flow_match()
+            for i, f in enumerate(flows):
+                if f.id == flow_id or not f.id and cls.flow_match(f, flow):
+                    return i
+            return -1
         for i, f in enumerate(flows):
             if cls.flow_match(f, flow):
                 return i
@@ -261,6 +310,10 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
     @staticmethod
     def flow_match(f1, f2):
+        # the ids hash exactly the keys that matter, see hash_flow_stats(),
+        # so comparing them spares serializing and comparing the matches
+        if f1.id and f2.id:
+            return f1.id == f2.id
         keys_matter = ('table_id', 'priority', 'flags', 'cookie', 'match')
         for key in keys_matter:
             if getattr(f1, key) != getattr(f2, key):
@@ -356,24 +409,18 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
     def flows_delete_by_group_id(self, flows, group_id):
         """
         Delete any flow(s) referring to given group_id
+        :param flows: FlowTable
         :param group_id:
-        :return: None
+        :return: whether any flow was deleted
         """
-        to_keep = []
-        to_delete = []
-        for f in flows:
-            if self.flow_has_out_group(f, group_id):
-                to_delete.append(f)
-            else:
-                to_keep.append(f)
-
-        # replace flow table with keepers
-        flows = to_keep
+        to_delete = flows.with_out_group(group_id)
+        for f in to_delete:
+            flows.remove(f)
 
         # send notification to deleted ones
         self.announce_flows_deleted(to_delete)
 
-        return bool(to_delete), flows
+        return bool(to_delete)
 
     # ~~~~~~~~~~~~~~~~~~~~~ LOW LEVEL GROUP HANDLERS ~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -416,9 +463,8 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
                 pass
 
             else:
-                flows = list(self.flows_proxy.get('/').items)
-                flows_changed, flows = self.flows_delete_by_group_id(
-                    flows, group_id)
+                flows_changed = self.flows_delete_by_group_id(
+                    self.flow_table(), group_id)
                 del groups[group_id]
                 groups_changed = True
                 self.log.debug('group-deleted', group_id=group_id)
@@ -426,7 +472,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         if groups_changed:
             self.groups_proxy.update('/', FlowGroups(items=groups.values()))
         if flows_changed:
-            self.flows_proxy.update('/', Flows(items=flows))
+            self._write_flow_table()
 
     def group_modify(self, group_mod):
         assert isinstance(group_mod, ofp.ofp_group_mod)
@@ -486,8 +532,14 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
     # ~~~~~~~~~~~~~~~~~~~~~ FLOW TABLE UPDATE HANDLING ~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _flow_table_updated(self, flows):
+        # rendering the whole table would take longer than decomposing it
         self.log.debug('flow-table-updated',
-                  logical_device_id=self.logical_device_id, flows=flows)
+                  logical_device_id=self.logical_device_id,
+                  flow_count=len(flows.items))
+
+        if not self._writing_flows:
+            # not changed by us, the index is to be rebuilt
+            self._flow_table = None
 
         # TODO we have to evolve this into a policy-based, event based pattern
         # This is a raw implementation of the specific use-case with certain
@@ -495,23 +547,25 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         # based refinement will be introduced that later.
 
         groups = self.groups_proxy.get('/').items
-        device_rules_map = self.decompose_rules(flows.items, groups)
-        for device_id, (flows, groups) in device_rules_map.iteritems():
-            self.root_proxy.update('/devices/{}/flows'.format(device_id),
-                                   Flows(items=flows.values()))
-            self.root_proxy.update('/devices/{}/flow_groups'.format(device_id),
-                                   FlowGroups(items=groups.values()))
+        device_rules_map = self.decompose_rules_incrementally(
+            flows.items, groups)
+        self._update_device_rules(device_rules_map)
 
     # ~~~~~~~~~~~~~~~~~~~~ GROUP TABLE UPDATE HANDLING ~~~~~~~~~~~~~~~~~~~~~~~~
 
     def _group_table_updated(self, flow_groups):
         self.log.debug('group-table-updated',
                   logical_device_id=self.logical_device_id,
-                  flow_groups=flow_groups)
+                  group_count=len(flow_groups.items))
 
         flows = self.flows_proxy.get('/').items
-        device_flows_map = self.decompose_rules(flows, flow_groups.items)
-        for device_id, (flows, groups) in device_flows_map.iteritems():
+        device_rules_map = self.decompose_rules_incrementally(
+            flows, flow_groups.items)
+        self._update_device_rules(device_rules_map)
+
+    def _update_device_rules(self, device_rules_map):
+        # holds the devices whose rules changed only
+        for device_id, (flows, groups) in device_rules_map.iteritems():
             self.root_proxy.update('/devices/{}/flows'.format(device_id),
                                    Flows(items=flows.values()))
             self.root_proxy.update('/devices/{}/flow_groups'.format(device_id),
@@ -521,7 +575,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
     def _port_added(self, port):
         assert isinstance(port, LogicalPort)
-        self._port_list_updated(port)
+        self._update_cached_tables(port, added=True)
         self.local_handler.send_port_change_event(
             device_id=self.logical_device_id,
             port_status=ofp.ofp_port_status(
@@ -532,7 +586,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
     def _port_removed(self, port):
         assert isinstance(port, LogicalPort)
-        self._port_list_updated(port)
+        self._update_cached_tables(port, added=False)
         self.local_handler.send_port_change_event(
             device_id=self.logical_device_id,
             port_status=ofp.ofp_port_status(
@@ -557,6 +611,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         self._invalidate_cached_tables()
 
     def _invalidate_cached_tables(self):
+        self._graph = None
         self._routes = None
         self._default_rules = None
         self._nni_logical_port_no = None
@@ -564,15 +619,51 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
     def _assure_cached_tables_up_to_date(self):
         if self._routes is None:
             logical_ports = self.self_proxy.get('/ports')
-            graph, self._routes = self.compute_routes(
+            self._graph, self._routes = self.compute_routes(
                 self.root_proxy, logical_ports)
-            self._default_rules = self._generate_default_rules(graph)
+            self._default_rules = self._generate_default_rules(self._graph)
             root_ports = [p for p in logical_ports if p.root_port]
             assert len(root_ports) == 1
             self._nni_logical_port_no = root_ports[0].ofp_port.port_no
 
+    def _update_cached_tables(self, port, added):
+        """
+        Patch the graph, route table and default rules for a logical port
+        added or removed. Only the routes from and to the port change,
+        unless it is the root port, which all routes lead to.
+        """
+        if self._routes is None:
+            return  # computed when first needed
+        if port.root_port or not added and \
+                not self._device_exists(port.device_id):
+            # all routes change, or devices may have gone with the port
+            self._invalidate_cached_tables()
+            return
+
+        default_rules = dict(self._default_rules)
+        if added:
+            devices_added = self.add_boundary_port(
+                self.root_proxy, self._graph, self._routes, port)
+            if devices_added is None:
+                # ports were added to devices since the graph was built
+                self._invalidate_cached_tables()
+                return
+            default_rules.update(
+                self._generate_default_rules(self._graph, devices_added))
+        else:
+            self.remove_boundary_port(self._graph, self._routes, port)
+
+        # a new default rules object tells the decomposer that routes changed
+        self._default_rules = default_rules
+
+    def _device_exists(self, device_id):
+        try:
+            self.root_proxy.get('/devices/{}'.format(device_id))
+            return True
+        except KeyError:
+            return False
 
-    def _generate_default_rules(self, graph):
+    def _generate_default_rules(self, graph, device_ids=None):
 
         def root_device_default_rules(device):
             ports = self.root_proxy.get('/devices/{}/ports'.format(device.id))
@@ -653,7 +744,7 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
 
         root_device_id = self.self_proxy.get('/').root_device_id
         rules = {}
-        for node_key in graph.nodes():
+        for node_key in graph.nodes() if device_ids is None else device_ids:
             node = graph.node[node_key]
             device = node.get('device', None)
             if device is None:
@@ -677,20 +768,20 @@ class LogicalDeviceAgent(FlowDecomposer, DeviceGraph):
         # hop is filled, the first hope is None
         if ingress_port_no is None and \
                         egress_port_no == self._nni_logical_port_no:
-            # We can use the 2nd hop of any upstream route, so just find the
-            # first upstream:
-            for (ingress, egress), route in self._routes.iteritems():
-                if egress == self._nni_logical_port_no:
-                    return [None, route[1]]
-            raise Exception('not a single upstream route')
+            # We can use the 2nd hop of any upstream route, as indexed by
+            # the route table
+            route = self._routes.any_to(self._nni_logical_port_no)
+            if route is None:
+                raise Exception('not a single upstream route')
+            return [None, route[1]]
 
         # If egress_port is not specified (None), we can also can return a
         # "half" route
         if egress_port_no is None:
-            for (ingress, egress), route in self._routes.iteritems():
-                if ingress == ingress_port_no:
-                    return [route[0], None]
-            raise Exception('not a single downstream route')
+            route = self._routes.any_from(ingress_port_no)
+            if route is None:
+                raise Exception('not a single downstream route')
+            return [route[0], None]
 
         return self._routes.get((ingress_port_no, egress_port_no))
 
@@ -309,7 +309,7 @@ class Main(object):
 
             yield registry.register(
                 'frameio',
-                FrameIOManager()
+                FrameIOManager(config=self.config.get('frameio', {}))
             ).start()
 
             yield registry.register(
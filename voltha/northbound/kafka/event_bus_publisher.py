@@ -25,7 +25,7 @@ from google.protobuf.json_format import MessageToDict
 from google.protobuf.message import Message
 from simplejson import dumps
 
-from common.event_bus import EventBusClient
+from common.event_bus import EventBusClient, BLOCK
 
 log = structlog.get_logger()
 
@@ -60,11 +60,15 @@ class EventBusPublisher(object):
                           mapping=mapping)
                 continue
 
+            # forwarded asynchronously, not to encode and send messages
+            # on the stack of their publisher
             self.event_bus.subscribe(
                 event_bus_topic,
                 # to avoid Python late-binding to the last registered
                 # kafka_topic, we force instant binding with the default arg
-                lambda _, m, k=kafka_topic: self.forward(k, m))
+                lambda _, m, k=kafka_topic: self.forward(k, m),
+                queue_size=mapping.get('queue_size', 1000),
+                policy=mapping.get('queue_policy', BLOCK))
 
             log.info('event-to-kafka', kafka_topic=kafka_topic,
                      event_bus_topic=event_bus_topic)